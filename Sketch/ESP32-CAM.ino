@@ -9,6 +9,7 @@
 const char* ssid = "XXX";
 const char* password = "XXX";
 const char* gist_url = "XXX";
+const char* device_id = "trap-1";  // ID unik per trap (topic MQTT /pest/<device_id>)
 
 // ===========================
 // Kamera (AI Thinker)
@@ -47,6 +48,22 @@ String server_url = "";
 String logBuffer = "";
 AsyncWebServer server(80);
 
+// ===========================
+// MJPEG Stream (GET /stream)
+// ===========================
+// kalyol.py --stream trap-1=http://<ip>/stream membaca frame langsung dari sini;
+// selama ada client stream, upload HTTP per frame dilewati
+#define PART_BOUNDARY "frame"
+static const char* STREAM_CONTENT_TYPE = "multipart/x-mixed-replace;boundary=" PART_BOUNDARY;
+static const char* STREAM_PART = "\r\n--" PART_BOUNDARY "\r\nContent-Type: image/jpeg\r\nContent-Length: %u\r\n\r\n";
+
+volatile bool streamActive = false;
+camera_fb_t* streamFb = NULL;
+char streamHeader[96];
+size_t streamHeaderLen = 0;
+size_t streamHeaderSent = 0;
+size_t streamSent = 0;
+
 // ===========================
 // Fungsi logging
 // ===========================
@@ -95,6 +112,7 @@ void uploadPhoto(String server_url, const uint8_t* img, size_t len) {
   HTTPClient http;
   http.begin(endpoint);
   http.addHeader("Content-Type", "image/jpeg");
+  http.addHeader("X-Device-ID", device_id);
 
   int code = http.POST((uint8_t*)img, len);
 
@@ -192,6 +210,56 @@ void setupWebServer() {
     request->send(200, "text/html", html);
   });
 
+  server.on("/stream", HTTP_GET, [](AsyncWebServerRequest *request) {
+    if (streamActive) {
+      request->send(503, "text/plain", "stream busy");
+      return;
+    }
+    streamActive = true;
+    streamFb = NULL;
+    addLog("🎥 Stream client terhubung");
+
+    // Chunked response: tiap callback mengisi buffer dengan header part + potongan JPEG
+    AsyncWebServerResponse *response = request->beginChunkedResponse(STREAM_CONTENT_TYPE,
+      [](uint8_t *buffer, size_t maxLen, size_t index) -> size_t {
+        if (!streamFb) {
+          streamFb = esp_camera_fb_get();
+          if (!streamFb) return RESPONSE_TRY_AGAIN;
+          streamHeaderLen = snprintf(streamHeader, sizeof(streamHeader), STREAM_PART, streamFb->len);
+          streamHeaderSent = 0;
+          streamSent = 0;
+        }
+
+        size_t written = 0;
+        if (streamHeaderSent < streamHeaderLen) {
+          size_t n = min(maxLen, streamHeaderLen - streamHeaderSent);
+          memcpy(buffer, streamHeader + streamHeaderSent, n);
+          streamHeaderSent += n;
+          written += n;
+        }
+        if (written < maxLen && streamSent < streamFb->len) {
+          size_t n = min(maxLen - written, streamFb->len - streamSent);
+          memcpy(buffer + written, streamFb->buf + streamSent, n);
+          streamSent += n;
+          written += n;
+        }
+        if (streamSent >= streamFb->len) {
+          esp_camera_fb_return(streamFb);
+          streamFb = NULL;
+        }
+        return written;
+      });
+    request->onDisconnect([]() {
+      if (streamFb) {
+        esp_camera_fb_return(streamFb);
+        streamFb = NULL;
+      }
+      streamActive = false;
+      addLog("🎥 Stream client terputus");
+    });
+    request->send(response);
+  });
+
   server.begin();
   addLog("🌍 WebServer aktif di http://" + WiFi.localIP().toString());
 }
@@ -240,6 +308,12 @@ void loop() {
       break;
 
     case STATE_CAPTURE: {
+      if (streamActive) {
+        // Frame sudah dikirim lewat /stream, tidak perlu POST terpisah
+        stateTimer = millis();
+        currentState = STATE_WAIT;
+        break;
+      }
       addLog("📸 Mengambil foto...");
       camera_fb_t *fb = esp_camera_fb_get();
       if (!fb) {
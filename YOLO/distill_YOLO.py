@@ -0,0 +1,209 @@
+"""Knowledge distillation: model yolo11x_pherotrap (teacher) mengajari student nano/small.
+
+Student dilatih dengan loss YOLO biasa ditambah dua term distilasi per anchor
+(teacher dan student punya stride dan reg_max yang sama):
+  - klasifikasi: BCE antara logit student dan probabilitas teacher (suhu T)
+  - lokalisasi: KL divergence distribusi DFL box, hanya di anchor yang
+    dianggap objek oleh teacher
+Checkpoint hasil (weights/best.pt) adalah checkpoint Ultralytics biasa, jadi bisa
+langsung dipakai sebagai Config.MODEL_PATH di kalyol.py. Setelah training, teacher
+dan student dibandingkan lewat EnhancedDetectionManager (latency dan count error
+di split valid/test, sama dengan benchmark.py).
+
+Contoh:
+    python distill_YOLO.py --student yolo11n.pt --epochs 100
+    python distill_YOLO.py --report-only --student runs/distill/yolo11n_pherotrap/weights/best.pt
+"""
+import argparse
+import copy
+import json
+import sys
+from pathlib import Path
+
+import torch
+import torch.nn.functional as F
+from ultralytics import YOLO
+from ultralytics.utils.loss import v8DetectionLoss
+
+from train_cache import CachedDetectionTrainer
+
+ROOT = Path(__file__).resolve().parent
+DATA = ROOT / "datasets" / "PHEROTRAP" / "data.yaml"
+
+
+def find_teacher():
+    """best.pt terbaru dari runs/detect/yolo11x_pherotrap*"""
+    candidates = sorted(ROOT.glob("runs/detect/yolo11x_pherotrap*/weights/best.pt"), key=lambda p: p.stat().st_mtime)
+    return str(candidates[-1]) if candidates else None
+
+
+def split_head(feats, nc, reg_max):
+    """Output Detect head (list per stride) -> (distribusi box (B,4,reg_max,A), logit kelas (B,nc,A))"""
+    feats = feats[1] if isinstance(feats, tuple) else feats
+    b = feats[0].shape[0]
+    distri, scores = torch.cat([x.view(b, nc + reg_max * 4, -1) for x in feats], 2).split((reg_max * 4, nc), 1)
+    return distri.view(b, 4, reg_max, -1), scores
+
+
+class DistillationLoss:
+    """v8DetectionLoss + distilasi logit kelas dan distribusi box dari teacher"""
+    def __init__(self, model, teacher, alpha=1.0, temperature=2.0, fg_threshold=0.25):
+        self.base = v8DetectionLoss(model)
+        self.teacher = teacher
+        self.alpha = alpha
+        self.temperature = temperature
+        self.fg_threshold = fg_threshold
+
+    def __call__(self, preds, batch):
+        """(loss, items): items = box, cls, dfl, kd_cls, kd_box"""
+        loss, items = self.base(preds, batch)
+        with torch.no_grad():
+            teacher_preds = self.teacher(batch["img"])
+        nc, reg_max = self.base.nc, self.base.reg_max
+        s_distri, s_scores = split_head(preds, nc, reg_max)
+        t_distri, t_scores = split_head(teacher_preds, nc, reg_max)
+        T = self.temperature
+
+        # Klasifikasi: dinormalisasi dengan total skor teacher (seperti target_scores_sum)
+        t_prob = (t_scores / T).sigmoid()
+        cls_kd = F.binary_cross_entropy_with_logits(s_scores / T, t_prob, reduction="sum") / max(t_prob.sum(), 1)
+
+        # Lokalisasi: KL per sisi box, hanya anchor foreground menurut teacher
+        fg = t_scores.sigmoid().amax(1) > self.fg_threshold  # (B, A)
+        kl = F.kl_div(
+            F.log_softmax(s_distri / T, 2), F.softmax(t_distri / T, 2), reduction="none"
+        ).sum(2).mean(1)  # (B, A)
+        box_kd = (kl * fg).sum() / max(fg.sum(), 1) * T * T
+
+        batch_size = s_scores.shape[0]
+        kd = torch.stack([cls_kd, box_kd])
+        items = torch.cat([items, kd.detach()])
+        kd = self.alpha * kd * batch_size
+        if loss.ndim:
+            # Versi Ultralytics yang mengembalikan vektor (box, cls, dfl) lalu di-.sum() trainer:
+            # term KD jadi komponen tambahan, bukan skalar yang ikut ter-broadcast ke tiap komponen
+            return torch.cat([loss, kd]), items
+        return loss + kd.sum(), items
+
+
+class DistillationTrainer(CachedDetectionTrainer):
+    """CachedDetectionTrainer dengan teacher; diatur lewat atribut kelas sebelum model.train()"""
+    TEACHER = None
+    ALPHA = 1.0
+    TEMPERATURE = 2.0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Dipasang setelah EMA dibuat agar teacher tidak ikut tersimpan di checkpoint
+        self.add_callback("on_train_start", self._attach_teacher)
+
+    def get_validator(self):
+        validator = super().get_validator()
+        self.loss_names = (*self.loss_names, "kd_cls", "kd_box")
+        return validator
+
+    def label_loss_items(self, loss_items=None, prefix="train"):
+        # Validasi memakai EMA tanpa teacher: hanya box/cls/dfl
+        names = self.loss_names if prefix == "train" else self.loss_names[:3]
+        keys = [f"{prefix}/{x}" for x in names]
+        if loss_items is None:
+            return keys
+        return dict(zip(keys, [round(float(x), 5) for x in loss_items]))
+
+    def validate(self):
+        # DetectionValidator menyiapkan buffer loss seukuran trainer.loss_items (5), sedangkan
+        # model EMA yang divalidasi memakai v8DetectionLoss biasa (3 item)
+        items, self.loss_items = self.loss_items, self.loss_items[:3]
+        try:
+            return super().validate()
+        finally:
+            self.loss_items = items
+
+    def _attach_teacher(self, trainer):
+        teacher = YOLO(self.TEACHER).model.to(self.device).float().eval()
+        for p in teacher.parameters():
+            p.requires_grad_(False)
+        student_head, teacher_head = self.model.model[-1], teacher.model[-1]
+        if (student_head.nc, student_head.reg_max) != (teacher_head.nc, teacher_head.reg_max):
+            raise ValueError("Teacher dan student harus punya nc dan reg_max yang sama")
+        self.model.criterion = DistillationLoss(self.model, teacher, self.ALPHA, self.TEMPERATURE)
+        print(f"🎓 Teacher: {self.TEACHER} (alpha={self.ALPHA}, T={self.TEMPERATURE})")
+
+
+def report(models, output=None):
+    """Latency dan count error tiap model lewat EnhancedDetectionManager (seperti benchmark.py)"""
+    sys.path.insert(0, str(ROOT.parent))
+    from benchmark import load_split, run_mode
+    from kalyol import Config, EnhancedDetectionManager
+
+    samples = [s for split in ("valid", "test") for s in load_split(split)]
+    config = Config()
+    config.LOG_PREPROCESS_TIMING = False
+    config.METRICS_DUMP_PATH = None
+    config.RESULT_CACHE_SIZE = 0
+
+    results = {}
+    for role, path in models.items():
+        detector = EnhancedDetectionManager(path, copy.copy(config))
+        results[role] = {"model": path, **run_mode(detector, samples, {}, warmup=2)}
+        detector.engine.shutdown()
+
+    print(f"\n{'':>8}{'p50 ms':>9}{'p95 ms':>9}{'fps':>7}{'MAE':>7}{'bias':>7}{'RSS MB':>8}")
+    for role, r in results.items():
+        print(f"{role:>8}{r['latency_ms_p50']:>9.0f}{r['latency_ms_p95']:>9.0f}{r['fps']:>7.2f}"
+              f"{r['count_mae']:>7.2f}{r['count_bias']:>+7.2f}{r['peak_rss_mb']:>8.0f}")
+    if "teacher" in results and "student" in results:
+        t, s = results["teacher"], results["student"]
+        print(f"Student: {t['latency_ms_p50'] / s['latency_ms_p50']:.1f}x lebih cepat, "
+              f"count MAE {s['count_mae'] - t['count_mae']:+.2f} vs teacher")
+    if output:
+        Path(output).write_text(json.dumps(results, indent=2))
+        print(f"Saved: {output}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--teacher", default=find_teacher(), help="Default: runs/detect/yolo11x_pherotrap* terbaru")
+    parser.add_argument("--student", default="yolo11n.pt", help="yolo11n.pt / yolo11s.pt (atau weights untuk --report-only)")
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--alpha", type=float, default=1.0, help="Bobot loss distilasi")
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--device", default=0 if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--report-only", action="store_true", help="Lewati training, bandingkan saja")
+    parser.add_argument("--report", default="distill_report.json")
+    args = parser.parse_args()
+
+    if not args.teacher:
+        parser.error("Teacher tidak ditemukan di runs/detect/yolo11x_pherotrap*/weights, pakai --teacher")
+
+    student = args.student
+    if not args.report_only:
+        DistillationTrainer.TEACHER = args.teacher
+        DistillationTrainer.ALPHA = args.alpha
+        DistillationTrainer.TEMPERATURE = args.temperature
+        name = f"{Path(args.student).stem}_pherotrap"
+        model = YOLO(args.student)
+        model.train(
+            trainer=DistillationTrainer,
+            data=str(DATA),
+            epochs=args.epochs,
+            imgsz=args.imgsz,
+            batch=args.batch,
+            workers=args.workers,
+            device=args.device,
+            project=str(ROOT / "runs" / "distill"),
+            name=name,
+            exist_ok=True,
+        )
+        student = str(ROOT / "runs" / "distill" / name / "weights" / "best.pt")
+        print(f"\n✅ Student: {student}")
+
+    report({"teacher": args.teacher, "student": student}, args.report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""Pre-decoded, memory-mapped image cache for YOLO training.
+
+Setiap gambar dataset di-decode dan di-resize (sisi panjang = imgsz, sama dengan
+BaseDataset.load_image) satu kali ke satu file .npy yang di-memmap, di samping
+labels.cache milik Ultralytics. Epoch berikutnya (dan retrain setelah foto trap
+baru ditambahkan) cukup membaca array dari page cache; hanya gambar baru atau
+yang berubah yang di-decode ulang. Dataset aman dipakai DataLoader multi-proses
+karena memmap dibuka ulang di tiap worker, bukan ikut di-pickle.
+
+Contoh:
+    python train_cache.py datasets/PHEROTRAP/data.yaml --imgsz 640
+    python train_cache.py datasets/PHEROTRAP/data.yaml --smoke 32   # + cek mosaic
+"""
+import argparse
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.data.utils import img2label_paths
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils import LOGGER, colorstr
+
+CACHE_VERSION = 2
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def file_key(path):
+    """Gambar dianggap sama jika path, ukuran, dan mtime sama"""
+    st = os.stat(path)
+    return f"{path}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def load_resized(path, imgsz):
+    """Decode + resize sisi panjang ke imgsz (sama dengan BaseDataset.load_image rect_mode)"""
+    im = cv2.imread(str(path))
+    if im is None:
+        raise FileNotFoundError(f"Image Not Found {path}")
+    h0, w0 = im.shape[:2]
+    r = imgsz / max(h0, w0)
+    if r != 1:
+        w, h = min(math.ceil(w0 * r), imgsz), min(math.ceil(h0 * r), imgsz)
+        im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+    return im, (h0, w0)
+
+
+class ImageCache:
+    """Satu file .npy (N, imgsz, imgsz, 3) uint8 + metadata JSON (shape asli/resize per gambar)"""
+    def __init__(self, path, im_files, imgsz, workers=None):
+        self.path = Path(path)
+        self.meta_path = self.path.with_suffix(".json")
+        self.im_files = [str(f) for f in im_files]
+        self.imgsz = imgsz
+        self._array = None
+        self._pid = None
+        self.shapes = self._load_or_build(workers or min(8, os.cpu_count() or 1))
+
+    def _load_or_build(self, workers):
+        keys = [file_key(f) for f in self.im_files]
+        old = self._read_meta()
+        if old is not None and old["keys"] == keys:
+            return np.array(old["shapes"], dtype=np.int32)
+
+        # Baris lama dipakai ulang untuk gambar yang tidak berubah; hanya sisanya di-decode
+        reuse = {}
+        if old is not None and self.path.exists():
+            reuse = {key: (row, shape) for row, (key, shape) in enumerate(zip(old["keys"], old["shapes"]))}
+            previous = np.load(self.path, mmap_mode="r")
+        todo = [i for i, key in enumerate(keys) if key not in reuse]
+        LOGGER.info(f"{colorstr('cache: ')}{self.path.name}: decoding {len(todo)} images, "
+                    f"reusing {len(keys) - len(todo)}")
+
+        tmp = self.path.with_suffix(".tmp.npy")
+        array = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.uint8,
+                                          shape=(len(keys), self.imgsz, self.imgsz, 3))
+        shapes = np.zeros((len(keys), 4), dtype=np.int32)  # h0, w0, h, w
+        for i, key in enumerate(keys):
+            if key in reuse:
+                row, shape = reuse[key]
+                h, w = shape[2], shape[3]
+                array[i, :h, :w] = previous[row, :h, :w]
+                shapes[i] = shape
+
+        def fill(i):
+            im, (h0, w0) = load_resized(self.im_files[i], self.imgsz)
+            h, w = im.shape[:2]
+            array[i, :h, :w] = im
+            shapes[i] = (h0, w0, h, w)
+
+        # cv2.imread/resize melepas GIL, jadi thread cukup untuk decode paralel
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(fill, todo))
+        array.flush()
+        del array
+        if reuse:
+            del previous
+        # Metadata = penanda commit: dihapus sebelum array diganti dan baru ditulis (atomik)
+        # setelah array lengkap, jadi crash di tengah hanya berarti rebuild, bukan baris salah
+        self.meta_path.unlink(missing_ok=True)
+        os.replace(tmp, self.path)
+        meta_tmp = self.meta_path.with_suffix(".tmp.json")
+        meta_tmp.write_text(json.dumps({
+            "version": CACHE_VERSION, "imgsz": self.imgsz, "bytes": self.path.stat().st_size,
+            "keys": keys, "shapes": shapes.tolist(),
+        }))
+        os.replace(meta_tmp, self.meta_path)
+        return shapes
+
+    def _read_meta(self):
+        try:
+            meta = json.loads(self.meta_path.read_text())
+        except (OSError, ValueError):
+            return None
+        if meta.get("version") != CACHE_VERSION or meta.get("imgsz") != self.imgsz:
+            return None
+        # Array harus file yang sama dengan saat metadata ditulis
+        try:
+            if self.path.stat().st_size != meta.get("bytes"):
+                return None
+        except OSError:
+            return None
+        return meta
+
+    @property
+    def array(self):
+        # Memmap dibuka per proses (worker DataLoader), tidak diwariskan lewat pickle
+        if self._array is None or self._pid != os.getpid():
+            self._array = np.load(self.path, mmap_mode="r")
+            self._pid = os.getpid()
+        return self._array
+
+    def __getitem__(self, i):
+        h0, w0, h, w = self.shapes[i]
+        # Salin keluar dari memmap: augmentasi mengubah gambar in-place
+        return np.array(self.array[i, :h, :w]), (int(h0), int(w0)), (int(h), int(w))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_array"] = None
+        return state
+
+
+def cache_path(im_files, imgsz):
+    """<split>/images_<imgsz>.npy, di samping <split>/labels.cache"""
+    labels_dir = Path(img2label_paths([str(im_files[0])])[0]).parent
+    return labels_dir.with_name(f"images_{imgsz}.npy")
+
+
+class CachedYOLODataset(YOLODataset):
+    """YOLODataset yang membaca gambar dari ImageCache alih-alih decode JPEG per epoch"""
+    def __init__(self, *args, **kwargs):
+        # cache="ram": BaseDataset.__init__ sudah memanggil load_image sebelum cache dibuat
+        self.image_cache = None
+        super().__init__(*args, **kwargs)
+        if self.im_files:
+            self.image_cache = ImageCache(cache_path(self.im_files, self.imgsz), self.im_files, self.imgsz)
+
+    def load_image(self, i, rect_mode=True):
+        if self.image_cache is None or not rect_mode or self.ims[i] is not None:
+            return super().load_image(i, rect_mode)
+        im, hw0, hw = self.image_cache[i]
+        if self.augment:
+            # Sama dengan BaseDataset.load_image: Mosaic memilih gambar pasangan dari buffer
+            self.ims[i], self.im_hw0[i], self.im_hw[i] = im, hw0, hw
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                j = self.buffer.pop(0)
+                if self.cache != "ram":
+                    self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+        return im, hw0, hw
+
+
+class CachedDetectionTrainer(DetectionTrainer):
+    """DetectionTrainer dengan CachedYOLODataset (argumen sama dengan build_yolo_dataset)"""
+    def build_dataset(self, img_path, mode="train", batch=None):
+        model = getattr(self.model, "module", self.model)
+        gs = max(int(model.stride.max() if model else 0), 32)
+        cfg = self.args
+        return CachedYOLODataset(
+            img_path=img_path,
+            imgsz=cfg.imgsz,
+            batch_size=batch,
+            augment=mode == "train",
+            hyp=cfg,
+            rect=cfg.rect or mode == "val",
+            cache=cfg.cache or None,
+            single_cls=cfg.single_cls or False,
+            stride=gs,
+            pad=0.0 if mode == "train" else 0.5,
+            prefix=colorstr(f"{mode}: "),
+            task=cfg.task,
+            classes=cfg.classes,
+            data=self.data,
+            fraction=cfg.fraction if mode == "train" else 1.0,
+        )
+
+
+def smoke_test(data_yaml, imgsz, iterations):
+    """Ambil beberapa sampel train dengan augmentasi default (mosaic aktif) lewat CachedYOLODataset"""
+    from ultralytics.cfg import get_cfg
+    from ultralytics.data.utils import check_det_dataset
+
+    data = check_det_dataset(str(data_yaml.resolve()))
+    hyp = get_cfg(overrides={"imgsz": imgsz})
+    dataset = CachedYOLODataset(img_path=data["train"], imgsz=imgsz, batch_size=16, augment=True,
+                                hyp=hyp, data=data, prefix=colorstr("smoke: "))
+    assert hyp.mosaic > 0 and dataset.image_cache is not None
+    for i in range(min(iterations, len(dataset))):
+        sample = dataset[i]
+        assert sample["img"].shape[1:] == (imgsz, imgsz), sample["img"].shape
+    assert 0 < len(dataset.buffer) <= dataset.max_buffer_length
+    print(f"smoke: {min(iterations, len(dataset))} mosaic samples OK (buffer {len(dataset.buffer)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build image cache untuk semua split di data.yaml")
+    parser.add_argument("data")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--smoke", type=int, default=0, metavar="N",
+                        help="Setelah build, ambil N sampel train dengan mosaic sebagai smoke test")
+    args = parser.parse_args()
+
+    data_yaml = Path(args.data)
+    data = yaml.safe_load(data_yaml.read_text())
+    for split in ("train", "val", "test"):
+        if not data.get(split):
+            continue
+        image_dir = (data_yaml.parent / data[split]).resolve()
+        if not image_dir.exists():  # export Roboflow: "../train/images" relatif ke folder dataset
+            image_dir = (data_yaml.parent / data[split].replace("../", "")).resolve()
+        im_files = sorted(p for p in image_dir.iterdir() if p.suffix.lower() in IMAGE_EXTS)
+        if im_files:
+            cache = ImageCache(cache_path(im_files, args.imgsz), im_files, args.imgsz)
+            print(f"{split}: {len(im_files)} images -> {cache.path}")
+    if args.smoke:
+        smoke_test(data_yaml, args.imgsz, args.smoke)
+
+
+if __name__ == "__main__":
+    main()
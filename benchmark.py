@@ -0,0 +1,434 @@
+"""End-to-end benchmark of the kalyol.py detection pipeline on the PHEROTRAP dataset.
+
+Setiap konfigurasi (kombinasi preprocess, AUGMENT, imgsz, backend, tiled) diputar
+ulang lewat EnhancedDetectionManager pada split valid/test; dilaporkan latency
+p50/p95/p99, throughput, puncak memori (RSS), breakdown per stage, dan count error
+terhadap file label. Hasil disimpan sebagai JSON (beserta metadata environment)
+dan bisa dibandingkan dengan run sebelumnya lewat --compare.
+
+Contoh:
+    python benchmark.py --split valid test --model YOLO/runs/train/yolo11pherox/weights/best.pt
+    python benchmark.py --preprocess none full --augment false adaptive --imgsz 640 960 \\
+        --backend pytorch onnx --output bench.json --compare bench_prev.json
+    python benchmark.py --modes single tiled
+    python benchmark.py --render  # hanya waktu render grafik, tanpa model
+    python benchmark.py --check-filters  # filter_counts() == filter streaming, tanpa model
+    python benchmark.py --check-merge    # merge tile pada frame sintetis, tanpa model
+"""
+import argparse
+import copy
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from kalyol import (
+    Config, EnhancedDetectionManager, EnhancedGraphRenderer, EnhancedKalmanFilter, RollingSeries,
+    StageMetrics, TemporalConsistencyFilter, filter_counts, result_from_array, smart_round,
+)
+
+DATASET_DIR = Path(__file__).parent / "YOLO" / "datasets" / "PHEROTRAP"
+IMAGE_EXTS = {".jpg", ".jpeg", ".png"}
+
+# Mode cepat (preset): override atribut Config
+MODES = {
+    "single": {"TILED": False},
+    "tiled": {"TILED": True},
+}
+
+AUGMENT_VALUES = {"false": False, "true": True, "adaptive": "adaptive"}
+
+# Metrik yang dibandingkan dengan --compare (naik = regresi)
+REGRESSION_KEYS = ("latency_ms_p50", "latency_ms_p95", "peak_rss_mb", "count_mae")
+
+
+def load_split(split):
+    """List (image_path, jumlah wereng di label) untuk satu split"""
+    image_dir = DATASET_DIR / split / "images"
+    label_dir = DATASET_DIR / split / "labels"
+    samples = []
+    for image in sorted(image_dir.iterdir()):
+        if image.suffix.lower() not in IMAGE_EXTS:
+            continue
+        label = label_dir / f"{image.stem}.txt"
+        count = 0
+        if label.exists():
+            count = sum(1 for line in label.read_text().splitlines() if line.strip())
+        samples.append((image, count))
+    return samples
+
+
+class PeakRSS:
+    """Sampling RSS di background selama benchmark (model PyTorch tidak terlihat tracemalloc)"""
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = StageMetrics.rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, StageMetrics.rss_bytes())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, StageMetrics.rss_bytes())
+
+
+def run_mode(detector, samples, overrides, warmup=0):
+    for key, value in overrides.items():
+        setattr(detector.config, key, value)
+
+    # Frame pemanasan (inisialisasi lazy backend) tidak ikut diukur
+    for image, _ in samples[:warmup]:
+        detector.detect(str(image))
+    detector.metrics = StageMetrics(detector.config.METRICS_WINDOW)
+
+    latencies, errors = [], []
+    rss_before = StageMetrics.rss_bytes()
+    wall_start = time.perf_counter()
+    with PeakRSS() as rss:
+        for image, expected in samples:
+            start = time.perf_counter()
+            result = detector.detect(str(image))
+            latencies.append((time.perf_counter() - start) * 1000)
+            count = len(result.boxes) if result is not None and result.boxes is not None else 0
+            errors.append(count - expected)
+    wall = time.perf_counter() - wall_start
+
+    latencies = np.array(latencies)
+    errors = np.array(errors)
+    return {
+        "frames": len(samples),
+        "latency_ms_mean": float(latencies.mean()),
+        "latency_ms_p50": float(np.percentile(latencies, 50)),
+        "latency_ms_p95": float(np.percentile(latencies, 95)),
+        "latency_ms_p99": float(np.percentile(latencies, 99)),
+        "fps": float(1000 / latencies.mean()),
+        "throughput_fps": float(len(samples) / wall),
+        "rss_mb": rss_before / 1e6,
+        "peak_rss_mb": rss.peak / 1e6,
+        "count_mae": float(np.abs(errors).mean()),
+        "count_rmse": float(np.sqrt((errors ** 2).mean())),
+        "count_bias": float(errors.mean()),
+        "stages_ms_p50": {name: s["p50_ms"] for name, s in detector.metrics.snapshot()["stages"].items()},
+    }
+
+
+def config_matrix(args):
+    """Cartesian product opsi CLI -> list (nama, override Config)"""
+    if args.modes:
+        return [(mode, dict(MODES[mode])) for mode in args.modes]
+    configs = []
+    for preprocess, augment, imgsz, backend, tiled in itertools.product(
+        args.preprocess, args.augment, args.imgsz, args.backend, args.tiled
+    ):
+        if backend != "pytorch" and augment != "false":
+            continue  # TTA hanya ada di PyTorch
+        name = f"{backend}-pre_{preprocess}-aug_{augment}-{imgsz}" + ("-tiled" if tiled == "on" else "")
+        configs.append((name, {
+            "PREPROCESS_MODE": preprocess,
+            "AUGMENT": AUGMENT_VALUES[augment],
+            "IMG_SIZE": imgsz,
+            "BACKEND": backend,
+            "TILED": tiled == "on",
+        }))
+    return configs
+
+
+def environment():
+    """Metadata agar hasil antar mesin/commit bisa dibandingkan"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        commit = None
+    try:
+        import torch
+        torch_version, threads = torch.__version__, torch.get_num_threads()
+    except ImportError:
+        torch_version, threads = None, None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch_version,
+        "torch_threads": threads,
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def compare(results, previous_path, tolerance=0.1):
+    """Cetak selisih terhadap run sebelumnya; tandai regresi > tolerance"""
+    previous = json.loads(Path(previous_path).read_text()).get("results", {})
+    regressions = 0
+    print(f"\nCompare vs {previous_path}:")
+    for name, r in results.items():
+        if name not in previous:
+            continue
+        cells = []
+        for key in REGRESSION_KEYS:
+            old, new = previous[name].get(key), r.get(key)
+            if old is None or new is None:
+                continue
+            delta = (new - old) / old if old else 0.0
+            flag = " ⚠" if delta > tolerance and new - old > 1e-6 else ""
+            regressions += bool(flag)
+            cells.append(f"{key} {old:.2f}->{new:.2f} ({delta:+.0%}){flag}")
+        print(f"  {name}: " + " | ".join(cells))
+    return regressions
+
+
+def run_render(frames=500, seed=0):
+    """Waktu render grafik per frame dengan buffer penuh (BUFFER_SIZE titik)"""
+    config = Config()
+    renderer = EnhancedGraphRenderer(config.GRAPH_WIDTH, config.GRAPH_HEIGHT, config)
+    series = {name: RollingSeries(config.BUFFER_SIZE) for name in ("raw", "temporal", "filtered")}
+    rng = np.random.default_rng(seed)
+
+    latencies = []
+    for i in range(config.BUFFER_SIZE + frames):
+        raw = float(rng.poisson(20))
+        series["raw"].append(raw)
+        series["temporal"].append(raw * 0.95)
+        series["filtered"].append(raw * 0.9)
+        if i < config.BUFFER_SIZE:
+            continue
+        graph = {name: s.snapshot() for name, s in series.items()}
+        graph["frame_index"] = i
+        start = time.perf_counter()
+        renderer.render(graph)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies = np.array(latencies)
+    return {
+        "frames": frames,
+        "latency_ms_mean": float(latencies.mean()),
+        "latency_ms_p50": float(np.percentile(latencies, 50)),
+        "latency_ms_p95": float(np.percentile(latencies, 95)),
+    }
+
+
+def check_filters(windows=(1, 2, 3, 5), frames=300, seed=0):
+    """filter_counts() (batch, juga dilanjutkan dari state streaming) harus identik
+    dengan get_filtered_count() frame per frame untuk tiap TEMPORAL_WINDOW"""
+    rng = np.random.default_rng(seed)
+    raw = rng.poisson(20, frames).astype(float)
+    raw[rng.choice(frames, frames // 20, replace=False)] *= 3  # outlier untuk Kalman
+    failures = []
+    for window in windows:
+        before = len(failures)
+        temporal = TemporalConsistencyFilter(window_size=window)
+        kalman = EnhancedKalmanFilter(log_outliers=False)
+        history = deque(maxlen=20)
+        stream = {"temporal": [], "kalman": [], "final": []}
+        for value in raw.tolist():
+            t = temporal.update(value)
+            k = kalman.update(t)
+            count = smart_round(value, k, history)
+            history.append(count)
+            for name, v in zip(stream, (t, k, count)):
+                stream[name].append(v)
+
+        # Seluruh array sekaligus, dan separuh streaming + separuh batch
+        whole = filter_counts(raw, temporal_window=window)
+        half = frames // 2
+        temporal = TemporalConsistencyFilter(window_size=window)
+        kalman = EnhancedKalmanFilter(log_outliers=False)
+        history = deque(maxlen=20)
+        for value in raw[:half].tolist():
+            history.append(smart_round(value, kalman.update(temporal.update(value)), history))
+        resumed = filter_counts(raw[half:], temporal=temporal, kalman=kalman, history=history)
+
+        for name, expected in stream.items():
+            expected = np.array(expected)
+            if not np.array_equal(whole[name], expected):
+                failures.append(f"window {window}: {name}")
+            if not np.array_equal(resumed[name], expected[half:]):
+                failures.append(f"window {window}: {name} (resumed)")
+        print(f"  window {window}: {'OK' if len(failures) == before else 'MISMATCH'}")
+    return failures
+
+
+class BlobEngine:
+    """Detector sintetis untuk --check-merge: satu box per blob per level abu-abu (< 200).
+    
+    Serangga yang saling menimpa digambar dengan level berbeda, jadi tetap terdeteksi
+    terpisah seperti hasil NMS model di satu tile/frame."""
+    names = {0: "Wereng"}
+    version = "blob"
+
+    def predict(self, images, **kwargs):
+        results = []
+        for img in images:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            boxes = []
+            for level in np.unique(gray[gray < 200]):
+                n, _, stats, _ = cv2.connectedComponentsWithStats((gray == level).astype(np.uint8))
+                boxes.extend((x, y, x + w, y + h, 0.9, 0) for x, y, w, h, _ in stats[1:])
+            data = np.array(boxes, dtype=np.float32).reshape(-1, 6)
+            results.append(result_from_array(img, data, self.names))
+        return results
+
+    def warmup(self, passes):
+        return None
+
+    def shutdown(self):
+        pass
+
+
+def draw_insects(img, boxes):
+    for i, (x1, y1, x2, y2) in enumerate(boxes):
+        cv2.rectangle(img, (x1, y1), (x2 - 1, y2 - 1), (10 + 10 * (i % 18),) * 3, -1)
+    return img
+
+
+def clustered_insects(rng, centers, per_cluster, spread=30):
+    """Box serangga (~14-22 px) yang bergerombol dan saling menimpa di sekitar tiap pusat"""
+    boxes = []
+    for cx, cy in centers:
+        for _ in range(per_cluster):
+            x, y = rng.integers(-spread, spread, 2) + (cx, cy)
+            w, h = rng.integers(14, 22, 2)
+            boxes.append((int(x), int(y), int(x + w), int(y + h)))
+    return boxes
+
+
+def check_merge(seed=0):
+    """Mode tiled: serangga berhimpit di satu tile tetap dihitung semua, duplikat di
+    overlap antar tile dihitung sekali. Mode incremental: count frame dengan serangga
+    baru di gerombolan sama dengan full-frame detection."""
+    failures = []
+    config = Config()
+    config.LOG_PREPROCESS_TIMING = False
+    config.METRICS_DUMP_PATH = None
+    config.PREPROCESS_MODE = "none"
+    config.AUGMENT = False
+    config.RESULT_CACHE_SIZE = 0
+    config.TILED, config.TILE_SIZE, config.TILE_OVERLAP = True, 640, 0.2
+
+    # 1280x720 -> tile x 0/512/640, y 0/80
+    insects = [
+        (100, 10, 120, 30), (105, 15, 117, 27),      # berhimpit (IoU 0.36), hanya di satu tile
+        (300, 300, 322, 320), (306, 304, 326, 324),  # berhimpit (IoU 0.44), di overlap vertikal
+        (630, 200, 650, 220),                        # terpotong batas tile, utuh di tile sebelah
+        (900, 400, 915, 418),
+    ]
+    img = draw_insects(np.full((720, 1280, 3), 255, np.uint8), insects)
+    detector = EnhancedDetectionManager(None, config, engine=BlobEngine())
+    count = len(detector.detect_preprocessed([img], ["check"])[0].boxes)
+    ok = count == len(insects)
+    print(f"  tiled: {count} box untuk {len(insects)} serangga: {'OK' if ok else 'MISMATCH'}")
+    if not ok:
+        failures.append(f"tiled: {count} != {len(insects)}")
+
+    # Incremental: frame 1 full detect, frame 2 (serangga baru di satu gerombolan) per window
+    config.TILED = False
+    rng = np.random.default_rng(seed)
+    board = clustered_insects(rng, [(200, 200), (600, 400), (1000, 250)], 12)
+    arrivals = clustered_insects(rng, [(600, 400)], 5, spread=20)
+    frames = [draw_insects(np.full((720, 1280, 3), 255, np.uint8), board),
+              draw_insects(np.full((720, 1280, 3), 255, np.uint8), board + arrivals)]
+    full = EnhancedDetectionManager(None, config, engine=BlobEngine())
+    expected = len(full.detect_preprocessed(frames[1:], ["check"])[0].boxes)
+    config = copy.copy(config)
+    config.INCREMENTAL = True
+    incremental = EnhancedDetectionManager(None, config, engine=BlobEngine())
+    counts = [len(incremental.detect_preprocessed([frame], ["check"])[0].boxes) for frame in frames]
+    windowed = incremental.incremental_stats["windows"] == 1
+    ok = counts[1] == expected and windowed
+    print(f"  incremental: {counts[1]} box vs full-frame {expected} "
+          f"({'window' if windowed else 'full re-detect'}): {'OK' if ok else 'MISMATCH'}")
+    if not ok:
+        failures.append(f"incremental: {counts[1]} != {expected} (windowed={windowed})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=Config.MODEL_PATH)
+    parser.add_argument("--split", nargs="+", default=["valid", "test"])
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), help="Preset (mengabaikan matrix)")
+    parser.add_argument("--preprocess", nargs="+", default=[Config.PREPROCESS_MODE],
+                        choices=["none", "clahe", "fast", "full"])
+    parser.add_argument("--augment", nargs="+", default=["adaptive"], choices=list(AUGMENT_VALUES))
+    parser.add_argument("--imgsz", nargs="+", type=int, default=[Config.IMG_SIZE])
+    parser.add_argument("--backend", nargs="+", default=["pytorch"], choices=["pytorch", "onnx", "openvino"])
+    parser.add_argument("--tiled", nargs="+", default=["off"], choices=["off", "on"])
+    parser.add_argument("--warmup", type=int, default=2, help="Frame pemanasan per konfigurasi")
+    parser.add_argument("--render", action="store_true", help="Benchmark render grafik saja")
+    parser.add_argument("--check-filters", action="store_true", help="Cek filter batch == streaming")
+    parser.add_argument("--check-merge", action="store_true", help="Cek merge tile (frame sintetis)")
+    parser.add_argument("--output", help="Simpan hasil sebagai JSON")
+    parser.add_argument("--compare", help="JSON run sebelumnya untuk deteksi regresi")
+    args = parser.parse_args()
+
+    if args.check_filters or args.check_merge:
+        failures = (check_filters() if args.check_filters else []) + (check_merge() if args.check_merge else [])
+        for failure in failures:
+            print(f"  ❌ {failure}")
+        sys.exit(1 if failures else 0)
+
+    if args.render:
+        r = run_render()
+        print(f"  render: mean {r['latency_ms_mean']:.2f}ms | p50 {r['latency_ms_p50']:.2f}ms | "
+              f"p95 {r['latency_ms_p95']:.2f}ms")
+        if args.output:
+            Path(args.output).write_text(json.dumps({"render": r}, indent=2))
+        return
+
+    samples = [s for split in args.split for s in load_split(split)]
+    base = Config()
+    base.LOG_PREPROCESS_TIMING = False
+    base.METRICS_DUMP_PATH = None
+
+    results = {}
+    for name, overrides in config_matrix(args):
+        # Detector baru per konfigurasi: stage preprocess dan backend dibangun saat init
+        config = copy.copy(base)
+        for key, value in overrides.items():
+            setattr(config, key, value)
+        detector = EnhancedDetectionManager(args.model, config)
+        results[name] = {"config": overrides, **run_mode(detector, samples, {}, args.warmup)}
+        detector.engine.shutdown()
+
+        r = results[name]
+        print(f"{name:>40}: p50 {r['latency_ms_p50']:.0f}ms | p95 {r['latency_ms_p95']:.0f}ms | "
+              f"p99 {r['latency_ms_p99']:.0f}ms | {r['throughput_fps']:.2f} fps | "
+              f"peak {r['peak_rss_mb']:.0f}MB | count MAE {r['count_mae']:.2f} | bias {r['count_bias']:+.2f}")
+
+    report = {
+        "environment": environment(),
+        "dataset": {"splits": args.split, "frames": len(samples)},
+        "model": args.model,
+        "results": results,
+    }
+    # Bandingkan dulu: --output boleh menimpa file yang sama dengan --compare
+    regressions = compare(results, args.compare) if args.compare else 0
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Saved: {args.output}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""Persistent detection store (SQLite, WAL) untuk riwayat count per trap.
+
+kalyol.py menulis satu baris per frame (raw, temporal, filtered, confidence, box)
+lewat DetectionStore.add(); penulisan dikumpulkan dan di-commit per batch di
+thread terpisah. Query agregat per hari / per trap tidak lagi bergantung pada
+Google Sheet (MAX_ROWS di CODE.gs).
+
+Contoh:
+    python detection_store.py detections.db daily --device trap-1 --days 30
+    python detection_store.py detections.db traps
+"""
+import argparse
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id          INTEGER PRIMARY KEY,
+    device      TEXT    NOT NULL,
+    ts          REAL    NOT NULL,
+    raw         INTEGER NOT NULL,
+    temporal    REAL    NOT NULL,
+    filtered    INTEGER NOT NULL,
+    avg_conf    REAL    NOT NULL,
+    confidences BLOB,
+    boxes       BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_detections_device_ts ON detections (device, ts);
+"""
+
+INSERT = """
+INSERT INTO detections (device, ts, raw, temporal, filtered, avg_conf, confidences, boxes)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Hari dihitung di zona waktu lokal (sama dengan timestamp di log)
+DAY = "date(ts, 'unixepoch', 'localtime')"
+
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def decode_boxes(blob):
+    """BLOB float32 -> array Nx4 (xyxy)"""
+    if not blob:
+        return np.zeros((0, 4), dtype=np.float32)
+    return np.frombuffer(blob, dtype=np.float32).reshape(-1, 4)
+
+
+def decode_confidences(blob):
+    if not blob:
+        return np.zeros(0, dtype=np.float32)
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+class DetectionStore:
+    """Append-only store dengan batched write di background thread"""
+    def __init__(self, path, batch_size=256, flush_interval=1.0, queue_size=10000):
+        self.path = str(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+
+        # Buat schema di thread pemanggil agar error path/izin langsung terlihat
+        conn = connect(self.path)
+        conn.executescript(SCHEMA)
+        conn.close()
+
+        self._writer = threading.Thread(target=self._write_loop, name="detection-store", daemon=True)
+        self._writer.start()
+        logger.info(f"🗄️  Detection store: {self.path}")
+
+    def add(self, device, raw, temporal, filtered, confidences=(), boxes=(), ts=None):
+        """Antrikan satu frame; tidak pernah memblokir pipeline counting"""
+        confidences = np.asarray(confidences, dtype=np.float32)
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        avg_conf = float(confidences.mean()) if len(confidences) else 0.0
+        row = (
+            device, ts or time.time(), int(raw), float(temporal), int(filtered),
+            avg_conf, confidences.tobytes(), boxes.tobytes(),
+        )
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            logger.warning(f"⚠️  Detection store queue full, dropping frame [{device}]")
+
+    def _write_loop(self):
+        conn = connect(self.path)
+        try:
+            while not (self._stop.is_set() and self._queue.empty()):
+                batch = self._next_batch()
+                if batch:
+                    try:
+                        with conn:
+                            conn.executemany(INSERT, batch)
+                    except sqlite3.Error as e:
+                        logger.error(f"❌ Detection store write failed ({len(batch)} rows): {e}")
+        finally:
+            conn.close()
+
+    def _next_batch(self):
+        """Kumpulkan baris sampai batch_size atau flush_interval habis"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Ambil sisa yang sudah antri tanpa menunggu
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def close(self):
+        """Tulis semua baris yang tersisa lalu hentikan writer"""
+        self._stop.set()
+        self._writer.join(timeout=30)
+
+    # ==========================
+    # QUERY API
+    # ==========================
+    def frames(self, device, start=None, end=None, with_boxes=False):
+        """Baris per frame untuk satu trap dalam rentang waktu [start, end)"""
+        columns = "ts, raw, temporal, filtered, avg_conf"
+        if with_boxes:
+            columns += ", confidences, boxes"
+        sql = f"SELECT {columns} FROM detections WHERE device = ? AND ts >= ? AND ts < ? ORDER BY ts"
+        rows = self._query(sql, (device, start or 0, end or float("inf")))
+        if not with_boxes:
+            return [dict(row) for row in rows]
+        return [
+            {**dict(row), "confidences": decode_confidences(row["confidences"]), "boxes": decode_boxes(row["boxes"])}
+            for row in rows
+        ]
+
+    def daily(self, device=None, start=None, end=None):
+        """Agregat per hari (dan per trap) dalam rentang waktu"""
+        where, params = self._where(device, start, end)
+        sql = f"""
+            SELECT {DAY} AS day, device, COUNT(*) AS frames,
+                   AVG(raw) AS raw_mean, AVG(filtered) AS filtered_mean,
+                   MAX(filtered) AS filtered_max, AVG(avg_conf) AS conf_mean
+            FROM detections {where}
+            GROUP BY day, device ORDER BY day, device
+        """
+        return [dict(row) for row in self._query(sql, params)]
+
+    def per_trap(self, start=None, end=None):
+        """Agregat per trap dalam rentang waktu"""
+        where, params = self._where(None, start, end)
+        sql = f"""
+            SELECT device, COUNT(*) AS frames, MIN(ts) AS first_ts, MAX(ts) AS last_ts,
+                   AVG(raw) AS raw_mean, AVG(filtered) AS filtered_mean,
+                   MAX(filtered) AS filtered_max, AVG(avg_conf) AS conf_mean
+            FROM detections {where}
+            GROUP BY device ORDER BY device
+        """
+        return [dict(row) for row in self._query(sql, params)]
+
+    @staticmethod
+    def _where(device, start, end):
+        clauses, params = ["ts >= ?", "ts < ?"], [start or 0, end or float("inf")]
+        if device is not None:
+            clauses.insert(0, "device = ?")
+            params.insert(0, device)
+        return "WHERE " + " AND ".join(clauses), params
+
+    def _query(self, sql, params):
+        # Koneksi baca terpisah: WAL mengizinkan baca bersamaan dengan writer
+        conn = connect(self.path)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("db")
+    parser.add_argument("query", choices=["daily", "traps"])
+    parser.add_argument("--device")
+    parser.add_argument("--days", type=int, default=30, help="Rentang ke belakang dari sekarang")
+    args = parser.parse_args()
+
+    store = DetectionStore(args.db)
+    start = time.time() - args.days * 86400
+    if args.query == "daily":
+        rows = store.daily(args.device, start=start)
+        print(f"{'day':<12}{'device':<12}{'frames':>8}{'raw':>8}{'filtered':>10}{'max':>6}{'conf':>7}")
+        for r in rows:
+            print(f"{r['day']:<12}{r['device']:<12}{r['frames']:>8}{r['raw_mean']:>8.1f}"
+                  f"{r['filtered_mean']:>10.1f}{r['filtered_max']:>6}{r['conf_mean']:>7.2f}")
+    else:
+        rows = store.per_trap(start=start)
+        print(f"{'device':<12}{'frames':>8}{'raw':>8}{'filtered':>10}{'max':>6}{'conf':>7}  last seen")
+        for r in rows:
+            last = time.strftime("%Y-%m-%d %H:%M", time.localtime(r["last_ts"]))
+            print(f"{r['device']:<12}{r['frames']:>8}{r['raw_mean']:>8.1f}"
+                  f"{r['filtered_mean']:>10.1f}{r['filtered_max']:>6}{r['conf_mean']:>7.2f}  {last}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
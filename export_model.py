@@ -0,0 +1,95 @@
+"""Export the trained detector to ONNX / OpenVINO and check parity against PyTorch.
+
+Contoh:
+    python export_model.py --backend onnx openvino
+    python export_model.py --backend onnx --parity --split valid test
+"""
+import argparse
+import copy
+import sys
+
+import numpy as np
+
+from benchmark import load_split
+from kalyol import Config, EnhancedDetectionManager, box_iou, resolve_model_path
+
+
+def detections(detector, image):
+    result = detector.detect(str(image))
+    if result is None or result.boxes is None:
+        return np.zeros((0, 4)), np.zeros(0)
+    return result.boxes.xyxy.cpu().numpy(), result.boxes.conf.cpu().numpy()
+
+
+def check_parity(model_path, backend, samples, iou_threshold=0.9, conf_tolerance=0.05):
+    """Bandingkan deteksi backend hasil export dengan PyTorch pada gambar yang sama"""
+    base = Config()
+    base.AUGMENT = False  # TTA hanya ada di PyTorch, matikan agar setara
+    base.TILED = False
+    base.LOG_PREPROCESS_TIMING = False
+
+    reference = EnhancedDetectionManager(model_path, base)
+    exported_config = copy.copy(base)
+    exported_config.BACKEND = backend
+    exported = EnhancedDetectionManager(model_path, exported_config)
+
+    count_diffs, matched_iou, conf_diffs, failures = [], [], [], 0
+    for image, _ in samples:
+        ref_boxes, ref_conf = detections(reference, image)
+        exp_boxes, exp_conf = detections(exported, image)
+        count_diffs.append(len(exp_boxes) - len(ref_boxes))
+
+        if len(ref_boxes) and len(exp_boxes):
+            iou = box_iou(ref_boxes, exp_boxes)
+            best = iou.argmax(axis=1)
+            matched_iou.extend(iou[np.arange(len(ref_boxes)), best])
+            conf_diffs.extend(np.abs(ref_conf - exp_conf[best]))
+
+        if count_diffs[-1] != 0:
+            failures += 1
+            print(f"  ✗ {image.name}: pytorch {len(ref_boxes)} vs {backend} {len(exp_boxes)}")
+
+    matched_iou = np.array(matched_iou) if matched_iou else np.ones(1)
+    conf_diffs = np.array(conf_diffs) if conf_diffs else np.zeros(1)
+    report = {
+        "images": len(samples),
+        "count_mismatch_images": failures,
+        "count_mae": float(np.abs(count_diffs).mean()),
+        "box_iou_min": float(matched_iou.min()),
+        "box_iou_mean": float(matched_iou.mean()),
+        "conf_diff_max": float(conf_diffs.max()),
+    }
+    report["passed"] = (
+        report["count_mae"] <= 0.5
+        and report["box_iou_mean"] >= iou_threshold
+        and report["conf_diff_max"] <= conf_tolerance
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=Config.MODEL_PATH)
+    parser.add_argument("--backend", nargs="+", default=["onnx"], choices=["onnx", "openvino"])
+    parser.add_argument("--parity", action="store_true", help="Bandingkan output dengan PyTorch")
+    parser.add_argument("--split", nargs="+", default=["valid", "test"])
+    args = parser.parse_args()
+
+    ok = True
+    for backend in args.backend:
+        config = Config()
+        config.BACKEND = backend
+        print(f"[{backend}] {resolve_model_path(args.model, config)}")
+
+        if args.parity:
+            samples = [s for split in args.split for s in load_split(split)]
+            report = check_parity(args.model, backend, samples)
+            status = "PASS" if report["passed"] else "FAIL"
+            print(f"[{backend}] parity {status}: {report}")
+            ok = ok and report["passed"]
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
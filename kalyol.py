@@ -1,12 +1,32 @@
 import os
 import time
+import json
+import queue
+import socket
+import threading
+import itertools
+import secrets
+import bisect
+import hashlib
+import sqlite3
+import sys
+import argparse
+import importlib
+import traceback
+import http.client
+import urllib.request
+from contextlib import contextmanager
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import cv2
 import numpy as np
-import paho.mqtt.client as mqtt
-from ultralytics import YOLO
-from collections import deque
+from collections import deque, OrderedDict
 from pathlib import Path
 import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from detection_store import DetectionStore
 
 # ==========================
 # SETUP LOGGING
@@ -14,6 +34,29 @@ import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# ==========================
+# LAZY IMPORTS
+# ==========================
+class LazyModule:
+    """Import modul berat (torch via ultralytics, paho) saat atribut pertama dipakai.
+    
+    Front-end yang memakai inference daemon tidak perlu memuat torch sama sekali
+    sebelum frame pertama; cv2/numpy tetap di-import langsung karena selalu dipakai."""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr):
+        if self._module is None:
+            start = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            logger.info(f"📚 Imported {self._name} ({(time.perf_counter() - start) * 1000:.0f} ms)")
+        return getattr(self._module, attr)
+
+mqtt = LazyModule("paho.mqtt.client")
+ultralytics = LazyModule("ultralytics")
+ultralytics_results = LazyModule("ultralytics.engine.results")
+
 # ==========================
 # KONFIGURASI
 # ==========================
@@ -24,18 +67,93 @@ class Config:
     CONFIDENCE_THRESHOLD = 0.4
     IOU_THRESHOLD = 0.5
     
+    # Inference backend: "pytorch" | "onnx" | "openvino"
+    # Model hasil export disimpan di samping MODEL_PATH (best.onnx / best_openvino_model/)
+    BACKEND = "pytorch"
+    MODEL_PRECISION = "fp32"  # "fp32" | "int8" (int8: jalankan quantize_model.py dulu)
+    
     # YOLO Inference Optimization
     IMG_SIZE = 640
-    AUGMENT = True
+    AUGMENT = "adaptive"  # True | False | "adaptive" (TTA hanya jika diperlukan)
     AGNOSTIC_NMS = False
     MAX_DET = 500
     
+    # Adaptive TTA: ulangi inference dengan augment=True hanya jika
+    # confidence rendah, count outlier (Kalman), atau lonjakan vs history
+    TTA_MIN_CONFIDENCE = 0.55
+    TTA_MAX_JUMP = 5
+    TTA_REPORT_EVERY = 50
+    
+    # Sliced (tiled) inference untuk gambar resolusi tinggi
+    TILED = False
+    TILE_SIZE = 640            # ukuran tile di gambar asli (px)
+    TILE_OVERLAP = 0.2         # fraksi overlap antar tile
+    TILE_IMG_SIZE = 640        # imgsz model per tile
+    TILE_BATCH = 8             # jumlah tile per model.predict
+    TILE_MERGE_THRESHOLD = 0.6 # intersection-over-smaller untuk merge antar tile
+    
+    # Incremental inference: frame diregistrasi ke frame sebelumnya (phase correlation),
+    # hanya area yang berubah yang di-preprocess + dideteksi; box lain dipakai ulang
+    INCREMENTAL = False
+    INCREMENTAL_FULL_EVERY = 20        # full re-detect tiap N frame per trap (koreksi drift)
+    INCREMENTAL_SCALE = 0.5            # skala gray untuk registrasi + diff
+    INCREMENTAL_DIFF_THRESHOLD = 25    # selisih intensitas (0-255) yang dianggap berubah
+    INCREMENTAL_MIN_AREA = 4           # px (di skala diff) minimum satu region berubah
+    INCREMENTAL_MIN_RESPONSE = 0.1     # phase correlation lebih lemah -> full detect
+    INCREMENTAL_MAX_SHIFT = 64         # px geser kamera/board maksimum sebelum full detect
+    INCREMENTAL_MAX_CHANGED = 0.3      # fraksi frame berubah/tercakup window -> full detect
+    INCREMENTAL_WINDOW = 320           # ukuran window deteksi di sekitar perubahan (px asli)
+    INCREMENTAL_PAD = 32               # konteks di sekitar region berubah (px asli)
+    
+    # Preprocessing pipeline: "none" | "clahe" | "fast" | "full"
+    #   clahe = CLAHE saja, fast = CLAHE + denoise cepat + sharpen,
+    #   full  = CLAHE + NLM denoise + sharpen (paling lambat)
+    PREPROCESS_MODE = "full"
+    FAST_DENOISE = "bilateral"  # "bilateral" | "gaussian" (untuk mode "fast")
+    LOG_PREPROCESS_TIMING = True
+    
+    # Metrik per stage (histogram, p50/p95/p99, fps, RSS):
+    #   GET /metrics (Prometheus) dan /metrics.json di PREVIEW_PORT, plus dump JSON berkala
+    METRICS_WINDOW = 1000              # sampel terakhir per stage untuk persentil
+    METRICS_DUMP_PATH = "/home/adjira/esp_server/metrics.json"  # None = tanpa dump
+    METRICS_DUMP_INTERVAL = 60.0
+    # Sampling profiler semua thread pipeline (format collapsed stack, seperti py-spy);
+    # juga bisa sekali jalan lewat GET /profile?seconds=10
+    PROFILE = os.environ.get("PHEROTRAP_PROFILE", "0") == "1"
+    PROFILE_INTERVAL = 0.01            # detik antar sampel
+    PROFILE_PATH = "/home/adjira/esp_server/profile.collapsed"
+    
     # MQTT
     BROKER = "XXX"
     PORT = 8883
     USERNAME = "XXX"
     PASSWORD = "XXX"
     TOPIC = "/pest"
+    MQTT_TLS = True
+    MQTT_QOS = 1                       # 0 | 1 | 2 (ack QoS>0 = baris outbox dihapus)
+    # Outbox di disk: count tetap terkirim setelah broker putus / restart
+    MQTT_OUTBOX_PATH = "/home/adjira/esp_server/mqtt_outbox.db"  # None = di memory saja
+    MQTT_OUTBOX_MAX = 10000            # baris; yang paling lama dibuang jika penuh
+    MQTT_INFLIGHT = 20                 # pesan terkirim yang menunggu ack
+    # Batch JSON: beberapa count trap + timestamp dalam satu pesan
+    # (topic per trap dan /pest tetap integer biasa untuk ESP32)
+    MQTT_BATCH_TOPIC = "/pest/batch"
+    MQTT_BATCH_SIZE = 16
+    MQTT_BATCH_INTERVAL = 5.0          # detik maksimum sebelum batch dikirim
+    MQTT_METRICS_EVERY = 60.0          # detik antar log metrik publish
+    
+    # Upload queue (server.py -> kalyol.py lewat socket lokal)
+    QUEUE_HOST = "127.0.0.1"
+    QUEUE_PORT = 5055
+    QUEUE_SIZE = 8
+    
+    # Stream MJPEG langsung dari trap (GET /stream di ESP32-CAM) tanpa POST per frame:
+    # {"trap-1": "http://192.168.1.50/stream"}; juga lewat --stream trap-1=URL
+    STREAM_URLS = {}
+    STREAM_TIMEOUT = 10.0              # detik tanpa data sebelum reconnect
+    STREAM_RECONNECT_DELAY = 2.0
+    STREAM_CHUNK_SIZE = 16 * 1024
+    STREAM_MAX_FRAME_BYTES = 4 * 1024 * 1024  # buffer tanpa EOI dibuang setelah ini
     
     # Visualisasi
     WINDOW_WIDTH = 1280
@@ -45,25 +163,138 @@ class Config:
     BUFFER_SIZE = 100
     
     # Timing
-    FRAME_DELAY = 1.0
     DISPLAY_DELAY = 50
     
+    # Headless: tanpa window OpenCV; frame/grafik hanya dirender saat diminta
+    HEADLESS = os.environ.get("PHEROTRAP_HEADLESS", "0") == "1"
+    RENDER_EVERY_N = 0                 # headless: simpan preview tiap N frame (0 = off)
+    PREVIEW_DIR = "/home/adjira/esp_server/preview/"
+    PREVIEW_HOST = "127.0.0.1"         # GET /frame.jpg, /graph.jpg (?device=trap-1)
+    PREVIEW_PORT = 5060
+    
+    # Cache hasil deteksi per isi frame: JPEG yang sama tidak di-inferensi ulang
+    # dan tidak memajukan filter Kalman/temporal
+    RESULT_CACHE_SIZE = 256            # entri LRU (0 = nonaktif)
+    PERCEPTUAL_HASH = False            # dHash: frame trap yang hampir identik dianggap sama
+    PERCEPTUAL_HASH_THRESHOLD = 4      # maks bit berbeda (dari 64) terhadap frame terakhir trap
+    
+    # Riwayat per frame (SQLite WAL, index device+timestamp); None = nonaktif
+    STORE_PATH = "/home/adjira/esp_server/detections.db"
+    STORE_BATCH_SIZE = 256             # baris per transaksi
+    STORE_FLUSH_INTERVAL = 1.0         # detik maksimum sebelum batch ditulis
+    
     TEMPORAL_WINDOW = 5
     CONFIDENCE_BOOST = True
+    
+    # Tracker box antar frame: serangga yang sama tidak dihitung ulang;
+    # publish total di trap + serangga baru sejak frame sebelumnya
+    TRACKING = True
+    TRACK_IOU_MIN = 0.1                # IoU minimum untuk match
+    TRACK_MAX_DISTANCE = 24.0          # px jarak centroid untuk match jika IoU kecil (geser kamera)
+    TRACK_MIN_HITS = 2                 # frame berturut-turut sebelum track dihitung (anti flicker)
+    TRACK_MAX_MISSES = 5               # frame tanpa deteksi sebelum track dibuang
+    TRACK_TOTAL_TOPIC = "/pest/{device}/total"
+    TRACK_NEW_TOPIC = "/pest/{device}/new"
+    
+    # Multi-trap: state filter per device + batching antar trap
+    DEFAULT_DEVICE = "trap-1"          # upload tanpa device ID
+    DEVICE_TOPIC = "/pest/{device}"    # topic per device (DEFAULT_DEVICE juga ke TOPIC)
+    DEVICE_IDLE_TIMEOUT = 6 * 3600     # detik tanpa frame sebelum state dibuang
+    MAX_DEVICES = 64
+    BATCH_SIZE = 4                     # frame per model.predict
+    BATCH_WINDOW = 0.2                 # detik menunggu frame trap lain
+    
+    # Pipeline paralel: preprocess (thread) → inference → count → publish / display
+    PREPROCESS_WORKERS = 2             # thread decode + preprocess
+    INFERENCE_WORKERS = 1              # batch inference yang berjalan bersamaan
+    INFERENCE_PROCESSES = 0            # 0 = model di proses ini; >0 = process pool (model per worker)
+    
+    # Startup: inference dummy saat start agar frame pertama tidak menanggung warm-up
+    WARMUP = True
+    # Inference daemon (python kalyol.py --daemon) yang menyimpan model tetap di memory;
+    # front-end yang di-restart cukup connect lagi tanpa memuat ulang model
+    INFERENCE_DAEMON = os.environ.get("PHEROTRAP_INFERENCE_DAEMON", "0") == "1"
+    INFERENCE_DAEMON_HOST = "127.0.0.1"
+    INFERENCE_DAEMON_PORT = 5070
+    # Koneksi daemon memakai pickle (= eksekusi kode), jadi authkey harus rahasia: dari env,
+    # atau file key 0600 yang dibuat acak oleh daemon saat start dan dibaca front-end
+    INFERENCE_DAEMON_AUTHKEY = os.environ.get("PHEROTRAP_INFERENCE_DAEMON_AUTHKEY")
+    INFERENCE_DAEMON_KEY_FILE = os.environ.get(
+        "PHEROTRAP_INFERENCE_DAEMON_KEY_FILE", os.path.expanduser("~/.pherotrap/inference_daemon.key")
+    )
+    
+    # Hot reload: MODEL_PATH diganti (mis. hasil retrain) -> model baru dimuat + warm-up di
+    # background lalu ditukar di antara frame; state filter per trap tetap.
+    # Manual: POST /admin/reload[?path=...], POST /admin/rollback, GET /admin/model (PREVIEW_PORT);
+    # path hanya boleh file di folder MODEL_PATH (checkpoint .pt = pickle)
+    MODEL_WATCH = True
+    MODEL_WATCH_INTERVAL = 10.0        # detik antar cek mtime/ukuran file model
+    PIPELINE_QUEUE_SIZE = 4            # antrian antar stage (backpressure)
+    DISPLAY_QUEUE_SIZE = 2             # display lambat hanya membuang frame lama
+
+# ==========================
+# RUNNING MEDIAN (SLIDING WINDOW)
+# ==========================
+class RunningMedian:
+    """Window geser dengan list terurut untuk median O(1) dan mean rolling.
+    
+    Update O(w): bisect mencari posisi dalam O(log w), tapi insort/del menggeser
+    list. Untuk window kecil di sini (15, TEMPORAL_WINDOW) itu memmove beberapa
+    pointer, jauh lebih murah dari np.median/np.mean pada deque yang dikonversi
+    ke array tiap frame."""
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self.window = deque()
+        self.sorted = []
+        self.total = 0.0
+        self._appends = 0
+    
+    def append(self, value):
+        value = float(value)
+        if len(self.window) == self.maxlen:
+            old = self.window.popleft()
+            del self.sorted[bisect.bisect_left(self.sorted, old)]
+            self.total -= old
+        self.window.append(value)
+        bisect.insort(self.sorted, value)
+        self.total += value
+        
+        # Hitung ulang total sesekali agar error floating point tidak menumpuk
+        self._appends += 1
+        if self._appends >= self.maxlen:
+            self._appends = 0
+            self.total = sum(self.window)
+    
+    def median(self):
+        n = len(self.sorted)
+        mid = n // 2
+        if n % 2:
+            return self.sorted[mid]
+        return (self.sorted[mid - 1] + self.sorted[mid]) / 2
+    
+    def mean(self):
+        return self.total / len(self.window)
+    
+    def __len__(self):
+        return len(self.window)
+    
+    def __iter__(self):
+        return iter(self.window)
 
 # ==========================
 # ENHANCED KALMAN FILTER WITH OUTLIER REJECTION
 # ==========================
 class EnhancedKalmanFilter:
     """Kalman Filter dengan outlier rejection dan adaptive tuning"""
-    def __init__(self, process_variance=1e-3, measurement_variance=1.5):
+    def __init__(self, process_variance=1e-3, measurement_variance=1.5, log_outliers=True):
         self.x = 0.0
         self.P = 1.0
         self.Q = process_variance
         self.R = measurement_variance
         self.initialized = False
-        self.innovation_history = deque(maxlen=15)
+        self.innovation_history = RunningMedian(15)
         self.prediction_history = deque(maxlen=10)
+        self.log_outliers = log_outliers
         
     def update(self, measurement):
         if not self.initialized:
@@ -81,17 +312,18 @@ class EnhancedKalmanFilter:
         
         # ✅ OUTLIER REJECTION - Tolak measurement yang terlalu ekstrem
         if len(self.innovation_history) > 5:
-            median_innovation = np.median(self.innovation_history)
+            median_innovation = self.innovation_history.median()
             innovation_threshold = 3.0 * median_innovation  # 3-sigma rule
             
             if abs(innovation) > innovation_threshold and innovation_threshold > 1.0:
-                logger.warning(f"⚠️  Outlier detected: {measurement} vs predicted {prediction:.1f}")
+                if self.log_outliers:
+                    logger.warning(f"⚠️  Outlier detected: {measurement} vs predicted {prediction:.1f}")
                 # Gunakan prediksi saja, jangan update
                 return self.x
         
         # Adaptive R based on recent innovations
         if len(self.innovation_history) > 8:
-            avg_innovation = np.mean(self.innovation_history)
+            avg_innovation = self.innovation_history.mean()
             self.R = max(0.8, min(3.0, avg_innovation * 1.5))
         
         # Update
@@ -104,15 +336,40 @@ class EnhancedKalmanFilter:
         self.prediction_history.append(self.x)
         
         return self.x
+    
+    def is_outlier(self, measurement):
+        """Cek apakah measurement akan ditolak oleh update(), tanpa mengubah state"""
+        if not self.initialized:
+            return False
+        innovation = abs(measurement - self.x)
+        history = list(self.innovation_history)[-(self.innovation_history.maxlen - 1):]
+        history.append(innovation)
+        if len(history) <= 5:
+            return False
+        innovation_threshold = 3.0 * np.median(history)
+        return innovation > innovation_threshold and innovation_threshold > 1.0
+    
+    def filter_batch(self, measurements):
+        """Jalankan update() untuk seluruh array (rekursif, jadi tetap berurutan)"""
+        return np.array([self.update(m) for m in np.asarray(measurements, dtype=float).tolist()])
 
 # ==========================
 # TEMPORAL CONSISTENCY FILTER
 # ==========================
 class TemporalConsistencyFilter:
     """Filter untuk menjaga konsistensi temporal antar frame"""
+    WEIGHTS = [0.1, 0.2, 0.4, 0.2, 0.1]
+    
     def __init__(self, window_size=5, outlier_threshold=0.4):
-        self.window = deque(maxlen=window_size)
+        self.window = RunningMedian(window_size)
         self.outlier_threshold = outlier_threshold
+        
+        # Bobot ternormalisasi per panjang window (dihitung sekali, bukan tiap frame)
+        self._weights = {}
+        for n in range(3, window_size + 1):
+            weights = np.array(self.WEIGHTS[-n:])
+            weights = weights / weights.sum()
+            self._weights[n] = (weights, weights.sum())
     
     def update(self, value):
         self.window.append(value)
@@ -121,133 +378,1669 @@ class TemporalConsistencyFilter:
             return value
         
         # ✅ Median filter untuk menghilangkan outlier
-        median_val = np.median(self.window)
+        median_val = self.window.median()
         
         # ✅ Weighted average: beri bobot lebih pada nilai tengah
-        weights = np.array([0.1, 0.2, 0.4, 0.2, 0.1][-len(self.window):])
-        weights = weights / weights.sum()
-        weighted_avg = np.average(self.window, weights=weights)
+        weights, scale = self._weights[len(self.window)]
+        weighted_avg = sum(v * w for v, w in zip(self.window, weights.tolist())) / scale
         
         # Kombinasi median dan weighted average
         result = 0.6 * weighted_avg + 0.4 * median_val
         
         return result
+    
+    def filter_batch(self, values):
+        """Versi vektor dari update() untuk seluruh array; hasil identik dengan streaming"""
+        values = np.asarray(values, dtype=float)
+        result = values.copy()
+        size = self.window.maxlen
+        
+        # Window < 3 tidak pernah memfilter (sama dengan update()); cukup simpan nilai terakhir
+        if size < 3:
+            for value in values[-size:].tolist():
+                self.window.append(value)
+            return result
+        
+        # Frame awal saat window belum berisi size-1 nilai: jalur streaming biasa
+        start = 0
+        while start < len(values) and len(self.window) < size - 1:
+            result[start] = self.update(values[start])
+            start += 1
+        if start == len(values):
+            return result
+        
+        history = list(self.window)[-(size - 1):]
+        extended = np.concatenate([history, values[start:]])
+        windows = np.lib.stride_tricks.sliding_window_view(extended, size)
+        weights, scale = self._weights[size]
+        weighted_avg = (windows * weights).sum(axis=1) / scale
+        result[start:] = 0.6 * weighted_avg + 0.4 * np.median(windows, axis=1)
+        
+        # Simpan window terakhir agar streaming bisa dilanjutkan
+        for value in extended[-size:].tolist():
+            self.window.append(value)
+        return result
 
 # ==========================
-# ENHANCED DETECTION MANAGER
+# TRIPLE FILTER (STREAMING + BATCH)
 # ==========================
-class EnhancedDetectionManager:
-    def __init__(self, model_path, config):
-        self.model = YOLO(model_path)
-        self.config = config
+def smart_round(raw_count, kalman_filtered, history):
+    """Stage 3: jika perbedaan dengan raw count kecil, percaya raw count"""
+    diff = abs(kalman_filtered - raw_count)
+    if diff < 1.5 and len(history) > 5:
+        # Cek apakah raw count konsisten dengan history
+        recent_avg = np.mean(list(history)[-5:])
+        if abs(raw_count - recent_avg) < 3:
+            return int(round(raw_count))
+    return int(round(kalman_filtered))
+
+def filter_counts(raw_counts, temporal_window=5, temporal=None, kalman=None, history=None):
+    """Triple filter untuk seluruh array raw count (recount / replay data historis).
+    
+    Hasil identik dengan get_filtered_count() frame per frame. Filter dan history
+    bisa diberikan untuk melanjutkan state yang sudah ada; default mulai dari nol."""
+    raw_counts = np.asarray(raw_counts, dtype=float)
+    temporal = temporal or TemporalConsistencyFilter(window_size=temporal_window)
+    kalman = kalman or EnhancedKalmanFilter(log_outliers=False)
+    history = history if history is not None else deque(maxlen=20)
+    
+    temporal_series = temporal.filter_batch(raw_counts)
+    kalman_series = kalman.filter_batch(temporal_series)
+    
+    final = np.empty(len(raw_counts), dtype=int)
+    for i, (raw, filtered) in enumerate(zip(raw_counts.tolist(), kalman_series.tolist())):
+        count = smart_round(raw, filtered, history)
+        history.append(count)
+        final[i] = count
+    
+    return {"temporal": temporal_series, "kalman": kalman_series, "final": final}
+
+# ==========================
+# PER-DEVICE TRAP STATE
+# ==========================
+class TrapState:
+    """State filter dan buffer grafik untuk satu trap (ESP32-CAM)"""
+    def __init__(self, device_id, config):
+        self.device_id = device_id
         self.kalman = EnhancedKalmanFilter()
         self.temporal = TemporalConsistencyFilter(window_size=config.TEMPORAL_WINDOW)
         
         # ✅ Track detection history untuk confidence boosting
         self.detection_history = deque(maxlen=20)
+        self.last_temporal = 0.0
+        self.last_seen = time.time()
+        
+        # Incremental inference: frame referensi (gray kecil) + box terakhir
+        self.incremental = IncrementalState()
+        self.tracker = BoxTracker(config) if config.TRACKING else None
+        
+        # Ring buffer untuk grafik (prealokasi, statistik rolling O(1))
+        self.series = {
+            "raw": RollingSeries(config.BUFFER_SIZE),
+            "temporal": RollingSeries(config.BUFFER_SIZE),
+            "filtered": RollingSeries(config.BUFFER_SIZE),
+        }
+        self.frame_index = 0
+    
+    def graph_snapshot(self):
+        """Salinan kecil buffer grafik untuk dirender di thread lain"""
+        snapshot = {name: series.snapshot() for name, series in self.series.items()}
+        snapshot["frame_index"] = self.frame_index
+        return snapshot
+
+class IncrementalState:
+    """Referensi change detection satu trap: gray kecil frame terakhir + box (Nx6) di koordinatnya"""
+    def __init__(self):
+        self.reference = None
+        self.boxes = np.zeros((0, 6), dtype=np.float32)
+        self.since_full = 0
+        self.window = None  # Hanning window phaseCorrelate (per ukuran frame)
+        self.lock = threading.Lock()
+    
+    def reset(self, reference, boxes):
+        self.reference = reference
+        self.boxes = boxes
+        self.since_full = 0
+
+class TrapRegistry:
+    """Registry TrapState per device ID, dengan eviction device yang idle"""
+    def __init__(self, config):
+        self.config = config
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        self.on_evict = []  # callback(device_id): data lain per device ikut dibuang
+    
+    def get(self, device_id):
+        with self._lock:
+            self._evict_idle()
+            state = self._states.get(device_id)
+            if state is None:
+                state = TrapState(device_id, self.config)
+                self._states[device_id] = state
+                logger.info(f"🪤 New trap registered: {device_id}")
+                # Batasi jumlah device: buang yang paling lama tidak aktif
+                while len(self._states) > self.config.MAX_DEVICES:
+                    old_id, _ = self._states.popitem(last=False)
+                    logger.warning(f"⚠️  Too many traps, evicting {old_id}")
+                    self._evicted(old_id)
+            self._states.move_to_end(device_id)
+            state.last_seen = time.time()
+            return state
+    
+    def _evict_idle(self):
+        now = time.time()
+        idle = [d for d, st in self._states.items()
+                if now - st.last_seen > self.config.DEVICE_IDLE_TIMEOUT]
+        for device_id in idle:
+            del self._states[device_id]
+            logger.info(f"🧹 Evicted idle trap: {device_id}")
+            self._evicted(device_id)
+    
+    def _evicted(self, device_id):
+        for callback in self.on_evict:
+            callback(device_id)
+    
+    def devices(self):
+        with self._lock:
+            return list(self._states)
+    
+    def states(self):
+        with self._lock:
+            return list(self._states.values())
+    
+    def __len__(self):
+        return len(self._states)
+
+# ==========================
+# BOX UTILITIES
+# ==========================
+def box_iou(a, b, over_smaller=False):
+    """Matriks IoU (atau intersection-over-smaller) antara box xyxy a (N,4) dan b (M,4)"""
+    # Per koordinat (array 2D N x M), lebih cepat dari broadcast (N, M, 2)
+    ax1, ay1, ax2, ay2 = (a[:, i, None] for i in range(4))
+    bx1, by1, bx2, by2 = b.T
+    iw = np.minimum(ax2, bx2) - np.maximum(ax1, bx1)
+    ih = np.minimum(ay2, by2) - np.maximum(ay1, by1)
+    inter = np.maximum(iw, 0) * np.maximum(ih, 0)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    if over_smaller:
+        denom = np.minimum(area_a[:, None], area_b[None, :])
+    else:
+        denom = area_a[:, None] + area_b[None, :] - inter
+    return inter / np.maximum(denom, 1e-9)
+
+def cover_windows(rects, window, height, width):
+    """Origin window (window x window) yang menutup semua rect xyxy, di-clip ke dalam frame"""
+    def starts(lo, hi, length):
+        size = min(window, length)
+        last = min(max(hi - size, lo), length - size)
+        points = list(range(max(lo, 0), last + 1, size)) or [max(min(lo, length - size), 0)]
+        if points[-1] < last:
+            points.append(last)
+        return points
+    
+    origins = set()
+    for x1, y1, x2, y2 in rects:
+        for y in starts(y1, y2, height):
+            for x in starts(x1, x2, width):
+                origins.add((x, y))
+    return sorted(origins)
+
+def nms(boxes, scores, threshold, over_smaller=False, sources=None):
+    """Greedy NMS, return index box yang dipertahankan (urut skor tertinggi).
+    
+    sources (id tile per box): hanya box dari sumber berbeda yang saling menekan, box
+    yang sudah lolos NMS model di satu tile (serangga berhimpit) tidak disentuh."""
+    order = np.argsort(-scores)
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        if order.size == 1:
+            break
+        suppress = box_iou(boxes[i:i + 1], boxes[order[1:]], over_smaller)[0] > threshold
+        if sources is not None:
+            suppress &= sources[order[1:]] != sources[i]
+        order = order[1:][~suppress]
+    return np.array(keep, dtype=int)
+
+# ==========================
+# MODEL BACKEND
+# ==========================
+EXPORT_FORMATS = {
+    "onnx": ("onnx", ".onnx"),
+    "openvino": ("openvino", "_openvino_model"),
+}
+
+INT8_SUFFIXES = {
+    "onnx": "_int8.onnx",
+    "openvino": "_int8_openvino_model",
+}
+
+def resolve_model_path(model_path, config):
+    """Path model untuk Config.BACKEND; export dari .pt jika belum ada"""
+    if config.BACKEND == "pytorch":
+        if config.MODEL_PRECISION != "fp32":
+            raise ValueError("MODEL_PRECISION int8 butuh BACKEND onnx atau openvino")
+        return model_path
+    if config.BACKEND not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown BACKEND: {config.BACKEND}")
+    
+    source = Path(model_path)
+    if config.MODEL_PRECISION == "int8":
+        quantized = source.with_name(source.stem + INT8_SUFFIXES[config.BACKEND])
+        if not quantized.exists():
+            raise FileNotFoundError(f"{quantized} belum ada, jalankan quantize_model.py")
+        return str(quantized)
+    
+    fmt, suffix = EXPORT_FORMATS[config.BACKEND]
+    exported = source.with_name(source.stem + suffix)
+    # Export ulang jika .pt lebih baru (model di-retrain / hot reload)
+    if not exported.exists() or exported.stat().st_mtime < source.stat().st_mtime:
+        logger.info(f"📦 Exporting {source.name} to {fmt}...")
+        exported = Path(ultralytics.YOLO(model_path).export(
+            format=fmt, imgsz=config.IMG_SIZE, dynamic=True, half=False
+        ))
+    return str(exported)
+
+# ==========================
+# BOX TRACKER (VECTORIZED)
+# ==========================
+class BoxTracker:
+    """Asosiasi box antar frame satu trap dengan cost matrix IoU/centroid.
+    
+    State track disimpan sebagai array paralel (box, id, hits, misses) sehingga
+    update untuk ratusan serangga (MAX_DET) tetap beberapa operasi numpy. Assignment
+    optimal dengan scipy jika tersedia, selain itu greedy dari cost terkecil.
+    """
+    INVALID = 1e6
+    
+    def __init__(self, config):
+        self.config = config
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.hits = np.zeros(0, dtype=np.int32)
+        self.misses = np.zeros(0, dtype=np.int32)
+        self.next_id = 0
+        self.arrivals = 0  # kumulatif track yang pernah terkonfirmasi
+    
+    def update(self, detections):
+        """detections (N,4) xyxy -> (total di trap, baru sejak frame sebelumnya)"""
+        c = self.config
+        detections = np.asarray(detections, dtype=np.float32).reshape(-1, 4)
+        rows, cols = self.match(self.boxes, detections)
+        
+        was_confirmed = self.hits >= c.TRACK_MIN_HITS
+        self.boxes[rows] = detections[cols]
+        self.hits[rows] += 1
+        self.misses += 1
+        self.misses[rows] = 0
+        
+        # Track yang baru mencapai TRACK_MIN_HITS = kedatangan baru
+        new = int(np.count_nonzero((self.hits >= c.TRACK_MIN_HITS) & ~was_confirmed))
+        
+        alive = self.misses <= c.TRACK_MAX_MISSES
+        unmatched = np.ones(len(detections), dtype=bool)
+        unmatched[cols] = False
+        n = int(unmatched.sum())
+        self.boxes = np.concatenate([self.boxes[alive], detections[unmatched]])
+        self.ids = np.concatenate([self.ids[alive], np.arange(self.next_id, self.next_id + n)])
+        self.hits = np.concatenate([self.hits[alive], np.ones(n, dtype=np.int32)])
+        self.misses = np.concatenate([self.misses[alive], np.zeros(n, dtype=np.int32)])
+        self.next_id += n
+        if c.TRACK_MIN_HITS <= 1:
+            new += n
+        self.arrivals += new
+        return self.total, new
+    
+    @property
+    def total(self):
+        return int(np.count_nonzero(self.hits >= self.config.TRACK_MIN_HITS))
+    
+    def cost_matrix(self, tracks, detections):
+        """1 - IoU; pasangan tanpa overlap memakai jarak centroid (>= 1), di luar gate = INVALID"""
+        iou = box_iou(tracks, detections)
+        ct = (tracks[:, :2] + tracks[:, 2:]) / 2
+        cd = (detections[:, :2] + detections[:, 2:]) / 2
+        dist = np.hypot(ct[:, 0, None] - cd[:, 0], ct[:, 1, None] - cd[:, 1])
+        max_dist = self.config.TRACK_MAX_DISTANCE
+        cost = np.where(iou >= self.config.TRACK_IOU_MIN, 1 - iou, 1 + dist / max_dist)
+        cost[(iou < self.config.TRACK_IOU_MIN) & (dist > max_dist)] = self.INVALID
+        return cost
+    
+    def match(self, tracks, detections):
+        """(index track, index deteksi) yang dipasangkan"""
+        empty = np.zeros(0, dtype=np.int64)
+        if not len(tracks) or not len(detections):
+            return empty, empty
+        cost = self.cost_matrix(tracks, detections)
+        try:
+            # Import di sini (scipy opsional, tidak ikut dimuat saat startup)
+            from scipy.optimize import linear_sum_assignment
+        except ImportError:  # tanpa scipy: greedy matching
+            rows, cols = self._greedy(cost)
+        else:
+            rows, cols = linear_sum_assignment(cost)
+        valid = cost[rows, cols] < self.INVALID
+        return rows[valid], cols[valid]
+    
+    def _greedy(self, cost):
+        # Hanya pasangan di dalam gate yang diurutkan (biasanya beberapa per track)
+        r, c = np.nonzero(cost < self.INVALID)
+        order = np.argsort(cost[r, c], kind="stable")
+        used_r = np.zeros(cost.shape[0], dtype=bool)
+        used_c = np.zeros(cost.shape[1], dtype=bool)
+        rows, cols = [], []
+        for i, j in zip(r[order].tolist(), c[order].tolist()):
+            if not used_r[i] and not used_c[j]:
+                used_r[i] = used_c[j] = True
+                rows.append(i)
+                cols.append(j)
+        return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
+
+# ==========================
+# INFERENCE ENGINES
+# ==========================
+def predict_kwargs(config, augment, imgsz=None):
+    """Parameter model.predict yang sama untuk inference, warm-up, dan daemon"""
+    return dict(
+        device="cpu",
+        conf=config.CONFIDENCE_THRESHOLD,
+        iou=config.IOU_THRESHOLD,
+        imgsz=imgsz or config.IMG_SIZE,
+        augment=augment,  # Test-time augmentation
+        agnostic_nms=config.AGNOSTIC_NMS,
+        max_det=config.MAX_DET,
+        verbose=False,
+        show=False
+    )
+
+def warmup_passes(config):
+    """Variasi predict yang akan dipakai (biasa, TTA, tile) untuk dipanaskan saat start"""
+    if not config.WARMUP:
+        return []
+    passes = [(config.IMG_SIZE, predict_kwargs(config, config.AUGMENT is True))]
+    if config.BACKEND == "pytorch" and config.AUGMENT == "adaptive":
+        passes.append((config.IMG_SIZE, predict_kwargs(config, True)))
+    if config.TILED:
+        passes.append((config.TILE_IMG_SIZE, predict_kwargs(config, False, config.TILE_IMG_SIZE)))
+    return passes
+
+def run_warmup(predict, passes):
+    start = time.perf_counter()
+    for size, kwargs in passes:
+        predict([np.full((size, size, 3), 114, dtype=np.uint8)], **kwargs)
+    return (time.perf_counter() - start) * 1000
+
+def model_version(model_path):
+    """Path + mtime: berubah saat file model diganti"""
+    return f"{model_path}@{os.path.getmtime(model_path) if os.path.exists(model_path) else 0}"
+
+def result_from_array(img, data, names):
+    """Results Ultralytics dari array Nx6 (xyxy, conf, cls) hasil worker/daemon"""
+    return ultralytics_results.Results(orig_img=img, path="", names=names, boxes=data)
+
+def boxes_array(result):
+    """Box Nx6 (xyxy, conf, cls) sebagai ndarray; Results bisa berbasis tensor (model lokal)
+    atau ndarray (result_from_array), dan ndarray tidak punya .cpu()"""
+    if result.boxes is None:
+        return np.zeros((0, 6), np.float32)
+    return result.boxes.cpu().numpy().data
+
+class LocalInferenceEngine:
+    """Inference di proses ini; satu model dipakai bergantian (lock)"""
+    def __init__(self, model_path):
+        self.model = ultralytics.YOLO(model_path, task="detect")
+        self.names = self.model.names
+        self.version = model_version(model_path)
+        self._lock = threading.Lock()
+    
+    def predict(self, images, **kwargs):
+        with self._lock:
+            return self.model.predict(source=images, **kwargs)
+    
+    def warmup(self, passes):
+        return run_warmup(self.predict, passes)
+    
+    def shutdown(self):
+        pass
+
+_worker_model = None
+
+def _init_inference_worker(model_path, passes=()):
+    global _worker_model
+    _worker_model = ultralytics.YOLO(model_path, task="detect")
+    # Tiap worker memanaskan modelnya sendiri saat di-spawn
+    run_warmup(lambda images, **kwargs: _worker_model.predict(source=images, **kwargs), passes)
+
+def _worker_names():
+    return _worker_model.names
+
+def _worker_predict(images, kwargs):
+    results = _worker_model.predict(source=images, **kwargs)
+    # Kirim balik array (xyxy, conf, cls) saja, bukan objek Results
+    return [r.boxes.data.cpu().numpy() if r.boxes is not None else np.zeros((0, 6), np.float32)
+            for r in results]
+
+class ProcessInferenceEngine:
+    """Inference di process pool; tiap worker memuat model sendiri sehingga skala ke banyak core"""
+    def __init__(self, model_path, processes, passes=()):
+        self.pool = ProcessPoolExecutor(
+            processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_inference_worker,
+            initargs=(model_path, list(passes))
+        )
+        self.names = self.pool.submit(_worker_names).result()
+        self.version = model_version(model_path)
+        logger.info(f"⚙️  Inference process pool: {processes} workers")
+    
+    def predict(self, images, **kwargs):
+        outputs = self.pool.submit(_worker_predict, images, kwargs).result()
+        return [result_from_array(img, data, self.names) for img, data in zip(images, outputs)]
+    
+    def warmup(self, passes):
+        return None  # sudah dilakukan initializer tiap worker
+    
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+class RemoteInferenceEngine:
+    """Client inference daemon lewat socket lokal (satu koneksi per thread pemanggil)"""
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+        self._connections = []
+        hello = self._connection().recv()
+        self.names = hello["names"]
+        self.version = hello["version"]
+        # Import ultralytics (untuk objek Results) di background, bukan di frame pertama
+        threading.Thread(target=lambda: ultralytics_results.Results, name="prefetch-import", daemon=True).start()
+        logger.info(f"🔗 Using inference daemon {address[0]}:{address[1]} ({hello['model']})")
+    
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = Client(self.address, authkey=self.authkey)
+            self._connections.append(conn)
+            if hasattr(self, "names"):
+                conn.recv()  # hello koneksi baru
+        return conn
+    
+    def predict(self, images, **kwargs):
+        conn = self._connection()
+        try:
+            conn.send((images, kwargs))
+            status, payload = conn.recv()
+        except (EOFError, OSError):
+            self._local.conn = None  # daemon restart: koneksi baru di panggilan berikutnya
+            raise
+        if status != "ok":
+            raise RuntimeError(f"Inference daemon error: {payload}")
+        return [result_from_array(img, data, self.names) for img, data in zip(images, payload)]
+    
+    def warmup(self, passes):
+        return None  # daemon sudah warm
+    
+    def shutdown(self):
+        for conn in self._connections:
+            conn.close()
+
+INSECURE_AUTHKEYS = {b"", b"pherotrap"}
+
+def daemon_authkey(config, create=False):
+    """Authkey inference daemon: INFERENCE_DAEMON_AUTHKEY (env) atau isi INFERENCE_DAEMON_KEY_FILE.
+    
+    create=True (daemon): file key acak dibuat dengan mode 0600 jika belum ada.
+    Key default lama / kosong dan file yang bisa dibaca user lain ditolak (ValueError);
+    file belum ada di front-end = FileNotFoundError (daemon belum pernah jalan)."""
+    key = config.INFERENCE_DAEMON_AUTHKEY
+    if key:
+        key = key.encode() if isinstance(key, str) else bytes(key)
+    else:
+        path = Path(config.INFERENCE_DAEMON_KEY_FILE)
+        if create and not path.exists():
+            path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+            logger.info(f"🔑 Inference daemon key created: {path}")
+        if path.stat().st_mode & 0o077:
+            raise ValueError(f"Key file {path} bisa dibaca user lain, jalankan: chmod 600 {path}")
+        key = path.read_bytes().strip()
+    if key in INSECURE_AUTHKEYS:
+        raise ValueError("Authkey inference daemon kosong atau default, set key rahasia")
+    return key
+
+def create_engine(model_path, config):
+    """Pilih engine: daemon (jika aktif dan bisa dihubungi), process pool, atau lokal"""
+    if config.INFERENCE_DAEMON:
+        address = (config.INFERENCE_DAEMON_HOST, config.INFERENCE_DAEMON_PORT)
+        try:
+            return RemoteInferenceEngine(address, daemon_authkey(config))
+        except OSError as e:
+            logger.warning(f"⚠️  Inference daemon {address[0]}:{address[1]} tidak aktif ({e}), memuat model lokal")
+    
+    model_path = resolve_model_path(model_path, config)
+    start = time.perf_counter()
+    if config.INFERENCE_PROCESSES > 0:
+        engine = ProcessInferenceEngine(model_path, config.INFERENCE_PROCESSES, warmup_passes(config))
+    else:
+        engine = LocalInferenceEngine(model_path)
+    logger.info(f"✅ Model loaded: {model_path} ({config.BACKEND}, {config.MODEL_PRECISION}) "
+                f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return engine
+
+# ==========================
+# MODEL HOT RELOAD (WATCH)
+# ==========================
+class ModelWatcher:
+    """Polling mtime + ukuran file model; callback setelah file stabil satu interval
+    (file yang masih disalin tidak ikut dimuat)"""
+    def __init__(self, path, interval, callback):
+        self.path = path
+        self.interval = interval
+        self.callback = callback
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="model-watch", daemon=True)
+    
+    def start(self):
+        self._thread.start()
+        logger.info(f"👀 Watching model: {self.path} (every {self.interval:.0f}s)")
+        return self
+    
+    def stop(self):
+        self._stop.set()
+    
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+    
+    def _run(self):
+        loaded = self._stat()
+        pending = None
+        while not self._stop.wait(self.interval):
+            current = self._stat()
+            if current is None or current == loaded:
+                pending = None
+                continue
+            if current != pending:
+                pending = current  # berubah: tunggu satu interval lagi sampai stabil
+                continue
+            loaded, pending = current, None
+            try:
+                self.callback(self.path)
+            except Exception as e:
+                logger.error(f"Model reload error: {e}", exc_info=True)
+
+# ==========================
+# INFERENCE DAEMON
+# ==========================
+class InferenceDaemon:
+    """Proses berumur panjang yang memegang model; front-end kalyol.py connect lewat socket.
+    
+    Protokol (multiprocessing.connection, authkey): hello {names, version, model}, lalu
+    (images, predict_kwargs) -> ("ok", [array Nx6]) atau ("error", pesan)."""
+    def __init__(self, model_path, config):
+        self.config = config
+        self.model_path = model_path
+        config.INFERENCE_DAEMON = False  # daemon selalu memuat model sendiri
+        self.engine = create_engine(model_path, config)
+        elapsed = self.engine.warmup(warmup_passes(config))
+        if elapsed:
+            logger.info(f"🔥 Model warm-up: {elapsed:.0f} ms")
+    
+    def serve(self):
+        address = (self.config.INFERENCE_DAEMON_HOST, self.config.INFERENCE_DAEMON_PORT)
+        with Listener(address, authkey=daemon_authkey(self.config, create=True)) as listener:
+            logger.info(f"🧠 Inference daemon listening on {address[0]}:{address[1]}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    logger.error(f"Daemon accept error: {e}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+    
+    def _handle(self, conn):
+        try:
+            conn.send({"names": self.engine.names, "version": self.engine.version, "model": self.model_path})
+            while True:
+                images, kwargs = conn.recv()
+                try:
+                    results = self.engine.predict(images, **kwargs)
+                    payload = [r.boxes.data.cpu().numpy() if r.boxes is not None else np.zeros((0, 6), np.float32)
+                               for r in results]
+                    conn.send(("ok", payload))
+                except Exception as e:
+                    logger.error(f"Daemon inference error: {e}", exc_info=True)
+                    conn.send(("error", str(e)))
+        except (EOFError, OSError):
+            pass  # front-end menutup koneksi / restart
+        finally:
+            conn.close()
+
+# ==========================
+# STAGE METRICS & SAMPLING PROFILER
+# ==========================
+class StageMetrics:
+    """Waktu per stage: histogram kumulatif (Prometheus) + sampel terakhir untuk persentil"""
+    BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+    
+    def __init__(self, window=1000):
+        self.window = window
+        self.started = time.time()
+        self._stages = {}
+        self._frames = deque(maxlen=window)  # timestamp frame selesai dihitung
+        self._frame_total = 0
+        self._gauges = {}  # nama -> fungsi tanpa argumen (kedalaman antrian, dll.)
+        self._lock = threading.Lock()
+    
+    def register_gauge(self, name, fn):
+        self._gauges[name] = fn
+    
+    def _read_gauges(self):
+        values = {}
+        for name, fn in list(self._gauges.items()):
+            try:
+                values[name] = float(fn())
+            except Exception:
+                pass
+        return values
+    
+    def observe(self, stage, ms):
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = {
+                    "count": 0, "sum": 0.0,
+                    "buckets": [0] * (len(self.BUCKETS_MS) + 1),
+                    "recent": deque(maxlen=self.window),
+                }
+            entry["count"] += 1
+            entry["sum"] += ms
+            entry["buckets"][bisect.bisect_left(self.BUCKETS_MS, ms)] += 1
+            entry["recent"].append(ms)
+    
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, (time.perf_counter() - start) * 1000)
+    
+    def frame(self):
+        with self._lock:
+            self._frames.append(time.time())
+            self._frame_total += 1
+    
+    def fps(self, horizon=60.0):
+        now = time.time()
+        with self._lock:
+            recent = [t for t in self._frames if now - t <= horizon]
+        if len(recent) < 2:
+            return 0.0
+        return (len(recent) - 1) / max(recent[-1] - recent[0], 1e-6)
+    
+    @staticmethod
+    def rss_bytes():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            import resource  # macOS: ru_maxrss dalam byte (puncak, bukan saat ini)
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    
+    def snapshot(self):
+        with self._lock:
+            stages = {name: (e["count"], e["sum"], list(e["recent"])) for name, e in self._stages.items()}
+            frames = self._frame_total
+        report = {
+            "uptime_s": time.time() - self.started,
+            "frames": frames,
+            "fps": self.fps(),
+            "rss_mb": self.rss_bytes() / 1e6,
+            "gauges": self._read_gauges(),
+            "stages": {},
+        }
+        for name, (count, total, recent) in stages.items():
+            p50, p95, p99 = np.percentile(recent, [50, 95, 99]) if len(recent) else (0, 0, 0)
+            report["stages"][name] = {
+                "count": count, "mean_ms": total / count,
+                "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99),
+            }
+        return report
+    
+    def prometheus(self):
+        """Format teks Prometheus (histogram dalam detik)"""
+        lines = [
+            "# TYPE pherotrap_stage_seconds histogram",
+        ]
+        with self._lock:
+            stages = {name: (e["count"], e["sum"], list(e["buckets"])) for name, e in self._stages.items()}
+            frames = self._frame_total
+        for name, (count, total, buckets) in sorted(stages.items()):
+            cumulative = 0
+            for bound, n in zip(self.BUCKETS_MS + (float("inf"),), buckets):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound / 1000:g}"
+                lines.append(f'pherotrap_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'pherotrap_stage_seconds_sum{{stage="{name}"}} {total / 1000:.6f}')
+            lines.append(f'pherotrap_stage_seconds_count{{stage="{name}"}} {count}')
+        lines += [
+            "# TYPE pherotrap_frames_total counter",
+            f"pherotrap_frames_total {frames}",
+            "# TYPE pherotrap_fps gauge",
+            f"pherotrap_fps {self.fps():.3f}",
+            "# TYPE pherotrap_rss_bytes gauge",
+            f"pherotrap_rss_bytes {self.rss_bytes()}",
+        ]
+        for name, value in sorted(self._read_gauges().items()):
+            lines += [f"# TYPE pherotrap_{name} gauge", f"pherotrap_{name} {value:g}"]
+        return "\n".join(lines) + "\n"
+    
+    def start_dump(self, path, interval):
+        """Tulis snapshot JSON tiap interval detik (rename atomik)"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    tmp = f"{path}.tmp"
+                    with open(tmp, "w") as f:
+                        json.dump(self.snapshot(), f, indent=2)
+                    os.replace(tmp, path)
+                except Exception as e:
+                    logger.error(f"Metrics dump error: {e}")
+        threading.Thread(target=loop, name="metrics-dump", daemon=True).start()
+
+class SamplingProfiler:
+    """Sampling profiler lintas thread via sys._current_frames().
+    
+    cProfile hanya melihat satu thread; pipeline berjalan di banyak thread. Output
+    berformat collapsed stack (thread;fungsi;... jumlah) untuk flamegraph / speedscope."""
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.counts = {}
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+    
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = [f"{f.name} ({Path(f.filename).name}:{f.lineno})"
+                         for f in traceback.extract_stack(frame)]
+                key = ";".join([names.get(ident, str(ident))] + stack)
+                self.counts[key] = self.counts.get(key, 0) + 1
+    
+    def collapsed(self):
+        return "".join(f"{stack} {n}\n" for stack, n in sorted(self.counts.items(), key=lambda kv: -kv[1]))
+    
+    def dump(self, path):
+        with open(path, "w") as f:
+            f.write(self.collapsed())
+
+# ==========================
+# RESULT CACHE (CONTENT HASH + PERCEPTUAL HASH)
+# ==========================
+def dhash(img, size=8):
+    """Difference hash 64-bit: tahan terhadap noise JPEG kecil antar shot"""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+class ResultCache:
+    """LRU cache hasil deteksi, key = sha1(bytes frame) + device + versi model/config.
+    
+    Device ikut di key: frame identik dari trap lain bukan duplikat bagi trap ini (filter
+    dan baris store trap itu tetap berjalan).
+    
+    Entri hanya box Nx6 (xyxy, conf, cls) + names, bukan Results (yang membawa frame
+    resolusi penuh); Results dibangun ulang saat hit lewat result_from_array."""
+    def __init__(self, maxsize, perceptual=False, threshold=4):
+        self.maxsize = maxsize
+        self.perceptual = perceptual
+        self.threshold = threshold
+        self._entries = OrderedDict()
+        self._last = {}  # device_id -> (version, dhash, entry) frame terakhir yang diinferensi
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "perceptual_hits": 0, "misses": 0}
+    
+    def lookup(self, data, version, device_id, image=None):
+        """Return (key, phash, entry); entry (boxes, names) atau None jika frame perlu diinferensi"""
+        key = f"{version}:{device_id}:{hashlib.sha1(data).hexdigest()}"
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return key, None, entry
+        
+        phash = dhash(image) if self.perceptual and image is not None else None
+        with self._lock:
+            last = self._last.get(device_id)
+            if phash is not None and last is not None and last[0] == version:
+                if bin(phash ^ last[1]).count("1") <= self.threshold:
+                    self.stats["perceptual_hits"] += 1
+                    return key, phash, last[2]
+            self.stats["misses"] += 1
+        return key, phash, None
+    
+    def put(self, key, version, device_id, result, phash=None):
+        entry = (boxes_array(result), result.names)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            if phash is not None:
+                self._last[device_id] = (version, phash, entry)
+    
+    def forget(self, device_id):
+        """Dipanggil saat trap di-evict dari TrapRegistry"""
+        with self._lock:
+            self._last.pop(device_id, None)
+
+# ==========================
+# ENHANCED DETECTION MANAGER
+# ==========================
+class EnhancedDetectionManager:
+    def __init__(self, model_path, config, engine=None):
+        # engine: engine yang sudah dibuat (mis. detector sintetis di benchmark.py --check-merge)
+        self.engine = engine or create_engine(model_path, config)
+        self.config = config
         
-        logger.info(f"✅ Model loaded: {model_path}")
+        # Hot reload: engine sebelumnya tetap dimuat untuk rollback instan
+        self.model_path = model_path
+        self.previous = None               # (engine, path)
+        self.last_reload = None            # ringkasan reload/rollback terakhir (GET /admin/model)
+        self._reload_lock = threading.Lock()
+        self._engine_lock = threading.Lock()  # swap engine vs batch yang mengambil engine
+        
+        # State filter per trap (Kalman, temporal, history)
+        self.traps = TrapRegistry(config)
+        
+        # ✅ Objek preprocessing dibuat sekali, bukan per frame
+        # (CLAHE tidak thread-safe, jadi satu objek per thread preprocess)
+        self._local = threading.local()
+        self.sharpen_kernel = np.array([[-1,-1,-1],
+                                        [-1, 9,-1],
+                                        [-1,-1,-1]], dtype=np.float32) * 0.3
+        self.preprocess_stages = self._build_preprocess_stages(config.PREPROCESS_MODE)
+        self.last_preprocess_timing = {}
+        
+        # Statistik adaptive TTA (berapa sering jalur mahal dipakai)
+        self.tta_stats = {"frames": 0, "tta": 0}
+        self._tta_lock = threading.Lock()  # batch dari beberapa thread kamera
+        # Statistik incremental: full re-detect, deteksi per window, atau box dipakai ulang saja
+        self.incremental_stats = {"full": 0, "windows": 0, "reused": 0}
+        
+        # Waktu per stage (decode, preprocess_*, predict, ...) untuk /metrics
+        self.metrics = StageMetrics(config.METRICS_WINDOW)
+        
+        # Cache hasil per isi frame; versi model ikut di key agar model baru tidak memakai hasil lama
+        self.model_version = self.engine.version
+        self.cache = None
+        if config.RESULT_CACHE_SIZE > 0:
+            self.cache = ResultCache(
+                config.RESULT_CACHE_SIZE, config.PERCEPTUAL_HASH, config.PERCEPTUAL_HASH_THRESHOLD
+            )
+            self.traps.on_evict.append(self.cache.forget)
+        
+        # Warm-up di sini, bukan di frame pertama (alokasi + graph backend)
+        elapsed = self.engine.warmup(warmup_passes(config))
+        if elapsed:
+            logger.info(f"🔥 Model warm-up: {elapsed:.0f} ms")
+        
+        if config.BACKEND != "pytorch" and config.AUGMENT:
+            logger.warning("⚠️  TTA tidak didukung backend hasil export, augment diabaikan")
         logger.info(f"   Confidence threshold: {config.CONFIDENCE_THRESHOLD}")
         logger.info(f"   IOU threshold: {config.IOU_THRESHOLD}")
+        logger.info(f"   Preprocess: {config.PREPROCESS_MODE}")
+    
+    def load_image(self, source):
+        """Terima path file, bytes JPEG/PNG mentah, atau ndarray BGR"""
+        if isinstance(source, np.ndarray):
+            return source
+        with self.metrics.timer("decode"):
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                # ✅ Decode langsung dari memory buffer, tanpa menyentuh disk
+                return cv2.imdecode(np.frombuffer(source, dtype=np.uint8), cv2.IMREAD_COLOR)
+            return cv2.imread(str(source))
+    
+    def cache_version(self):
+        """Model + parameter yang memengaruhi hasil deteksi (dihitung ulang, config bisa berubah)"""
+        c = self.config
+        return hashlib.sha1(repr((
+            self.model_version, c.BACKEND, c.MODEL_PRECISION, c.CONFIDENCE_THRESHOLD, c.IOU_THRESHOLD,
+            c.IMG_SIZE, c.AUGMENT, c.AGNOSTIC_NMS, c.MAX_DET, c.PREPROCESS_MODE, c.FAST_DENOISE,
+            c.TILED, c.TILE_SIZE, c.TILE_OVERLAP, c.TILE_IMG_SIZE, c.TILE_MERGE_THRESHOLD, c.INCREMENTAL,
+        )).encode()).hexdigest()[:12]
+    
+    def lookup_cache(self, source, device_id):
+        """Cek cache sebelum preprocess.
+        
+        Return (source, cache_key, result): source bisa diganti bytes/ndarray yang sudah
+        dibaca agar file tidak dibaca dua kali; result None berarti perlu inferensi."""
+        if self.cache is None:
+            return source, None, None
+        if isinstance(source, np.ndarray):
+            data = source.tobytes()
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            data = source
+        else:
+            try:
+                data = source = Path(source).read_bytes()
+            except OSError:
+                return source, None, None
+        
+        image = None
+        if self.cache.perceptual:
+            image = self.load_image(source)
+            if image is None:
+                return source, None, None
+            source = image
+        
+        version = self.cache_version()
+        with self.metrics.timer("cache_lookup"):
+            key, phash, entry = self.cache.lookup(data, version, device_id, image)
+        if entry is None:
+            return source, (key, version, phash), None
+        
+        # Hit: decode frame untuk overlay (preprocess tidak mengubah geometri box)
+        if image is None:
+            image = self.load_image(source)
+            if image is None:
+                return source, None, None
+        boxes, names = entry
+        return image, (key, version, phash), result_from_array(image, boxes, names)
     
-    def preprocess_image(self, image_path):
+    def store_cache(self, cache_key, device_id, result):
+        if self.cache is None or cache_key is None or result is None:
+            return
+        key, version, phash = cache_key
+        self.cache.put(key, version, device_id, result, phash)
+    
+    def preprocess_image(self, source):
         """✅ Preprocessing untuk meningkatkan kualitas deteksi"""
-        img = cv2.imread(image_path)
+        img = self.load_image(source)
         if img is None:
             return None
+        return self._apply_preprocess(img)
+    
+    def prepare_image(self, source):
+        """Stage preprocess pipeline: mode incremental hanya decode, preprocess per region nanti"""
+        if self.config.INCREMENTAL:
+            return self.load_image(source)
+        return self.preprocess_image(source)
+    
+    def _apply_preprocess(self, img, log=True):
+        timings = {}
+        for name, stage in self.preprocess_stages:
+            start = time.perf_counter()
+            img = stage(img)
+            timings[name] = (time.perf_counter() - start) * 1000
+            self.metrics.observe(f"preprocess_{name}", timings[name])
+        self.last_preprocess_timing = timings
+        
+        if log and self.config.LOG_PREPROCESS_TIMING and timings:
+            stages = ", ".join(f"{k} {v:.1f}ms" for k, v in timings.items())
+            logger.info(f"   Preprocess [{self.config.PREPROCESS_MODE}]: {stages}")
         
+        return img
+    
+    def _build_preprocess_stages(self, mode):
+        stages = {
+            "clahe": self._apply_clahe,
+            "nlm": self._denoise_nlm,
+            "bilateral": self._denoise_bilateral,
+            "gaussian": self._denoise_gaussian,
+            "sharpen": self._sharpen,
+        }
+        pipelines = {
+            "none": [],
+            "clahe": ["clahe"],
+            "fast": ["clahe", self.config.FAST_DENOISE, "sharpen"],
+            "full": ["clahe", "nlm", "sharpen"],
+        }
+        if mode not in pipelines:
+            raise ValueError(f"Unknown PREPROCESS_MODE: {mode}")
+        return [(name, stages[name]) for name in pipelines[mode]]
+    
+    def _apply_clahe(self, img):
         # 1. CLAHE untuk meningkatkan kontras
         lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
         l, a, b = cv2.split(lab)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        l = clahe.apply(l)
+        l = self._clahe().apply(l)
         enhanced = cv2.merge([l, a, b])
-        enhanced = cv2.cvtColor(enhanced, cv2.COLOR_LAB2BGR)
-        
+        return cv2.cvtColor(enhanced, cv2.COLOR_LAB2BGR)
+    
+    def _clahe(self):
+        clahe = getattr(self._local, "clahe", None)
+        if clahe is None:
+            clahe = self._local.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+        return clahe
+    
+    def _denoise_nlm(self, img):
         # 2. Slight denoising (hati-hati, jangan terlalu kuat)
-        denoised = cv2.fastNlMeansDenoisingColored(enhanced, None, 5, 5, 7, 15)
-        
+        return cv2.fastNlMeansDenoisingColored(img, None, 5, 5, 7, 15)
+    
+    def _denoise_bilateral(self, img):
+        # 2b. Denoise cepat yang tetap menjaga tepi serangga
+        return cv2.bilateralFilter(img, 5, 40, 40)
+    
+    def _denoise_gaussian(self, img):
+        # 2c. Denoise paling murah
+        return cv2.GaussianBlur(img, (3, 3), 0)
+    
+    def _sharpen(self, img):
         # 3. Slight sharpening
-        kernel = np.array([[-1,-1,-1],
-                          [-1, 9,-1],
-                          [-1,-1,-1]])
-        sharpened = cv2.filter2D(denoised, -1, kernel * 0.3)
-        
-        return sharpened
+        return cv2.filter2D(img, -1, self.sharpen_kernel)
     
-    def detect(self, image_path):
+    def detect(self, source, device_id=None):
         """✅ Enhanced detection dengan preprocessing dan augmentation"""
+        return self.detect_batch([source], [device_id])[0]
+    
+    def detect_batch(self, sources, device_ids):
+        """Deteksi beberapa frame (boleh dari trap berbeda) dalam satu model.predict"""
         
         # Preprocess
-        processed_img = self.preprocess_image(image_path)
-        if processed_img is None:
-            logger.error(f"Failed to load image: {image_path}")
-            return None
+        images = [self.prepare_image(source) for source in sources]
+        return self.detect_preprocessed(images, device_ids)
+    
+    def detect_preprocessed(self, images, device_ids):
+        """Inference untuk hasil prepare_image (None = gagal load)"""
+        # Satu batch selalu memakai satu engine, walau hot reload terjadi di tengahnya
+        with self._engine_lock:
+            self._local.engine = self.engine
+        try:
+            if self.config.INCREMENTAL:
+                return self._detect_incremental(images, device_ids)
+            return self._detect_full(images, device_ids)
+        finally:
+            self._local.engine = None
+    
+    @property
+    def active_engine(self):
+        return getattr(self._local, "engine", None) or self.engine
+    
+    def _detect_full(self, images, device_ids):
+        results = [None] * len(images)
+        valid = []
+        for i, img in enumerate(images):
+            if img is None:
+                logger.error(f"Failed to load image ({device_ids[i] or self.config.DEFAULT_DEVICE})")
+            else:
+                valid.append(i)
+        if not valid:
+            return results
+        
+        if self.config.TILED:
+            for i in valid:
+                results[i] = self._detect_tiled(images[i])
+            return results
+        
+        adaptive = self.config.AUGMENT == "adaptive" and self.config.BACKEND == "pytorch"
+        augment = self.config.AUGMENT is True
+        for i, result in zip(valid, self._predict([images[i] for i in valid], augment)):
+            results[i] = result
+        
+        if adaptive:
+            # Inference biasa dulu, TTA hanya sebagai fallback
+            retry = []
+            for i in valid:
+                reason = self._tta_reason(results[i], device_ids[i])
+                with self._tta_lock:
+                    self.tta_stats["frames"] += 1
+                    if reason:
+                        self.tta_stats["tta"] += 1
+                    frames, tta = self.tta_stats["frames"], self.tta_stats["tta"]
+                if reason:
+                    retry.append(i)
+                    logger.info(f"   🔁 TTA fallback ({reason})")
+                if frames % self.config.TTA_REPORT_EVERY == 0:
+                    logger.info(f"📊 TTA fallback rate: {tta / frames * 100:.1f}% "
+                                f"({tta}/{frames} frames)")
+            if retry:
+                for i, result in zip(retry, self._predict([images[i] for i in retry], augment=True)):
+                    results[i] = result
+        
+        return results
+    
+    def _predict(self, images, augment, imgsz=None):
+        # ✅ Run inference dengan parameter optimal (ndarray langsung ke model)
+        with self.metrics.timer("predict_tta" if augment else "predict"):
+            return self.active_engine.predict(images, **predict_kwargs(self.config, augment, imgsz))
+    
+    def _tta_reason(self, result, device_id=None):
+        """Alasan menjalankan TTA, atau None jika hasil inference biasa cukup"""
+        state = self.traps.get(device_id or self.config.DEFAULT_DEVICE)
+        count = len(result.boxes) if result.boxes is not None else 0
         
-        # Save temporary processed image
-        temp_path = "/tmp/processed_frame.jpg"
-        cv2.imwrite(temp_path, processed_img)
-        
-        # ✅ Run inference dengan parameter optimal
-        results = self.model.predict(
-            source=temp_path,
-            device="cpu",
-            conf=self.config.CONFIDENCE_THRESHOLD,
-            iou=self.config.IOU_THRESHOLD,
-            imgsz=self.config.IMG_SIZE,
-            augment=self.config.AUGMENT,  # Test-time augmentation
-            agnostic_nms=self.config.AGNOSTIC_NMS,
-            max_det=self.config.MAX_DET,
-            verbose=False,
-            show=False
-        )
+        if count > 0:
+            mean_conf = float(result.boxes.conf.mean())
+            if mean_conf < self.config.TTA_MIN_CONFIDENCE:
+                return f"low confidence {mean_conf:.2f}"
+        
+        if state.kalman.is_outlier(count):
+            return f"Kalman outlier {count}"
         
-        # Cleanup
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        if len(state.detection_history) >= 5:
+            recent_avg = np.mean(list(state.detection_history)[-5:])
+            if abs(count - recent_avg) > self.config.TTA_MAX_JUMP:
+                return f"jump {count} vs {recent_avg:.1f}"
         
-        return results[0]
+        return None
+    
+    def _tile_origins(self, height, width):
+        tile = self.config.TILE_SIZE
+        step = max(1, int(tile * (1 - self.config.TILE_OVERLAP)))
+        
+        def starts(length):
+            last = max(length - tile, 0)
+            points = list(range(0, last + 1, step))
+            if points[-1] != last:
+                points.append(last)
+            return points
+        
+        return [(x, y) for y in starts(height) for x in starts(width)]
     
-    def get_filtered_count(self, raw_count):
-        """✅ Triple filtering: Temporal → Kalman → Round"""
+    def _detect_tiled(self, img):
+        """✅ Sliced inference: tile overlap → batch predict → merge NMS antar tile"""
+        tile = self.config.TILE_SIZE
+        origins = self._tile_origins(*img.shape[:2])
+        tiles = [img[y:y + tile, x:x + tile] for x, y in origins]
+        
+        all_boxes, all_conf, all_cls, all_tiles, all_cut = [], [], [], [], []
+        height, width = img.shape[:2]
+        batch = self.config.TILE_BATCH
+        for start in range(0, len(tiles), batch):
+            results = self._predict(
+                tiles[start:start + batch],
+                augment=self.config.AUGMENT is True,
+                imgsz=self.config.TILE_IMG_SIZE
+            )
+            for tile_index, ((x, y), result) in enumerate(zip(origins[start:start + batch], results), start):
+                if result.boxes is None or len(result.boxes) == 0:
+                    continue
+                data = boxes_array(result)
+                all_boxes.append(data[:, :4] + [x, y, x, y])
+                all_conf.append(data[:, 4])
+                all_cls.append(data[:, 5])
+                all_tiles.append(np.full(len(data), tile_index))
+                # Box yang menyentuh tepi tile (bukan tepi frame) kemungkinan serangga terpotong
+                x1, y1, x2, y2 = data[:, :4].T
+                all_cut.append(((x1 <= 1) & (x > 0)) | ((y1 <= 1) & (y > 0))
+                               | ((x2 >= tile - 1) & (x + tile < width)) | ((y2 >= tile - 1) & (y + tile < height)))
+        
+        if not all_boxes:
+            return self._make_result(img, np.zeros((0, 4)), np.zeros(0), np.zeros(0))
+        
+        boxes = np.concatenate(all_boxes)
+        conf = np.concatenate(all_conf)
+        cls = np.concatenate(all_cls)
+        
+        keep = self._merge_boxes(boxes, conf, cls, np.concatenate(all_tiles), np.concatenate(all_cut))
+        return self._make_result(img, boxes[keep], conf[keep], cls[keep])
+    
+    def _merge_boxes(self, boxes, conf, cls, sources=None, cut=None):
+        """Merge duplikat antar tile/window (per kelas kecuali agnostic), index urut confidence.
+        
+        Hanya pasangan dari sumber berbeda yang di-merge; karena tiap box berada di dalam
+        tile-nya, irisan pasangan seperti itu selalu di area overlap kedua tile. Box
+        terpotong tepi tile (cut) kalah dari box utuh di tile sebelah walau confidence-nya lebih tinggi."""
+        rank = conf - cut if cut is not None else conf
+        keep = []
+        groups = [None] if self.config.AGNOSTIC_NMS else np.unique(cls)
+        for c in groups:
+            idx = np.arange(len(cls)) if c is None else np.flatnonzero(cls == c)
+            keep.extend(idx[nms(boxes[idx], rank[idx], self.config.TILE_MERGE_THRESHOLD,
+                                over_smaller=True, sources=None if sources is None else sources[idx])])
+        keep = np.array(keep, dtype=int)
+        return keep[np.argsort(-conf[keep])][:self.config.MAX_DET]
+    
+    # ==========================
+    # INCREMENTAL (CHANGE-AWARE) INFERENCE
+    # ==========================
+    def _detect_incremental(self, images, device_ids):
+        """Per trap: registrasi ke frame sebelumnya, deteksi hanya di window sekitar perubahan.
+        
+        Frame yang sama trap-nya dalam satu batch diproses bergiliran (round) karena
+        frame berikutnya butuh box hasil frame sebelumnya."""
+        results = [None] * len(images)
+        pending = []
+        for i, img in enumerate(images):
+            if img is None:
+                logger.error(f"Failed to load image ({device_ids[i] or self.config.DEFAULT_DEVICE})")
+            else:
+                pending.append(i)
+        
+        while pending:
+            devices, batch, later = set(), [], []
+            for i in pending:
+                device_id = device_ids[i] or self.config.DEFAULT_DEVICE
+                (later if device_id in devices else batch).append(i)
+                devices.add(device_id)
+            states = {d: self.traps.get(d).incremental for d in sorted(devices)}
+            for state in states.values():
+                state.lock.acquire()
+            try:
+                self._incremental_round(images, device_ids, batch, results, states)
+            finally:
+                for state in states.values():
+                    state.lock.release()
+            pending = later
+        return results
+    
+    def _incremental_round(self, images, device_ids, batch, results, states):
+        plans = {}
+        for i in batch:
+            state = states[device_ids[i] or self.config.DEFAULT_DEVICE]
+            with self.metrics.timer("register"):
+                plans[i] = self._plan_incremental(images[i], state)
+        
+        # Full re-detect: jalur biasa (preprocess penuh + adaptive TTA)
+        full = [i for i in batch if plans[i][0] is None]
+        if full:
+            detected = self._detect_full([self._apply_preprocess(images[i]) for i in full],
+                                         [device_ids[i] for i in full])
+            for i, result in zip(full, detected):
+                small, _ = plans[i][1:]
+                state = states[device_ids[i] or self.config.DEFAULT_DEVICE]
+                boxes = boxes_array(result)
+                state.reset(small, boxes.astype(np.float32))
+                results[i] = result
+                self._count_incremental("full")
+        
+        # Window di sekitar perubahan: preprocess + predict crop saja (satu batch lintas trap)
+        crops, owners = [], []
+        for i in batch:
+            origins = plans[i][0]
+            if origins is None:
+                continue
+            window = min(self.config.INCREMENTAL_WINDOW, *images[i].shape[:2])
+            for x, y in origins:
+                crop = images[i][y:y + window, x:x + window]
+                crops.append(self._apply_preprocess(crop, log=False))
+                owners.append((i, x, y, window))
+        detected = {}
+        if crops:
+            for (i, x, y, window), result in zip(owners, self._predict_windows(crops, images)):
+                data = boxes_array(result)
+                detected.setdefault(i, []).append((x, y, window, data))
+        
+        for i in batch:
+            origins, small, shift = plans[i]
+            if origins is None:
+                continue
+            state = states[device_ids[i] or self.config.DEFAULT_DEVICE]
+            boxes = self._merge_incremental(state.boxes, shift, detected.get(i, []), images[i].shape[:2])
+            state.reference = small
+            state.boxes = boxes
+            state.since_full += 1
+            self._count_incremental("windows" if origins else "reused")
+            results[i] = self._make_result(images[i], boxes[:, :4], boxes[:, 4], boxes[:, 5])
+    
+    def _count_incremental(self, kind):
+        stats = self.incremental_stats
+        stats[kind] += 1
+        frames = sum(stats.values())
+        if frames % self.config.TTA_REPORT_EVERY == 0:
+            logger.info(f"📊 Incremental: {stats['full']} full, {stats['windows']} windowed, "
+                        f"{stats['reused']} reused ({frames} frames)")
+    
+    @property
+    def incremental_rate(self):
+        """Fraksi frame tanpa full re-detect"""
+        frames = sum(self.incremental_stats.values())
+        return 1 - self.incremental_stats["full"] / frames if frames else 0.0
+    
+    def _plan_incremental(self, img, state):
+        """(origins window | [] = pakai ulang box | None = full detect, gray kecil, geser px asli)"""
+        c = self.config
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, None, fx=c.INCREMENTAL_SCALE, fy=c.INCREMENTAL_SCALE,
+                           interpolation=cv2.INTER_AREA)
+        # Blur: noise sensor dan sisa registrasi sub-pixel tidak dianggap perubahan
+        small = cv2.GaussianBlur(small, (5, 5), 0).astype(np.float32)
+        ref = state.reference
+        if ref is None or ref.shape != small.shape or state.since_full + 1 >= c.INCREMENTAL_FULL_EVERY:
+            return None, small, (0.0, 0.0)
+        
+        if state.window is None or state.window.shape != small.shape:
+            state.window = cv2.createHanningWindow(small.shape[::-1], cv2.CV_32F)
+        # Window dikalikan sendiri: phaseCorrelate(..., window) bisa menimpa input in-place
+        (dx, dy), response = cv2.phaseCorrelate(ref * state.window, small * state.window)
+        shift = (dx / c.INCREMENTAL_SCALE, dy / c.INCREMENTAL_SCALE)
+        if response < c.INCREMENTAL_MIN_RESPONSE or max(map(abs, shift)) > c.INCREMENTAL_MAX_SHIFT:
+            return None, small, shift
+        
+        # Frame sekarang digeser balik ke koordinat referensi, lalu dibandingkan
+        h, w = small.shape
+        aligned = cv2.warpAffine(small, np.float32([[1, 0, -dx], [0, 1, -dy]]), (w, h))
+        changed = (cv2.absdiff(aligned, ref) > c.INCREMENTAL_DIFF_THRESHOLD).astype(np.uint8)
+        bx, by = int(np.ceil(abs(dx))) + 1, int(np.ceil(abs(dy))) + 1
+        changed[:by], changed[h - by:], changed[:, :bx], changed[:, w - bx:] = 0, 0, 0, 0  # tepi hasil warp
+        if changed.mean() > c.INCREMENTAL_MAX_CHANGED:
+            return None, small, shift  # perubahan global (cahaya, board diganti)
+        
+        kernel = np.ones((3, 3), np.uint8)
+        changed = cv2.dilate(cv2.morphologyEx(changed, cv2.MORPH_OPEN, kernel), kernel, iterations=2)
+        n, _, stats, _ = cv2.connectedComponentsWithStats(changed, connectivity=8)
+        height, width = img.shape[:2]
+        rects = []
+        for x, y, rw, rh, area in stats[1:]:
+            if area < c.INCREMENTAL_MIN_AREA:
+                continue
+            # Koordinat referensi (skala kecil) -> koordinat frame sekarang (px asli)
+            x1 = int((x + dx) / c.INCREMENTAL_SCALE) - c.INCREMENTAL_PAD
+            y1 = int((y + dy) / c.INCREMENTAL_SCALE) - c.INCREMENTAL_PAD
+            x2 = int(np.ceil((x + rw + dx) / c.INCREMENTAL_SCALE)) + c.INCREMENTAL_PAD
+            y2 = int(np.ceil((y + rh + dy) / c.INCREMENTAL_SCALE)) + c.INCREMENTAL_PAD
+            rects.append((max(x1, 0), max(y1, 0), min(x2, width), min(y2, height)))
+        
+        origins = cover_windows(rects, c.INCREMENTAL_WINDOW, height, width)
+        window = min(c.INCREMENTAL_WINDOW, height, width)
+        if len(origins) * window * window > c.INCREMENTAL_MAX_CHANGED * height * width:
+            return None, small, shift  # window menutup sebagian besar frame: full lebih murah
+        return origins, small, shift
+    
+    def _predict_windows(self, crops, images):
+        """Predict crop dengan skala yang sama seperti full-frame inference"""
+        c = self.config
+        if c.TILED:
+            scale = c.TILE_IMG_SIZE / c.TILE_SIZE
+        else:
+            scale = c.IMG_SIZE / max(max(img.shape[:2]) for img in images if img is not None)
+        imgsz = max(32, int(np.ceil(max(max(crop.shape[:2]) for crop in crops) * scale / 32)) * 32)
+        return self._predict(crops, augment=c.AUGMENT is True, imgsz=imgsz)
+    
+    def _merge_incremental(self, previous, shift, windows, shape):
+        """Box lama (digeser) di luar window + box baru dari window.
+        
+        Box lama tidak di-NMS ulang (sudah lolos NMS full frame); box baru hanya dibuang jika
+        duplikat box baru dari window lain, atau duplikat box lama yang dipertahankan
+        (serangga di tepi window yang pusatnya di luar window)."""
+        height, width = shape
+        previous = previous.copy()
+        previous[:, [0, 2]] += shift[0]
+        previous[:, [1, 3]] += shift[1]
+        cx = (previous[:, 0] + previous[:, 2]) / 2
+        cy = (previous[:, 1] + previous[:, 3]) / 2
+        keep = (cx >= 0) & (cx < width) & (cy >= 0) & (cy < height)
+        fresh, sources, cut = [], [], []
+        for index, (x, y, window, data) in enumerate(windows):
+            keep &= ~((cx >= x) & (cx < x + window) & (cy >= y) & (cy < y + window))
+            if not len(data):
+                continue
+            fresh.append(data + np.array([x, y, x, y, 0, 0], dtype=data.dtype))
+            sources.append(np.full(len(data), index))
+            x1, y1, x2, y2 = data[:, :4].T
+            cut.append(((x1 <= 1) & (x > 0)) | ((y1 <= 1) & (y > 0))
+                       | ((x2 >= window - 1) & (x + window < width)) | ((y2 >= window - 1) & (y + window < height)))
+        
+        kept = previous[keep].astype(np.float32).reshape(-1, 6)
+        if fresh:
+            fresh = np.concatenate(fresh).astype(np.float32)
+            fresh = fresh[self._merge_boxes(fresh[:, :4], fresh[:, 4], fresh[:, 5],
+                                            np.concatenate(sources), np.concatenate(cut))]
+            if len(kept) and len(fresh):
+                duplicate = box_iou(fresh[:, :4], kept[:, :4], over_smaller=True) > self.config.TILE_MERGE_THRESHOLD
+                if not self.config.AGNOSTIC_NMS:
+                    duplicate &= fresh[:, 5, None] == kept[None, :, 5]
+                fresh = fresh[~duplicate.any(axis=1)]
+            kept = np.concatenate([kept, fresh])
+        
+        boxes = kept[np.argsort(-kept[:, 4], kind="stable")][:self.config.MAX_DET]
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+        return boxes
+    
+    def _make_result(self, img, boxes, conf, cls):
+        """Bungkus box hasil merge jadi Results Ultralytics (plot(), .boxes tetap jalan)"""
+        data = np.concatenate([boxes, conf[:, None], cls[:, None]], axis=1).astype(np.float32)
+        return result_from_array(img, data, self.active_engine.names)
+    
+    @property
+    def tta_rate(self):
+        with self._tta_lock:
+            frames, tta = self.tta_stats["frames"], self.tta_stats["tta"]
+        return tta / frames if frames else 0.0
+    
+    # ==========================
+    # HOT RELOAD / ROLLBACK
+    # ==========================
+    def reload_model(self, path=None):
+        """Muat + warm-up model baru (di thread pemanggil), lalu tukar engine di antara frame.
+        
+        Gagal load/warm-up = engine lama tetap dipakai."""
+        path = path or self.config.MODEL_PATH
+        if isinstance(self.engine, RemoteInferenceEngine):
+            logger.warning("⚠️  Model dimuat inference daemon; restart daemon untuk model baru")
+            return self._reload_status("skipped", path, error="inference daemon")
+        if not self._reload_lock.acquire(blocking=False):
+            return self._reload_status("busy", path)
+        try:
+            logger.info(f"🔄 Loading new model in background: {path}")
+            start = time.perf_counter()
+            try:
+                engine = create_engine(path, self.config)
+                engine.warmup(warmup_passes(self.config))
+            except Exception as e:
+                logger.error(f"❌ Model reload failed, keeping {self.model_path}: {e}", exc_info=True)
+                return self._reload_status("failed", path, error=str(e))
+            load_ms = (time.perf_counter() - start) * 1000
+            if engine.names != self.engine.names:
+                logger.warning(f"⚠️  Class names changed: {self.engine.names} -> {engine.names}")
+            
+            swap_ms = self._swap_engine(engine, path, keep_previous=True)
+            self.metrics.observe("model_load", load_ms)
+            self.metrics.observe("model_swap", swap_ms)
+            logger.info(f"✅ Model swapped to {engine.version} (load + warm-up {load_ms:.0f} ms, "
+                        f"swap {swap_ms:.2f} ms)")
+            return self._reload_status("reloaded", path, load_ms=load_ms, swap_ms=swap_ms)
+        finally:
+            self._reload_lock.release()
+    
+    def rollback_model(self):
+        """Kembali ke engine sebelumnya (masih dimuat, tanpa load ulang)"""
+        with self._reload_lock:
+            with self._engine_lock:
+                previous, self.previous = self.previous, None
+            if previous is None:
+                return self._reload_status("no_previous", None)
+            engine, path = previous
+            swap_ms = self._swap_engine(engine, path, keep_previous=True)
+            self.metrics.observe("model_swap", swap_ms)
+            logger.info(f"⏪ Model rolled back to {engine.version} (swap {swap_ms:.2f} ms)")
+            return self._reload_status("rolled_back", path, swap_ms=swap_ms)
+    
+    def _swap_engine(self, engine, path, keep_previous):
+        start = time.perf_counter()
+        # Di bawah lock yang sama dengan detect_preprocessed: batch baru melihat engine, versi,
+        # dan referensi rollback lama semua atau baru semua; batch yang berjalan tetap di engine lama
+        with self._engine_lock:
+            old = (self.engine, self.model_path)
+            self.engine, self.model_path = engine, path
+            self.model_version = engine.version
+            stale, self.previous = self.previous, old if keep_previous else None
+            # Box referensi incremental dari model lama: frame berikutnya full re-detect
+            for state in self.traps.states():
+                state.incremental.reference = None
+        swap_ms = (time.perf_counter() - start) * 1000
+        if stale is not None:
+            stale[0].shutdown()
+        return swap_ms
+    
+    def check_model_path(self, path):
+        """Path dari POST /admin/reload?path=: checkpoint = pickle (eksekusi kode), jadi hanya
+        file di bawah folder MODEL_PATH. Return path absolut, ValueError jika ditolak."""
+        root = Path(self.config.MODEL_PATH).resolve().parent
+        candidate = (root / path).resolve()
+        if not candidate.is_relative_to(root) or not candidate.is_file():
+            raise ValueError(f"Model harus file di bawah {root}")
+        return str(candidate)
+    
+    def _reload_status(self, status, path, **extra):
+        self.last_reload = {"status": status, "path": path, "time": time.time(), **extra}
+        return self.last_reload
+    
+    def model_info(self):
+        return {
+            "path": self.model_path,
+            "version": self.model_version,
+            "previous": self.previous[1] if self.previous else None,
+            "last_reload": self.last_reload,
+        }
+    
+    def get_filtered_count(self, raw_count, device_id=None):
+        """✅ Triple filtering: Temporal → Kalman → Round (state per trap)"""
+        state = self.traps.get(device_id or self.config.DEFAULT_DEVICE)
         
         # Stage 1: Temporal consistency
-        temporal_filtered = self.temporal.update(raw_count)
+        temporal_filtered = state.temporal.update(raw_count)
+        state.last_temporal = temporal_filtered
         
         # Stage 2: Kalman filter
-        kalman_filtered = self.kalman.update(temporal_filtered)
+        kalman_filtered = state.kalman.update(temporal_filtered)
         
         # Stage 3: Smart rounding
-        # Jika perbedaan dengan raw count kecil, percaya raw count
-        diff = abs(kalman_filtered - raw_count)
-        if diff < 1.5 and len(self.detection_history) > 5:
-            # Cek apakah raw count konsisten dengan history
-            recent_avg = np.mean(list(self.detection_history)[-5:])
-            if abs(raw_count - recent_avg) < 3:
-                final_count = int(round(raw_count))
-            else:
-                final_count = int(round(kalman_filtered))
-        else:
-            final_count = int(round(kalman_filtered))
-        
-        self.detection_history.append(final_count)
+        final_count = smart_round(raw_count, kalman_filtered, state.detection_history)
+        state.detection_history.append(final_count)
         
         return final_count
 
 # ==========================
-# MQTT MANAGER (Unchanged)
+# MQTT OUTBOX (SQLITE, BOUNDED)
+# ==========================
+class MQTTOutbox:
+    """Antrian pesan MQTT di disk; baris dihapus setelah broker mengonfirmasi"""
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS outbox (
+        id       INTEGER PRIMARY KEY AUTOINCREMENT,
+        topic    TEXT    NOT NULL,
+        payload  BLOB    NOT NULL,
+        qos      INTEGER NOT NULL,
+        retain   INTEGER NOT NULL,
+        created  REAL    NOT NULL,
+        coalesce TEXT    UNIQUE
+    )
+    """
+    
+    def __init__(self, path, max_rows):
+        self.max_rows = max_rows
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False, isolation_level=None)
+        if path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(self.SCHEMA)
+    
+    def put(self, topic, payload, qos, retain=False, coalesce=None):
+        """coalesce: key untuk nilai 'terbaru saja' (count lama di topic yang sama diganti)"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO outbox (topic, payload, qos, retain, created, coalesce) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (topic, payload, qos, int(retain), time.time(), coalesce)
+            )
+            overflow = self._count() - self.max_rows
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)", (overflow,)
+                )
+                self.dropped += overflow
+                logger.warning(f"⚠️  MQTT outbox full, dropped {overflow} oldest message(s)")
+    
+    def peek(self, limit, exclude=()):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, topic, payload, qos, retain, created FROM outbox ORDER BY id LIMIT ?",
+                (limit + len(exclude),)
+            ).fetchall()
+        return [row for row in rows if row[0] not in exclude][:limit]
+    
+    def ack(self, row_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+    
+    def _count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+    
+    def __len__(self):
+        with self._lock:
+            return self._count()
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# ==========================
+# MQTT MANAGER (OUTBOX + BATCH + QOS)
 # ==========================
 class MQTTManager:
-    def __init__(self, broker, port, username, password):
-        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
-        self.client.username_pw_set(username, password)
-        self.client.tls_set()
+    """Publish lewat outbox: tidak ada count yang hilang saat broker putus.
+    
+    Thread sender mengirim isi outbox saat terhubung (maks MQTT_INFLIGHT menunggu ack)
+    dan mengirim batch JSON count per trap tiap MQTT_BATCH_INTERVAL / MQTT_BATCH_SIZE.
+    client bisa diganti (mis. stand-in broker untuk pengujian)."""
+    def __init__(self, broker, port, username, password, config=None, client=None):
+        self.config = config or Config()
+        self.outbox = MQTTOutbox(self.config.MQTT_OUTBOX_PATH, self.config.MQTT_OUTBOX_MAX)
+        self.connected = False
+        
+        # mid -> (row id, waktu kirim); reset saat disconnect agar dikirim ulang
+        self._inflight = {}
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._batch = []
+        self._batch_started = None
+        self.metrics = {"published": 0, "failed": 0, "latency_ms": deque(maxlen=500)}
+        self._last_metrics_log = time.time()
+        
+        if client is None:
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
+            client.username_pw_set(username, password)
+            if self.config.MQTT_TLS:
+                client.tls_set()
+        self.client = client
         self.client.on_connect = self._on_connect
         self.client.on_disconnect = self._on_disconnect
-        self.connected = False
-
+        self.client.on_publish = self._on_publish
+        
+        pending = len(self.outbox)
+        if pending:
+            logger.info(f"📦 MQTT outbox: {pending} message(s) waiting to be replayed")
+        
+        self._sender = threading.Thread(target=self._send_loop, name="mqtt-sender", daemon=True)
+        self._sender.start()
+        
         try:
-            self.client.connect(broker, port)
+            self.client.connect_async(broker, port)
             self.client.loop_start()
             logger.info(f"🔌 Connecting to MQTT broker {broker}:{port} ...")
         except Exception as e:
@@ -256,25 +2049,386 @@ class MQTTManager:
     def _on_connect(self, client, userdata, flags, reason_code, properties=None):
         if reason_code == 0:
             self.connected = True
-            logger.info("✅ MQTT connected successfully")
+            logger.info(f"✅ MQTT connected successfully ({len(self.outbox)} queued)")
+            self._wake.set()
         else:
             self.connected = False
             logger.error(f"❌ MQTT connection failed (reason_code={reason_code})")
 
     def _on_disconnect(self, client, userdata, reason_code, properties=None):
         self.connected = False
-        logger.warning(f"⚠️ MQTT disconnected (code: {reason_code})")
+        with self._lock:
+            self._inflight.clear()
+        logger.warning(f"⚠️ MQTT disconnected (code: {reason_code}), buffering to outbox")
+    
+    def _on_publish(self, client, userdata, mid, *args):
+        with self._lock:
+            entry = self._inflight.pop(mid, None)
+        if entry is None:
+            return
+        row_id, sent = entry
+        self.outbox.ack(row_id)
+        with self._lock:
+            self.metrics["published"] += 1
+            self.metrics["latency_ms"].append((time.perf_counter() - sent) * 1000)
+        self._wake.set()
 
-    def publish(self, topic, message):
-        if self.connected:
-            self.client.publish(topic, str(message))
-            return True
-        return False
+    def publish(self, topic, message, coalesce=False):
+        """Masukkan ke outbox; coalesce=True hanya menyimpan nilai terbaru per topic"""
+        payload = message if isinstance(message, bytes) else str(message).encode()
+        self.outbox.put(topic, payload, self.config.MQTT_QOS, coalesce=topic if coalesce else None)
+        self._wake.set()
+        return True
+    
+    def add_count(self, device_id, count, timestamp=None, tracks=None):
+        """Tambahkan count trap ke batch JSON berikutnya"""
+        row = [device_id, int(count), round(timestamp or time.time(), 3)]
+        if tracks is not None:
+            row += [int(tracks[0]), int(tracks[1])]
+        with self._lock:
+            if not self._batch:
+                self._batch_started = time.time()
+            self._batch.append(row)
+            full = len(self._batch) >= self.config.MQTT_BATCH_SIZE
+        if full:
+            self.flush_batch()
+    
+    def flush_batch(self):
+        with self._lock:
+            batch, self._batch = self._batch, []
+        if batch:
+            # Ringkas: [[device, count, unix_ts(, track_total, new)], ...]
+            payload = json.dumps({"counts": batch}, separators=(",", ":")).encode()
+            self.publish(self.config.MQTT_BATCH_TOPIC, payload)
+    
+    def _send_loop(self):
+        while not self._stop.is_set():
+            timeout = 1.0
+            with self._lock:
+                if self._batch:
+                    timeout = min(timeout, self._batch_started + self.config.MQTT_BATCH_INTERVAL - time.time())
+            self._wake.wait(timeout=max(timeout, 0.01))
+            self._wake.clear()
+            
+            with self._lock:
+                batch_due = self._batch and time.time() - self._batch_started >= self.config.MQTT_BATCH_INTERVAL
+            if batch_due:
+                self.flush_batch()
+            self._log_metrics()
+            
+            if not self.connected:
+                continue
+            with self._lock:
+                inflight = {row_id for row_id, _ in self._inflight.values()}
+            room = self.config.MQTT_INFLIGHT - len(inflight)
+            if room <= 0:
+                continue
+            for row_id, topic, payload, qos, retain, _ in self.outbox.peek(room, inflight):
+                with self._lock:
+                    info = self.client.publish(topic, payload, qos=qos, retain=bool(retain))
+                    if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                        self.metrics["failed"] += 1
+                        break
+                    self._inflight[info.mid] = (row_id, time.perf_counter())
+                    # Callback QoS 0 bisa datang sebelum mid tercatat
+                    if info.is_published():
+                        self._on_publish(self.client, None, info.mid)
+    
+    def stats(self):
+        # Salin deque di bawah lock; thread paho menambah latency bersamaan
+        with self._lock:
+            inflight = len(self._inflight)
+            latency = list(self.metrics["latency_ms"]) or [0.0]
+            published, failed = self.metrics["published"], self.metrics["failed"]
+        latency = np.array(latency)
+        return {
+            "connected": self.connected,
+            "queue_depth": len(self.outbox),
+            "inflight": inflight,
+            "published": published,
+            "failed": failed,
+            "dropped": self.outbox.dropped,
+            "latency_ms_p50": float(np.percentile(latency, 50)),
+            "latency_ms_p95": float(np.percentile(latency, 95)),
+        }
+    
+    def _log_metrics(self):
+        if time.time() - self._last_metrics_log < self.config.MQTT_METRICS_EVERY:
+            return
+        self._last_metrics_log = time.time()
+        s = self.stats()
+        logger.info(f"📊 MQTT: queue {s['queue_depth']} | inflight {s['inflight']} | "
+                    f"published {s['published']} | dropped {s['dropped']} | "
+                    f"latency p50 {s['latency_ms_p50']:.0f}ms p95 {s['latency_ms_p95']:.0f}ms")
+    
+    def close(self, timeout=5.0):
+        """Kirim batch terakhir, tunggu outbox kosong sebentar, lalu putuskan"""
+        self.flush_batch()
+        deadline = time.time() + timeout
+        while self.connected and len(self.outbox) and time.time() < deadline:
+            self._wake.set()
+            time.sleep(0.1)
+        self._stop.set()
+        self._sender.join(timeout=2)
+        self.client.loop_stop()
+        self.client.disconnect()
+        self.outbox.close()
+
+# ==========================
+# UPLOAD QUEUE (EVENT-DRIVEN)
+# ==========================
+class UploadQueue:
+    """Antrian frame baru yang dikirim server.py lewat socket lokal.
+
+    Setiap pesan adalah satu baris JSON (mis. {"path": "...", "device": "trap-2",
+    "size": n}), diikuti n byte isi gambar jika "size" ada. Antrian dibatasi
+    QUEUE_SIZE; jika penuh, frame tertua dibuang supaya latency tetap rendah.
+    """
+    def __init__(self, host, port, maxsize):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self._server = socket.create_server((host, port))
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        logger.info(f"📥 Upload queue listening on {host}:{port}")
+
+    def _serve(self):
+        while True:
+            conn, _ = self._server.accept()
+            with conn:
+                try:
+                    self._handle(conn)
+                except Exception as e:
+                    logger.error(f"Upload queue error: {e}")
+
+    def _handle(self, conn):
+        with conn.makefile('rb') as reader:
+            for line in reader:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if item.get("size"):
+                    item["data"] = reader.read(item["size"])
+                self.put(item)
+
+    def put(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._discard(self.queue.get_nowait())
+                    self.dropped += 1
+                    logger.warning(f"⚠️  Queue full, dropping oldest frame (total dropped: {self.dropped})")
+                except queue.Empty:
+                    pass
+
+    def _discard(self, item):
+        if "stream" in item:
+            item["stream"].take()  # token dibuang: stream boleh mengantri lagi
+    
+    def get(self, timeout):
+        try:
+            item = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if "stream" in item:
+            # Token stream diisi frame terbaru saat diambil, bukan saat diantrikan
+            item.update(item["stream"].take())
+        return item
+    
+    def get_batch(self, max_items, window, timeout):
+        """Ambil satu frame, lalu kumpulkan frame lain yang datang dalam `window` detik"""
+        first = self.get(timeout)
+        if first is None:
+            return []
+        
+        items = [first]
+        deadline = time.monotonic() + window
+        while len(items) < max_items:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            item = self.get(remaining)
+            if item is None:
+                break
+            items.append(item)
+        return items
+
+# ==========================
+# MJPEG STREAM READER (LATEST FRAME)
+# ==========================
+class MJPEGStreamReader:
+    """Baca stream MJPEG (multipart/x-mixed-replace) atau JPEG berurutan lewat chunked HTTP.
+    
+    Thread reader memotong frame di marker SOI/EOI dan hanya menyimpan frame terbaru.
+    UploadQueue cukup berisi satu token per stream yang diisi saat diambil, jadi jika
+    inference tertinggal frame lama ditimpa, bukan diantrikan. Decode JPEG tetap di
+    preprocess pool sehingga frame yang dilewati tidak pernah di-decode.
+    """
+    SOI = b"\xff\xd8"
+    EOI = b"\xff\xd9"
+    
+    def __init__(self, device_id, url, upload_queue, config):
+        self.device_id = device_id
+        self.url = url
+        self.upload_queue = upload_queue
+        self.config = config
+        self.frames = 0
+        self.skipped = 0
+        self.reconnects = 0
+        self._latest = None
+        self._queued = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"stream-{device_id}", daemon=True)
+    
+    def start(self):
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._stop.set()
+    
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with urllib.request.urlopen(self.url, timeout=self.config.STREAM_TIMEOUT) as response:
+                    logger.info(f"🎥 Stream connected [{self.device_id}]: {self.url}")
+                    for frame in self.split_frames(response):
+                        self._offer(frame)
+                logger.warning(f"⚠️  Stream ended [{self.device_id}]")
+            except (OSError, http.client.HTTPException) as e:
+                logger.warning(f"⚠️  Stream error [{self.device_id}]: {e}")
+            if self._stop.wait(self.config.STREAM_RECONNECT_DELAY):
+                break
+            self.reconnects += 1
+    
+    def split_frames(self, stream):
+        """Generator JPEG utuh (SOI..EOI) dari stream byte; header multipart diabaikan"""
+        read = getattr(stream, "read1", stream.read)
+        buffer = bytearray()
+        scan = 2  # posisi awal pencarian EOI, agar byte yang sama tidak dipindai ulang
+        while not self._stop.is_set():
+            chunk = read(self.config.STREAM_CHUNK_SIZE)
+            if not chunk:
+                return
+            buffer += chunk
+            while True:
+                if not buffer.startswith(self.SOI):
+                    start = buffer.find(self.SOI)
+                    if start < 0:
+                        del buffer[:-1]  # marker bisa terpotong di batas chunk
+                        break
+                    del buffer[:start]
+                    scan = 2
+                end = buffer.find(self.EOI, scan)
+                if end < 0:
+                    scan = max(2, len(buffer) - 1)
+                    if len(buffer) > self.config.STREAM_MAX_FRAME_BYTES:
+                        logger.warning(f"⚠️  Stream frame too large [{self.device_id}], resyncing")
+                        del buffer[:2]
+                        scan = 2
+                    break
+                yield bytes(buffer[:end + 2])
+                del buffer[:end + 2]
+                scan = 2
+    
+    def _offer(self, frame):
+        with self._lock:
+            if self._latest is not None:
+                self.skipped += 1  # inference belum mengambil frame sebelumnya
+            self._latest = frame
+            self.frames += 1
+            if self._queued:
+                return
+            self._queued = True
+        self.upload_queue.put({"stream": self, "device": self.device_id})
+    
+    def take(self):
+        """Frame terbaru untuk item UploadQueue; membuka slot untuk token berikutnya"""
+        with self._lock:
+            frame, self._latest = self._latest, None
+            self._queued = False
+            return {"data": frame, "path": f"{self.device_id}_stream_{self.frames:06d}.jpg"}
+
+# ==========================
+# ROLLING SERIES (RING BUFFER)
+# ==========================
+class RollingSeries:
+    """Ring buffer NumPy berukuran tetap dengan mean/std/max rolling O(1)"""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=np.float64)
+        self.head = 0          # posisi tulis berikutnya
+        self.count = 0
+        self.total = 0         # jumlah append sepanjang umur buffer
+        self._sum = 0.0
+        self._sumsq = 0.0
+        self._max = deque()    # monotonic deque (index, value) untuk rolling max
+    
+    def append(self, value):
+        value = float(value)
+        if self.count == self.capacity:
+            old = self.data[self.head]
+            self._sum -= old
+            self._sumsq -= old * old
+        else:
+            self.count += 1
+        
+        self.data[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self._sum += value
+        self._sumsq += value * value
+        
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((self.total, value))
+        self.total += 1
+        while self._max[0][0] <= self.total - 1 - self.capacity:
+            self._max.popleft()
+        
+        # Hitung ulang sum sesekali agar error floating point tidak menumpuk
+        if self.total % self.capacity == 0:
+            window = self.values()
+            self._sum = float(window.sum())
+            self._sumsq = float(np.dot(window, window))
+    
+    def values(self):
+        """Isi buffer urut dari terlama ke terbaru"""
+        if self.count < self.capacity:
+            return self.data[:self.count].copy()
+        return np.concatenate((self.data[self.head:], self.data[:self.head]))
+    
+    @property
+    def mean(self):
+        return self._sum / self.count if self.count else 0.0
+    
+    @property
+    def std(self):
+        if not self.count:
+            return 0.0
+        mean = self.mean
+        return float(np.sqrt(max(self._sumsq / self.count - mean * mean, 0.0)))
+    
+    @property
+    def max(self):
+        return self._max[0][1] if self._max else 0.0
+    
+    def snapshot(self):
+        return {"values": self.values(), "mean": self.mean, "std": self.std, "max": self.max}
 
 # ==========================
 # ENHANCED GRAPH RENDERER
 # ==========================
 class EnhancedGraphRenderer:
+    """Renderer grafik inkremental: layer statis + label di-cache per skala, tiap
+    frame hanya baris plot yang tadinya dilewati garis dan strip statistik (jika
+    teksnya berubah) yang dipulihkan dan digambar ulang, satu cv2.polylines per seri."""
+    
+    MAX_LAYERS = 32
+    
     def __init__(self, width, height, config):
         self.width = width
         self.height = height
@@ -286,39 +2440,114 @@ class EnhancedGraphRenderer:
         self.plot_width = width - self.margin_left - self.margin_right
         self.plot_height = height - self.margin_top - self.margin_bottom
         
-    def render(self, x_data, raw_data, filtered_data, temporal_data=None):
-        """✅ Enhanced rendering dengan 3 lines"""
-        img = np.ones((self.height, self.width, 3), dtype=np.uint8) * 250
+        # Posisi x tiap titik tidak pernah berubah
+        self.x_pixels = self.margin_left + (
+            np.arange(config.BUFFER_SIZE) * self.plot_width / (config.BUFFER_SIZE - 1)
+        ).astype(np.int32)
         
-        cv2.rectangle(img, 
-                     (self.margin_left, self.margin_top),
-                     (self.width - self.margin_right, self.height - self.margin_bottom),
-                     (255, 255, 255), -1)
+        # Piksel marker lingkaran (radius 3) untuk semua titik, digambar sekaligus
+        dy, dx = np.mgrid[-3:4, -3:4]
+        disk = dx * dx + dy * dy <= 9
+        self.marker_dy = dy[disk]
+        self.marker_x = (self.x_pixels[:, None] + dx[disk][None, :]).ravel()
         
-        if not raw_data or len(raw_data) < 2:
-            return img
+        # Kolom area plot (+ marker/tebal garis) dan baris strip statistik yang dipulihkan per frame
+        self._plot_cols = slice(self.margin_left - 4, self.width - self.margin_right + 4)
+        stats_y = self.height - self.margin_bottom + 55
+        self._stats_rows = slice(stats_y - 20, stats_y + 10)
         
-        max_val = max(max(raw_data), max(filtered_data), 1)
-        if temporal_data:
-            max_val = max(max_val, max(temporal_data))
+        self._blank = self._build_blank()
+        self._backgrounds = {}
+        self._layers = {}
+        self._local = threading.local()
+    
+    def render(self, graph):
+        """✅ Enhanced rendering dengan 3 lines dari snapshot RollingSeries"""
+        raw, filtered = graph["raw"], graph["filtered"]
+        temporal = graph.get("temporal")
+        
+        if len(raw["values"]) < 2:
+            return self._blank.copy()
+        
+        state = self._state()
+        if state["graph"] is graph:
+            # Snapshot yang sama (display + preview + save): canvas sudah benar
+            return state["canvas"]
+        
+        max_val = max(raw["max"], filtered["max"], 1)
+        if temporal is not None:
+            max_val = max(max_val, temporal["max"])
         y_scale = self.plot_height / (max_val * 1.1)
         
-        self._draw_grid(img, max_val)
+        img = state["canvas"]
+        key = (temporal is not None, float(max_val), len(raw["values"]))
+        layer = self._layer(key)
+        if state["key"] != key:
+            np.copyto(img, layer)
+            state["key"], state["stats"] = key, None
+        else:
+            # Label sama: cukup hapus garis frame sebelumnya
+            top, bottom = state["rows"]
+            img[top:bottom, self._plot_cols] = layer[top:bottom, self._plot_cols]
         
         # Plot all data
-        self._plot_line(img, x_data, raw_data, y_scale, (0, 0, 255), 2)  # Red: Raw
-        if temporal_data:
-            self._plot_line(img, x_data, temporal_data, y_scale, (255, 150, 0), 2)  # Orange: Temporal
-        self._plot_line(img, x_data, filtered_data, y_scale, (0, 200, 0), 3)  # Green: Final
+        rows = [self._plot_line(img, raw["values"], y_scale, (0, 0, 255), 2)]  # Red: Raw
+        if temporal is not None:
+            rows.append(self._plot_line(img, temporal["values"], y_scale, (255, 150, 0), 2))  # Orange: Temporal
+        rows.append(self._plot_line(img, filtered["values"], y_scale, (0, 200, 0), 3))  # Green: Final
+        state["rows"] = (min(r[0] for r in rows), max(r[1] for r in rows))
         
         self._draw_axes(img)
-        self._draw_labels(img, max_val, len(x_data))
-        self._draw_legend(img, has_temporal=temporal_data is not None)
-        self._draw_statistics(img, raw_data, filtered_data)
         
+        stats = self._statistics_text(raw, filtered)
+        if stats != state["stats"]:
+            img[self._stats_rows] = layer[self._stats_rows]
+            self._draw_statistics(img, stats)
+            state["stats"] = stats
+        
+        state["graph"] = graph
         return img
     
-    def _draw_grid(self, img, max_val):
+    def _build_blank(self):
+        img = np.full((self.height, self.width, 3), 250, dtype=np.uint8)
+        cv2.rectangle(img, 
+                     (self.margin_left, self.margin_top),
+                     (self.width - self.margin_right, self.height - self.margin_bottom),
+                     (255, 255, 255), -1)
+        return img
+    
+    def _state(self):
+        """Canvas per thread (display dan preview bisa render bersamaan) + apa yang sedang tergambar"""
+        state = getattr(self._local, "state", None)
+        if state is None:
+            state = self._local.state = {
+                "canvas": np.empty_like(self._blank), "graph": None, "key": None, "rows": None, "stats": None,
+            }
+        return state
+    
+    def _layer(self, key):
+        """Background + label sumbu untuk satu (legend, skala y, jumlah titik)"""
+        layer = self._layers.get(key)
+        if layer is None:
+            has_temporal, max_val, num_points = key
+            layer = self._background(has_temporal).copy()
+            self._draw_labels(layer, max_val, num_points)
+            if len(self._layers) >= self.MAX_LAYERS:
+                self._layers.clear()
+            self._layers[key] = layer
+        return layer
+    
+    def _background(self, has_temporal):
+        # Layer statis (grid, judul, legend) dibuat sekali per varian legend
+        if has_temporal not in self._backgrounds:
+            img = self._blank.copy()
+            self._draw_grid(img)
+            self._draw_titles(img)
+            self._draw_legend(img, has_temporal=has_temporal)
+            self._backgrounds[has_temporal] = img
+        return self._backgrounds[has_temporal]
+    
+    def _draw_grid(self, img):
         num_h_lines = 6
         for i in range(num_h_lines + 1):
             y = self.margin_top + int(i * self.plot_height / num_h_lines)
@@ -331,18 +2560,21 @@ class EnhancedGraphRenderer:
             cv2.line(img, (x, self.margin_top), 
                     (x, self.height - self.margin_bottom), (220, 220, 220), 1)
     
-    def _plot_line(self, img, x_data, y_data, y_scale, color, thickness):
-        points = []
-        for i, (x, y) in enumerate(zip(x_data, y_data)):
-            px = self.margin_left + int(i * self.plot_width / (self.config.BUFFER_SIZE - 1))
-            py = self.height - self.margin_bottom - int(y * y_scale)
-            points.append((px, py))
+    def _plot_line(self, img, y_data, y_scale, color, thickness):
+        px = self.x_pixels[:len(y_data)]
+        py = self.height - self.margin_bottom - (y_data * y_scale).astype(np.int32)
+        points = np.stack([px, py], axis=1).reshape(-1, 1, 2)
         
-        for i in range(1, len(points)):
-            cv2.line(img, points[i-1], points[i], color, thickness, cv2.LINE_AA)
-            
-        for point in points:
-            cv2.circle(img, point, 3, color, -1)
+        # LINE_8: anti-aliasing (LINE_AA) sekitar 3x lebih mahal untuk garis tebal
+        cv2.polylines(img, [points], False, color, thickness, cv2.LINE_8)
+        
+        # Marker semua titik sekaligus lewat fancy indexing
+        # (nilai >= 0 dan skala 1.1x menjamin marker selalu di dalam canvas)
+        my = (py[:, None] + self.marker_dy[None, :]).ravel()
+        img[my, self.marker_x[:len(my)]] = color
+        
+        # Baris yang tersentuh (garis tebal + marker) untuk dihapus di frame berikutnya
+        return int(py.min()) - 4, int(py.max()) + 5
     
     def _draw_axes(self, img):
         cv2.line(img, (self.margin_left, self.margin_top),
@@ -350,10 +2582,13 @@ class EnhancedGraphRenderer:
         cv2.line(img, (self.margin_left, self.height - self.margin_bottom),
                 (self.width - self.margin_right, self.height - self.margin_bottom), (50, 50, 50), 2)
     
-    def _draw_labels(self, img, max_val, num_points):
+    def _draw_titles(self, img):
         cv2.putText(img, "WERENG COUNT (TRIPLE FILTERED)", (10, 35),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (50, 50, 50), 2)
-        
+        cv2.putText(img, "FRAME INDEX", (self.width // 2 - 80, self.height - 20),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.8, (50, 50, 50), 2)
+    
+    def _draw_labels(self, img, max_val, num_points):
         num_labels = 6
         for i in range(num_labels + 1):
             val = int(max_val * (1 - i / num_labels))
@@ -361,9 +2596,6 @@ class EnhancedGraphRenderer:
             cv2.putText(img, str(val), (10, y + 5),
                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (50, 50, 50), 1)
         
-        cv2.putText(img, "FRAME INDEX", (self.width // 2 - 80, self.height - 20),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.8, (50, 50, 50), 2)
-        
         num_x_labels = 5
         buffer_size = self.config.BUFFER_SIZE
         for i in range(num_x_labels + 1):
@@ -389,25 +2621,288 @@ class EnhancedGraphRenderer:
         cv2.putText(img, "Final (Kalman)", (legend_x + 50, legend_y + 65),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (50, 50, 50), 1)
     
-    def _draw_statistics(self, img, raw_data, filtered_data):
-        stats_y = self.height - self.margin_bottom + 55
-        
-        raw_mean = np.mean(raw_data)
-        raw_std = np.std(raw_data)
-        filtered_mean = np.mean(filtered_data)
-        filtered_std = np.std(filtered_data)
+    @staticmethod
+    def _statistics_text(raw, filtered):
+        raw_mean, raw_std = raw["mean"], raw["std"]
+        filtered_mean, filtered_std = filtered["mean"], filtered["std"]
         improvement = ((raw_std - filtered_std) / raw_std * 100) if raw_std > 0 else 0
+        return (
+            f"Raw: miu={raw_mean:.1f}, sigma={raw_std:.2f}",
+            f"Filtered: miu={filtered_mean:.1f}, sigma={filtered_std:.2f}",
+            f"Stability: +{improvement:.1f}%",
+        )
+    
+    def _draw_statistics(self, img, texts):
+        stats_y = self.height - self.margin_bottom + 55
+        raw_text, filtered_text, stability_text = texts
         
-        cv2.putText(img, f"Raw: miu={raw_mean:.1f}, sigma={raw_std:.2f}", 
+        cv2.putText(img, raw_text, 
                    (self.margin_left + 20, stats_y), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.55, (0, 0, 200), 2)
-        cv2.putText(img, f"Filtered: miu={filtered_mean:.1f}, sigma={filtered_std:.2f}", 
+        cv2.putText(img, filtered_text, 
                    (self.margin_left + 450, stats_y), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.55, (0, 150, 0), 2)
-        cv2.putText(img, f"Stability: +{improvement:.1f}%", 
+        cv2.putText(img, stability_text, 
                    (self.margin_left + 920, stats_y), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.55, (0, 100, 200), 2)
 
+# ==========================
+# DETECTION PIPELINE
+# ==========================
+class DetectionPipeline:
+    """Pipeline bertahap yang dihubungkan antrian terbatas (backpressure):
+
+    ingest → preprocess (thread pool) → inference (INFERENCE_WORKERS) → count
+    (urut per sequence) → publish, dan → display (drop-oldest, tidak pernah
+    menahan counting).
+    """
+    def __init__(self, system):
+        self.system = system
+        self.config = system.config
+        self.preprocess_pool = ThreadPoolExecutor(
+            self.config.PREPROCESS_WORKERS, thread_name_prefix="preprocess"
+        )
+        self.infer_queue = queue.Queue(maxsize=self.config.PIPELINE_QUEUE_SIZE)
+        self.count_queue = queue.Queue(maxsize=self.config.PIPELINE_QUEUE_SIZE)
+        self.publish_queue = queue.Queue(maxsize=self.config.PIPELINE_QUEUE_SIZE * self.config.BATCH_SIZE)
+        self.display_queue = queue.Queue(maxsize=self.config.DISPLAY_QUEUE_SIZE)
+        self._sequence = itertools.count()
+        self._ingest_times = {}  # sequence -> waktu masuk, untuk latency end-to-end
+        self._threads = []
+    
+    def start(self):
+        stages = [("ingest", self._ingest), ("count", self._count), ("publish", self._publish)]
+        stages += [(f"inference-{i}", self._infer) for i in range(self.config.INFERENCE_WORKERS)]
+        for name, target in stages:
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def stop(self):
+        self.preprocess_pool.shutdown(wait=False, cancel_futures=True)
+        self.system.detector.engine.shutdown()
+    
+    def get_display(self, timeout):
+        try:
+            return self.display_queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+    
+    def _ingest(self):
+        while True:
+            # Frame dari trap lain yang datang berdekatan digabung jadi satu batch
+            items = self.system.upload_queue.get_batch(
+                self.config.BATCH_SIZE, self.config.BATCH_WINDOW, timeout=1.0
+            )
+            if not items:
+                continue
+            
+            try:
+                # Pakai bytes dari server.py jika ada, fallback ke file
+                frames = [
+                    (item.get("data") or item["path"], Path(item["path"]).name, item.get("device"))
+                    for item in items
+                ]
+                self.system._log_frames(frames)
+                
+                # Frame duplikat (cache hit) langsung ke count tanpa preprocess/inference
+                detector = self.system.detector
+                lookups = [detector.lookup_cache(source, device_id) for source, _, device_id in frames]
+                futures = [
+                    None if cached is not None else self.preprocess_pool.submit(detector.prepare_image, source)
+                    for source, _, cached in lookups
+                ]
+            except Exception as e:
+                # Sequence belum diambil, jadi _count tidak menunggu batch yang dibuang
+                logger.error(f"Ingest error ({len(items)} frames dropped): {e}", exc_info=True)
+                continue
+            sequence = next(self._sequence)
+            self._ingest_times[sequence] = time.perf_counter()
+            self.infer_queue.put((sequence, frames, lookups, futures))
+    
+    def _infer(self):
+        while True:
+            sequence, frames, lookups, futures = self.infer_queue.get()
+            try:
+                results = self.system.detect_misses(
+                    frames, lookups, lambda i: futures[i].result()
+                )
+            except Exception as e:
+                logger.error(f"Inference error: {e}", exc_info=True)
+                results = [None] * len(frames)
+            duplicates = [cached is not None for _, _, cached in lookups]
+            self.count_queue.put((sequence, frames, results, duplicates))
+    
+    def _count(self):
+        # Worker inference bisa selesai tidak berurutan; filter Kalman butuh urutan asli
+        pending = {}
+        next_sequence = 0
+        while True:
+            sequence, frames, results, duplicates = self.count_queue.get()
+            pending[sequence] = (frames, results, duplicates)
+            while next_sequence in pending:
+                frames, results, duplicates = pending.pop(next_sequence)
+                ingested = self._ingest_times.pop(next_sequence, None)
+                next_sequence += 1
+                try:
+                    outputs = self.system.count_batch(frames, results, duplicates)
+                except Exception as e:
+                    logger.error(f"Count error: {e}", exc_info=True)
+                    continue
+                if ingested is not None:
+                    latency = (time.perf_counter() - ingested) * 1000
+                    for _ in frames:
+                        self.system.metrics.observe("frame_latency", latency)
+                for output in outputs:
+                    if output is not None:
+                        self.publish_queue.put(output)
+                        self._offer_display(output)
+    
+    def _publish(self):
+        while True:
+            output = self.publish_queue.get()
+            try:
+                self.system.publish_output(output)
+            except Exception as e:
+                logger.error(f"Publish error: {e}", exc_info=True)
+    
+    def _offer_display(self, output):
+        while True:
+            try:
+                self.display_queue.put_nowait(output)
+                return
+            except queue.Full:
+                try:
+                    self.display_queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+# ==========================
+# PREVIEW SERVER (ON-DEMAND RENDER)
+# ==========================
+class PreviewServer:
+    """HTTP lokal untuk frame beranotasi dan grafik, dirender hanya saat diminta.
+
+    GET /frame.jpg?device=trap-1 dan /graph.jpg?device=trap-1 (tanpa device =
+    trap terakhir). server.py mem-proxy endpoint ini di /preview/<kind>.
+    
+    Juga: /metrics (Prometheus), /metrics.json, dan /profile?seconds=N (collapsed stack).
+    Admin model: GET /admin/model, POST /admin/reload[?path=...] (hanya file di folder MODEL_PATH), POST /admin/rollback.
+    """
+    def __init__(self, system, host, port):
+        self.system = system
+        # JPEG terakhir per (kind, device): dipakai ulang sampai output trap berganti
+        self._encoded = {}
+        self._encoded_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        thread = threading.Thread(target=self.httpd.serve_forever, name="preview", daemon=True)
+        thread.start()
+        logger.info(f"🖼️  Preview endpoint on http://{host}:{port}/frame.jpg")
+    
+    def render(self, kind, device_id=None):
+        output = self.system.latest_outputs.get(device_id)
+        if output is None:
+            return None
+        key = (kind, device_id)
+        with self._encoded_lock:
+            cached = self._encoded.get(key)
+        if cached is not None and cached[0] is output:
+            return cached[1]
+        
+        if kind == "frame":
+            img = self.system.render_frame(output)
+        elif kind == "graph":
+            img = self.system.render_graph(output)
+        else:
+            return None
+        ok, buf = cv2.imencode(".jpg", img)
+        if not ok:
+            return None
+        body = buf.tobytes()
+        with self._encoded_lock:
+            self._encoded[key] = (output, body)
+            # Device yang sudah di-evict tidak perlu menahan JPEG/outputnya
+            for stale in [k for k in self._encoded if k[1] not in self.system.latest_outputs]:
+                del self._encoded[stale]
+        return body
+    
+    def _make_handler(self):
+        preview = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                metrics = preview.system.metrics
+                if url.path == "/metrics":
+                    self._send(metrics.prometheus().encode(), "text/plain; version=0.0.4")
+                    return
+                if url.path == "/metrics.json":
+                    self._send(json.dumps(metrics.snapshot(), indent=2).encode(), "application/json")
+                    return
+                if url.path == "/admin/model":
+                    self._send(json.dumps(preview.system.detector.model_info(), indent=2).encode(),
+                               "application/json")
+                    return
+                if url.path == "/profile":
+                    try:
+                        seconds = float(query.get("seconds", ["10"])[0])
+                        if not 0 <= seconds:  # juga menolak nan
+                            raise ValueError(seconds)
+                    except ValueError:
+                        self.send_error(400, "seconds harus angka >= 0")
+                        return
+                    seconds = min(seconds, 120)
+                    profiler = SamplingProfiler(preview.system.config.PROFILE_INTERVAL).start()
+                    time.sleep(seconds)
+                    self._send(profiler.stop().collapsed().encode(), "text/plain")
+                    return
+                
+                kind = url.path.strip("/").rsplit(".", 1)[0]
+                device_id = query.get("device", [None])[0]
+                try:
+                    body = preview.render(kind, device_id)
+                except Exception as e:
+                    logger.error(f"Preview render error: {e}", exc_info=True)
+                    body = None
+                if body is None:
+                    self.send_error(404, "No preview available")
+                    return
+                self._send(body, "image/jpeg")
+            
+            def do_POST(self):
+                url = urlparse(self.path)
+                detector = preview.system.detector
+                if url.path == "/admin/reload":
+                    path = parse_qs(url.query).get("path", [None])[0]
+                    if path is not None:
+                        try:
+                            path = detector.check_model_path(path)
+                        except ValueError as e:
+                            self.send_error(400, str(e))
+                            return
+                    # Load + warm-up di background; status lewat GET /admin/model
+                    threading.Thread(target=detector.reload_model, args=(path,),
+                                     name="model-reload", daemon=True).start()
+                    self._send(json.dumps({"status": "loading", "path": path}).encode(), "application/json", 202)
+                elif url.path == "/admin/rollback":
+                    self._send(json.dumps(detector.rollback_model()).encode(), "application/json")
+                else:
+                    self.send_error(404)
+            
+            def _send(self, body, content_type, status=200):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+
 # ==========================
 # MAIN SYSTEM
 # ==========================
@@ -419,7 +2914,8 @@ class WerengDetectionSystem:
             self.config.BROKER,
             self.config.PORT,
             self.config.USERNAME,
-            self.config.PASSWORD
+            self.config.PASSWORD,
+            self.config
         )
         self.graph_renderer = EnhancedGraphRenderer(
             self.config.GRAPH_WIDTH,
@@ -427,84 +2923,246 @@ class WerengDetectionSystem:
             self.config
         )
         
-        # Data buffers
-        self.x_data = deque(maxlen=self.config.BUFFER_SIZE)
-        self.raw_data = deque(maxlen=self.config.BUFFER_SIZE)
-        self.temporal_data = deque(maxlen=self.config.BUFFER_SIZE)
-        self.filtered_data = deque(maxlen=self.config.BUFFER_SIZE)
-        self.frame_index = 0
+        # Frame baru datang dari server.py, bukan dari scan direktori
+        self.upload_queue = UploadQueue(
+            self.config.QUEUE_HOST,
+            self.config.QUEUE_PORT,
+            self.config.QUEUE_SIZE
+        )
+        self.streams = [
+            MJPEGStreamReader(device_id, url, self.upload_queue, self.config)
+            for device_id, url in self.config.STREAM_URLS.items()
+        ]
+        self.pipeline = DetectionPipeline(self)
+        
+        # Metrik stage + gauge antrian; diekspos di /metrics (PreviewServer)
+        self.metrics = self.detector.metrics
+        self.metrics.register_gauge("upload_queue_depth", self.upload_queue.queue.qsize)
+        self.metrics.register_gauge("upload_queue_dropped", lambda: self.upload_queue.dropped)
+        self.metrics.register_gauge("stream_frames", lambda: sum(s.frames for s in self.streams))
+        self.metrics.register_gauge("stream_skipped", lambda: sum(s.skipped for s in self.streams))
+        self.metrics.register_gauge("infer_queue_depth", self.pipeline.infer_queue.qsize)
+        self.metrics.register_gauge("publish_queue_depth", self.pipeline.publish_queue.qsize)
+        self.metrics.register_gauge("mqtt_outbox_depth", lambda: len(self.mqtt.outbox))
+        self.metrics.register_gauge("tta_rate", lambda: self.detector.tta_rate)
+        self.metrics.register_gauge("incremental_rate", lambda: self.detector.incremental_rate)
+        self.metrics.register_gauge("traps", lambda: len(self.detector.traps))
+        if self.config.METRICS_DUMP_PATH:
+            self.metrics.start_dump(self.config.METRICS_DUMP_PATH, self.config.METRICS_DUMP_INTERVAL)
+        self.profiler = None
+        if self.config.PROFILE:
+            self.profiler = SamplingProfiler(self.config.PROFILE_INTERVAL).start()
+            logger.info(f"🔬 Sampling profiler on, output: {self.config.PROFILE_PATH}")
+        
+        self.store = None
+        if self.config.STORE_PATH:
+            self.store = DetectionStore(
+                self.config.STORE_PATH,
+                self.config.STORE_BATCH_SIZE,
+                self.config.STORE_FLUSH_INTERVAL
+            )
+        
+        # Output terakhir per trap, untuk render on-demand (dibuang saat trap di-evict)
+        self.latest_outputs = {}
+        self.detector.traps.on_evict.append(lambda device_id: self.latest_outputs.pop(device_id, None))
+        self.preview_server = PreviewServer(self, self.config.PREVIEW_HOST, self.config.PREVIEW_PORT)
+        
+        self.model_watcher = None
+        if self.config.MODEL_WATCH:
+            self.model_watcher = ModelWatcher(
+                self.config.MODEL_PATH, self.config.MODEL_WATCH_INTERVAL, self.detector.reload_model
+            ).start()
         
         # Setup windows
-        cv2.namedWindow("Deteksi Wereng", cv2.WINDOW_NORMAL)
-        cv2.resizeWindow("Deteksi Wereng", self.config.WINDOW_WIDTH, self.config.WINDOW_HEIGHT)
-        cv2.namedWindow("Grafik Triple Filter", cv2.WINDOW_NORMAL)
-        cv2.resizeWindow("Grafik Triple Filter", self.config.GRAPH_WIDTH, self.config.GRAPH_HEIGHT)
+        if not self.config.HEADLESS:
+            cv2.namedWindow("Deteksi Wereng", cv2.WINDOW_NORMAL)
+            cv2.resizeWindow("Deteksi Wereng", self.config.WINDOW_WIDTH, self.config.WINDOW_HEIGHT)
+            cv2.namedWindow("Grafik Triple Filter", cv2.WINDOW_NORMAL)
+            cv2.resizeWindow("Grafik Triple Filter", self.config.GRAPH_WIDTH, self.config.GRAPH_HEIGHT)
         
         logger.info("✅ Enhanced Detection System Ready")
         logger.info(f"   Confidence: {self.config.CONFIDENCE_THRESHOLD}")
         logger.info(f"   Image size: {self.config.IMG_SIZE}")
         logger.info(f"   Augmentation: {self.config.AUGMENT}")
+        logger.info(f"   Headless: {self.config.HEADLESS}")
     
-    def get_latest_images(self):
-        upload_path = Path(self.config.UPLOAD_DIR)
-        if not upload_path.exists():
-            return []
+    def process_frame(self, source, name=None, device_id=None):
+        return self.process_batch([(source, name, device_id)])[0]
+    
+    def process_batch(self, frames):
+        """Proses beberapa frame (source, name, device_id) secara sinkron dengan satu batch inference"""
+        self._log_frames(frames)
         
-        images = []
-        for ext in ['*.jpg', '*.jpeg', '*.png', '*.JPG', '*.JPEG', '*.PNG']:
-            images.extend(upload_path.glob(ext))
+        batch_start = time.perf_counter()
         
-        images = sorted(images, key=lambda x: x.stat().st_mtime)
-        return [str(img) for img in images]
-    
-    def process_frame(self, image_path):
-        logger.info(f"🖼️  Processing: {Path(image_path).name}")
+        # Detect dengan preprocessing (frame duplikat diambil dari cache)
+        lookups = [self.detector.lookup_cache(source, device_id) for source, _, device_id in frames]
+        results = self.detect_misses(
+            frames, lookups, lambda i: self.detector.prepare_image(lookups[i][0])
+        )
         
-        # Detect dengan preprocessing
-        result = self.detector.detect(image_path)
+        duplicates = [cached is not None for _, _, cached in lookups]
+        outputs = self.count_batch(frames, results, duplicates)
+        latency = (time.perf_counter() - batch_start) * 1000
+        for _ in frames:
+            self.metrics.observe("frame_latency", latency)
+        for output in outputs:
+            if output is not None:
+                self.publish_output(output)
+                if not self.config.HEADLESS:
+                    self.show_output(output)
+        return [output["filtered"] if output else None for output in outputs]
+    
+    def _log_frames(self, frames):
+        for source, name, device_id in frames:
+            device_id = device_id or self.config.DEFAULT_DEVICE
+            logger.info(f"🖼️  Processing [{device_id}]: {name or Path(str(source)).name}")
+    
+    def detect_misses(self, frames, lookups, preprocessed):
+        """Inference hanya untuk frame yang tidak ada di cache; preprocessed(i) -> gambar frame i"""
+        results = [cached for _, _, cached in lookups]
+        misses = [i for i, result in enumerate(results) if result is None]
+        if not misses:
+            return results
+        
+        device_ids = [frames[i][2] or self.config.DEFAULT_DEVICE for i in misses]
+        fresh = self.detector.detect_preprocessed([preprocessed(i) for i in misses], device_ids)
+        for i, device_id, result in zip(misses, device_ids, fresh):
+            results[i] = result
+            self.detector.store_cache(lookups[i][1], device_id, result)
+        return results
+    
+    def count_batch(self, frames, results, duplicates=None):
+        """Stage count: filter per trap (harus berurutan per device)"""
+        duplicates = duplicates or [False] * len(frames)
+        return [
+            self._count_result(result, device_id or self.config.DEFAULT_DEVICE, duplicate)
+            for (_, _, device_id), result, duplicate in zip(frames, results, duplicates)
+        ]
+    
+    def _count_result(self, result, device_id, duplicate=False):
         if result is None:
             return None
-        
-        boxes = result.boxes.xyxy.cpu().numpy() if result.boxes is not None else []
-        confidences = result.boxes.conf.cpu().numpy() if result.boxes is not None else []
+        state = self.detector.traps.get(device_id)
+        if duplicate and state.detection_history:
+            output = self._build_duplicate_output(result, device_id, state)
+        else:
+            output = self._build_output(result, device_id)
+        self.metrics.frame()
+        self.latest_outputs[device_id] = output
+        self.latest_outputs[None] = output
+        return output
+    
+    def _build_output(self, result, device_id):
+        data = boxes_array(result)
+        boxes, confidences = data[:, :4], data[:, 4]
         
         raw_count = len(boxes)
         
-        # Get intermediate filtered values untuk visualisasi
-        temporal_filtered = self.detector.temporal.update(raw_count)
-        filtered_count = self.detector.get_filtered_count(raw_count)
+        # Filter per trap; nilai temporal disimpan untuk visualisasi
+        with self.metrics.timer("filter"):
+            filtered_count = self.detector.get_filtered_count(raw_count, device_id)
+        state = self.detector.traps.get(device_id)
+        temporal_filtered = state.last_temporal
         
         # Store data
-        self.frame_index += 1
-        self.x_data.append(self.frame_index)
-        self.raw_data.append(raw_count)
-        self.temporal_data.append(temporal_filtered)
-        self.filtered_data.append(filtered_count)
+        state.frame_index += 1
+        state.series["raw"].append(raw_count)
+        state.series["temporal"].append(temporal_filtered)
+        state.series["filtered"].append(filtered_count)
         
         avg_conf = np.mean(confidences) if len(confidences) > 0 else 0
-        logger.info(f"   Raw: {raw_count} | Temporal: {temporal_filtered:.1f} | Final: {filtered_count} | Avg Conf: {avg_conf:.2f}")
-        
-        # Publish
-        if self.mqtt.publish(self.config.TOPIC, filtered_count):
-            logger.info(f"   📡 Published: {filtered_count}")
-        
+        tracks = None
+        if state.tracker is not None:
+            with self.metrics.timer("track"):
+                tracks = state.tracker.update(boxes)
+        track_info = f" | Tracks: {tracks[0]} (+{tracks[1]})" if tracks else ""
+        logger.info(f"   [{device_id}] Raw: {raw_count} | Temporal: {temporal_filtered:.1f} | Final: {filtered_count} | Avg Conf: {avg_conf:.2f}{track_info}")
+        
+        if self.store is not None:
+            self.store.add(device_id, raw_count, temporal_filtered, filtered_count, confidences, boxes)
+        
+        return {
+            "device_id": device_id,
+            "result": result,
+            "raw": raw_count,
+            "filtered": filtered_count,
+            "avg_conf": avg_conf,
+            # (total di trap, baru sejak frame sebelumnya) dari tracker
+            "tracks": tracks,
+            # Snapshot buffer grafik: display berjalan di thread lain
+            "graph": state.graph_snapshot(),
+        }
+    
+    def _build_duplicate_output(self, result, device_id, state):
+        """Frame sama dengan sebelumnya: count terakhir dipakai lagi, filter tidak dimajukan"""
+        raw_count = len(result.boxes) if result.boxes is not None else 0
+        filtered_count = state.detection_history[-1]
+        confidences = boxes_array(result)[:, 4]
+        avg_conf = np.mean(confidences) if len(confidences) > 0 else 0
+        logger.info(f"   [{device_id}] ♻️  Duplicate frame (cached): Raw: {raw_count} | Final: {filtered_count} (filters unchanged)")
+        
+        return {
+            "device_id": device_id,
+            "result": result,
+            "raw": raw_count,
+            "filtered": filtered_count,
+            "avg_conf": avg_conf,
+            # Frame sama: tidak ada serangga baru
+            "tracks": (state.tracker.total, 0) if state.tracker is not None else None,
+            "duplicate": True,
+            "graph": state.graph_snapshot(),
+        }
+    
+    def publish_output(self, output):
+        device_id, count = output["device_id"], output["filtered"]
+        with self.metrics.timer("publish"):
+            published = self._publish_count(device_id, count, output.get("tracks"))
+        if published:
+            logger.info(f"   📡 Queued for MQTT [{device_id}]: {count}")
+    
+    def _publish_count(self, device_id, count, tracks=None):
+        # Topic integer hanya perlu nilai terbaru; riwayat lengkap lewat batch JSON
+        published = self.mqtt.publish(self.config.DEVICE_TOPIC.format(device=device_id), count, coalesce=True)
+        # Trap default tetap ke /pest agar ESP32 lama tetap menerima count
+        if device_id == self.config.DEFAULT_DEVICE:
+            published = self.mqtt.publish(self.config.TOPIC, count, coalesce=True) and published
+        if tracks is not None:
+            total, new = tracks
+            published = self.mqtt.publish(self.config.TRACK_TOTAL_TOPIC.format(device=device_id), total,
+                                          coalesce=True) and published
+            # Kedatangan baru adalah event, tidak di-coalesce
+            if new:
+                published = self.mqtt.publish(self.config.TRACK_NEW_TOPIC.format(device=device_id), new) and published
+        self.mqtt.add_count(device_id, count, tracks=tracks)
+        return published
+    
+    def show_output(self, output):
+        cv2.imshow("Deteksi Wereng", self.render_frame(output))
+        cv2.imshow("Grafik Triple Filter", self.render_graph(output))
+    
+    def render_frame(self, output):
         # Visualize
-        frame = result.plot()
-        frame = self._add_info_overlay(frame, raw_count, filtered_count, avg_conf)
-        frame = cv2.resize(frame, (self.config.WINDOW_WIDTH, self.config.WINDOW_HEIGHT))
-        cv2.imshow("Deteksi Wereng", frame)
-        
+        with self.metrics.timer("render_frame"):
+            frame = output["result"].plot()
+            frame = self._add_info_overlay(frame, output["raw"], output["filtered"],
+                                           output["avg_conf"], output["device_id"], output.get("tracks"))
+            return cv2.resize(frame, (self.config.WINDOW_WIDTH, self.config.WINDOW_HEIGHT))
+    
+    def render_graph(self, output):
         # Graph
-        graph = self.graph_renderer.render(
-            self.x_data, self.raw_data, self.filtered_data, self.temporal_data
-        )
-        cv2.imshow("Grafik Triple Filter", graph)
-        
-        return filtered_count
+        with self.metrics.timer("render_graph"):
+            return self.graph_renderer.render(output["graph"])
+    
+    def save_preview(self, output):
+        os.makedirs(self.config.PREVIEW_DIR, exist_ok=True)
+        device_id = output["device_id"]
+        cv2.imwrite(os.path.join(self.config.PREVIEW_DIR, f"{device_id}_frame.jpg"), self.render_frame(output))
+        cv2.imwrite(os.path.join(self.config.PREVIEW_DIR, f"{device_id}_graph.jpg"), self.render_graph(output))
     
-    def _add_info_overlay(self, frame, raw_count, filtered_count, avg_conf):
+    def _add_info_overlay(self, frame, raw_count, filtered_count, avg_conf, device_id, tracks=None):
         overlay = frame.copy()
-        cv2.rectangle(overlay, (10, 10), (450, 150), (0, 0, 0), -1)
+        cv2.rectangle(overlay, (10, 10), (450, 230 if tracks else 190), (0, 0, 0), -1)
         frame = cv2.addWeighted(overlay, 0.7, frame, 0.3, 0)
         
         cv2.putText(frame, f"Raw: {raw_count}", (20, 45),
@@ -513,44 +3171,95 @@ class WerengDetectionSystem:
                    cv2.FONT_HERSHEY_DUPLEX, 0.9, (50, 255, 50), 2)
         cv2.putText(frame, f"Confidence: {avg_conf:.2f}", (20, 125),
                    cv2.FONT_HERSHEY_DUPLEX, 0.8, (255, 200, 0), 2)
+        cv2.putText(frame, f"Trap: {device_id}", (20, 165),
+                   cv2.FONT_HERSHEY_DUPLEX, 0.8, (255, 255, 255), 2)
+        if tracks:
+            cv2.putText(frame, f"Tracked: {tracks[0]} (+{tracks[1]} new)", (20, 205),
+                       cv2.FONT_HERSHEY_DUPLEX, 0.8, (255, 100, 255), 2)
         
         return frame
     
     def run(self):
-        image_index = 0
+        logger.info("⏳ Waiting for images...")
         
-        while True:
-            images = self.get_latest_images()
-            
-            if not images:
-                logger.warning("⏳ Waiting for images...")
-                time.sleep(2)
-                continue
-            
-            current_image = images[image_index % len(images)]
-            image_index += 1
-            
-            try:
-                self.process_frame(current_image)
-            except Exception as e:
-                logger.error(f"Error: {e}", exc_info=True)
-            
-            key = cv2.waitKey(self.config.DISPLAY_DELAY)
-            if key & 0xFF == ord('q'):
-                logger.info("🛑 Exiting...")
-                break
-            
-            time.sleep(self.config.FRAME_DELAY)
+        # Counting berjalan di pipeline; thread utama hanya untuk GUI
+        self.pipeline.start()
+        for stream in self.streams:
+            stream.start()
         
-        cv2.destroyAllWindows()
+        if self.config.HEADLESS:
+            self._run_headless()
+            return
+        
+        try:
+            while True:
+                output = self.pipeline.get_display(timeout=self.config.DISPLAY_DELAY / 1000)
+                if output is not None:
+                    try:
+                        self.show_output(output)
+                    except Exception as e:
+                        logger.error(f"Display error: {e}", exc_info=True)
+                
+                key = cv2.waitKey(1)
+                if key & 0xFF == ord('q'):
+                    logger.info("🛑 Exiting...")
+                    break
+        finally:
+            self.shutdown()
+            cv2.destroyAllWindows()
+    
+    def shutdown(self):
+        """Hentikan pipeline lalu tulis sisa riwayat ke store dan outbox MQTT"""
+        for stream in self.streams:
+            stream.stop()
+        if self.model_watcher is not None:
+            self.model_watcher.stop()
+        self.pipeline.stop()
+        if self.store is not None:
+            self.store.close()
+        self.mqtt.close()
+        if self.profiler is not None:
+            self.profiler.stop().dump(self.config.PROFILE_PATH)
+            logger.info(f"🔬 Profile saved: {self.config.PROFILE_PATH}")
+    
+    def _run_headless(self):
+        """Tanpa GUI: hanya render preview tiap RENDER_EVERY_N frame (jika diaktifkan)"""
+        frames = 0
+        try:
+            while True:
+                output = self.pipeline.get_display(timeout=1.0)
+                if output is None:
+                    continue
+                frames += 1
+                if self.config.RENDER_EVERY_N and frames % self.config.RENDER_EVERY_N == 0:
+                    try:
+                        self.save_preview(output)
+                    except Exception as e:
+                        logger.error(f"Preview error: {e}", exc_info=True)
+        finally:
+            self.shutdown()
 
 # ==========================
 # ENTRY POINT
 # ==========================
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PHEROTRAP wereng detection")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Hanya jalankan inference daemon (model tetap di memory)")
+    parser.add_argument("--stream", action="append", default=[], metavar="DEVICE=URL",
+                        help="Baca MJPEG langsung dari trap (boleh diulang)")
+    args = parser.parse_args()
+    for spec in args.stream:
+        device_id, _, url = spec.partition("=")
+        if not url:
+            parser.error(f"--stream harus DEVICE=URL: {spec}")
+        Config.STREAM_URLS = {**Config.STREAM_URLS, device_id: url}
     try:
-        system = WerengDetectionSystem()
-        system.run()
+        if args.daemon:
+            InferenceDaemon(Config.MODEL_PATH, Config()).serve()
+        else:
+            system = WerengDetectionSystem()
+            system.run()
     except KeyboardInterrupt:
         logger.info("\n🛑 Stopped by user")
     except Exception as e:
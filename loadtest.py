@@ -0,0 +1,110 @@
+"""Load test /upload dengan banyak ESP32-CAM tiruan yang mengirim bersamaan.
+
+Tanpa --url, server.py dijalankan lokal (folder upload sementara, detector tidak
+perlu aktif) sehingga hanya jalur ingest yang diukur.
+
+Contoh:
+    python loadtest.py --clients 300 --requests 5
+    python loadtest.py --url http://127.0.0.1:5000 --clients 200
+"""
+import argparse
+import http.client
+import logging
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import numpy as np
+
+
+def fake_jpeg(size_kb):
+    """Payload seukuran frame HD ESP32-CAM (isi acak, tidak perlu JPEG valid)"""
+    return b"\xff\xd8" + np.random.bytes(size_kb * 1024) + b"\xff\xd9"
+
+
+def start_local_server():
+    """Jalankan server.py di thread, folder upload sementara, port bebas"""
+    import server
+    from werkzeug.serving import make_server
+
+    folder = tempfile.mkdtemp(prefix="uploads_")
+    server.UPLOAD_FOLDER = folder
+    server.retention = server.RetentionIndex(folder, server.MAX_FILES)
+    server.notify_detector = lambda *args, **kwargs: None
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    try:
+        from waitress.server import create_server
+        httpd = create_server(server.app, host="127.0.0.1", port=0, threads=server.SERVER_THREADS,
+                              connection_limit=server.SERVER_CONNECTION_LIMIT)
+        port = httpd.effective_port
+        thread = threading.Thread(target=httpd.run, daemon=True)
+        name = "waitress"
+    except ImportError:
+        httpd = make_server("127.0.0.1", 0, server.app, threaded=True)
+        port = httpd.server_port
+        httpd.socket.listen(1024)
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        name = "flask-threaded"
+    thread.start()
+    print(f"[*] Server lokal ({name}) di port {port}, folder {folder}")
+    return f"http://127.0.0.1:{port}", folder
+
+
+def client(url, device, payload, requests):
+    parsed = urlparse(url)
+    latencies, errors = [], 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=30)
+            conn.request("POST", "/upload", body=payload,
+                         headers={"Content-Type": "image/jpeg", "X-Device-ID": device})
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            if response.status != 200:
+                errors += 1
+                continue
+        except OSError:
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="Server yang sudah berjalan (default: jalankan lokal)")
+    parser.add_argument("--clients", type=int, default=300, help="Upload bersamaan")
+    parser.add_argument("--requests", type=int, default=5, help="Upload per client")
+    parser.add_argument("--size-kb", type=int, default=150)
+    args = parser.parse_args()
+
+    url = args.url
+    if url is None:
+        url, _ = start_local_server()
+
+    payload = fake_jpeg(args.size_kb)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as pool:
+        futures = [pool.submit(client, url, f"trap-{i}", payload, args.requests)
+                   for i in range(args.clients)]
+        results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([l for lat, _ in results for l in lat])
+    errors = sum(err for _, err in results)
+    total = args.clients * args.requests
+    print(f"{args.clients} clients x {args.requests} uploads ({args.size_kb} KB): "
+          f"{len(latencies)}/{total} OK, {errors} errors, {elapsed:.1f}s")
+    if len(latencies):
+        print(f"throughput {len(latencies) / elapsed:.0f} uploads/s | "
+              f"p50 {np.percentile(latencies, 50):.0f}ms | p95 {np.percentile(latencies, 95):.0f}ms | "
+              f"p99 {np.percentile(latencies, 99):.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
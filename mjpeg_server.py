@@ -0,0 +1,69 @@
+"""Stand-in MJPEG trap: putar folder JPEG sebagai stream multipart/x-mixed-replace.
+
+Meniru endpoint GET /stream di Sketch/ESP32-CAM.ino sehingga mode stream kalyol.py
+bisa dicoba tanpa hardware.
+
+Contoh:
+    python mjpeg_server.py --folder YOLO/datasets/PHEROTRAP/valid/images --fps 5
+    python kalyol.py --stream trap-1=http://127.0.0.1:8081/stream
+"""
+import argparse
+import itertools
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+DATASET_DIR = Path(__file__).parent / "YOLO" / "datasets" / "PHEROTRAP" / "valid" / "images"
+BOUNDARY = "frame"
+
+
+def load_frames(folder):
+    frames = [p.read_bytes() for p in sorted(Path(folder).iterdir()) if p.suffix.lower() in {".jpg", ".jpeg"}]
+    if not frames:
+        raise SystemExit(f"Tidak ada JPEG di {folder}")
+    return frames
+
+
+def make_handler(frames, fps):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/stream":
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", f"multipart/x-mixed-replace;boundary={BOUNDARY}")
+            self.end_headers()
+            interval = 1 / fps
+            try:
+                for frame in itertools.cycle(frames):
+                    start = time.perf_counter()
+                    self.wfile.write(
+                        f"\r\n--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                        f"Content-Length: {len(frame)}\r\n\r\n".encode() + frame
+                    )
+                    time.sleep(max(0.0, interval - (time.perf_counter() - start)))
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--folder", default=DATASET_DIR)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--fps", type=float, default=5.0)
+    args = parser.parse_args()
+
+    frames = load_frames(args.folder)
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(frames, args.fps))
+    print(f"[*] {len(frames)} frame @ {args.fps} fps: http://{args.host}:{args.port}/stream")
+    httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""INT8 post-training quantization of the detector, calibrated on PHEROTRAP train images.
+
+Menghasilkan model yang bisa dimuat kalyol.py dengan MODEL_PRECISION = "int8":
+    best_int8_openvino_model/  (BACKEND = "openvino", kalibrasi NNCF via Ultralytics)
+    best_int8.onnx             (BACKEND = "onnx", static QDQ via ONNX Runtime)
+
+Lalu membandingkan mAP dan count error di split valid/test terhadap baseline FP32.
+
+Contoh:
+    python quantize_model.py --backend openvino onnx --output quantization_report.json
+"""
+import argparse
+import copy
+import json
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+from ultralytics import YOLO
+
+from benchmark import DATASET_DIR, load_split, run_mode
+from kalyol import Config, EnhancedDetectionManager, INT8_SUFFIXES, resolve_model_path
+
+
+@contextmanager
+def dataset_yaml(val_split):
+    """data.yaml sementara dengan path absolut; val diarahkan ke split tertentu (dihapus setelah dipakai)"""
+    with open(DATASET_DIR / "data.yaml") as f:
+        data = yaml.safe_load(f)
+    data.update({
+        "path": str(DATASET_DIR.resolve()),
+        "train": "train/images",
+        "val": f"{val_split}/images",
+        "test": "test/images",
+    })
+    data.pop("roboflow", None)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "data.yaml"
+        path.write_text(yaml.safe_dump(data))
+        yield str(path)
+
+
+def letterbox(img, size):
+    """Resize dengan rasio tetap + padding 114, sama seperti input Ultralytics"""
+    h, w = img.shape[:2]
+    scale = min(size / h, size / w)
+    nh, nw = int(round(h * scale)), int(round(w * scale))
+    resized = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    canvas[top:top + nh, left:left + nw] = resized
+    return canvas
+
+
+def calibration_images(detector, limit):
+    """Gambar train yang sudah melewati preprocessing deployment yang sama"""
+    images = sorted((DATASET_DIR / "train" / "images").iterdir())[:limit]
+    for image in images:
+        processed = detector.preprocess_image(str(image))
+        if processed is not None:
+            yield processed
+
+
+def quantize_openvino(model_path, config):
+    # Ultralytics memakai split "val" untuk kalibrasi, jadi arahkan ke train
+    with dataset_yaml("train") as calib_yaml:
+        return YOLO(model_path).export(
+            format="openvino", int8=True, data=calib_yaml,
+            imgsz=config.IMG_SIZE, dynamic=True,
+        )
+
+
+def quantize_onnx(model_path, config, detector, limit):
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    )
+
+    fp32_config = copy.copy(config)
+    fp32_config.BACKEND = "onnx"
+    fp32_config.MODEL_PRECISION = "fp32"
+    fp32_path = resolve_model_path(model_path, fp32_config)
+    int8_path = Path(model_path).with_name(Path(model_path).stem + INT8_SUFFIXES["onnx"])
+
+    class TrapCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            self.images = calibration_images(detector, limit)
+
+        def get_next(self):
+            img = next(self.images, None)
+            if img is None:
+                return None
+            img = letterbox(img, config.IMG_SIZE)[:, :, ::-1]  # BGR -> RGB
+            tensor = np.ascontiguousarray(img.transpose(2, 0, 1))[None].astype(np.float32) / 255
+            return {"images": tensor}
+
+    quantize_static(
+        fp32_path, str(int8_path), TrapCalibrationReader(),
+        quant_format=QuantFormat.QDQ, per_channel=True,
+        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+    )
+    return str(int8_path)
+
+
+def evaluate(model_path, config, splits):
+    """mAP (Ultralytics val) + latency dan count error (pipeline kalyol) per split"""
+    resolved = resolve_model_path(model_path, config)
+    model = YOLO(resolved, task="detect")
+    detector = EnhancedDetectionManager(model_path, config)
+
+    report = {"model": resolved}
+    for split in splits:
+        with dataset_yaml(split) as data_yaml:
+            metrics = model.val(
+                data=data_yaml, split="val", imgsz=config.IMG_SIZE,
+                batch=1, device="cpu", verbose=False, plots=False,
+            )
+        counts = run_mode(detector, load_split(split), {})
+        report[split] = {
+            "mAP50": float(metrics.box.map50),
+            "mAP50-95": float(metrics.box.map),
+            "count_mae": counts["count_mae"],
+            "count_bias": counts["count_bias"],
+            "latency_ms_p50": counts["latency_ms_p50"],
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=Config.MODEL_PATH)
+    parser.add_argument("--backend", nargs="+", default=["openvino"], choices=["openvino", "onnx"])
+    parser.add_argument("--calib-images", type=int, default=150)
+    parser.add_argument("--split", nargs="+", default=["valid", "test"])
+    parser.add_argument("--output", default="quantization_report.json")
+    args = parser.parse_args()
+
+    base = Config()
+    base.AUGMENT = False  # bandingkan model, bukan TTA
+    base.TILED = False
+    base.LOG_PREPROCESS_TIMING = False
+    detector = EnhancedDetectionManager(args.model, base)
+
+    for backend in args.backend:
+        config = copy.copy(base)
+        config.BACKEND = backend
+        if backend == "openvino":
+            path = quantize_openvino(args.model, config)
+        else:
+            path = quantize_onnx(args.model, config, detector, args.calib_images)
+        print(f"✅ INT8 model ({backend}): {path}")
+
+    results = {"pytorch-fp32": evaluate(args.model, base, args.split)}
+    for backend in args.backend:
+        for precision in ("fp32", "int8"):
+            config = copy.copy(base)
+            config.BACKEND = backend
+            config.MODEL_PRECISION = precision
+            results[f"{backend}-{precision}"] = evaluate(args.model, config, args.split)
+
+    print(f"\n{'variant':<16}" + "".join(f"{s + ' mAP50':>14}{s + ' MAE':>12}{s + ' p50ms':>13}" for s in args.split))
+    for name, report in results.items():
+        row = "".join(
+            f"{report[s]['mAP50']:>14.3f}{report[s]['count_mae']:>12.2f}{report[s]['latency_ms_p50']:>13.0f}"
+            for s in args.split
+        )
+        print(f"{name:<16}{row}")
+
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"\nSaved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -31,7 +31,7 @@ VENV_PY="./venv/bin/python"
 # 3) install dependency
 echo "[2/8] Menginstall dependency..."
 "$VENV_PY" -m pip install --upgrade pip >/dev/null
-"$VENV_PY" -m pip install flask requests >/dev/null
+"$VENV_PY" -m pip install flask waitress requests >/dev/null
 
 # 4) pastikan cloudflared ada
 command -v cloudflared >/dev/null 2>&1 || err "cloudflared tidak ditemukan di PATH."
@@ -15,8 +15,14 @@ else
     exit 1
 fi
 
-# 🔧 Fix untuk Qt di Wayland
-export QT_QPA_PLATFORM=xcb
+# 🖥️ PHEROTRAP_HEADLESS=1 ./run_kalyol.sh untuk server tanpa display
+if [ "${PHEROTRAP_HEADLESS:-0}" = "1" ]; then
+    echo "🔹 Mode headless (tanpa window OpenCV)"
+    export PHEROTRAP_HEADLESS
+else
+    # 🔧 Fix untuk Qt di Wayland
+    export QT_QPA_PLATFORM=xcb
+fi
 
 echo "🚀 Menjalankan $PYTHON_FILE..."
-python "$PYTHON_FILE"
+python "$PYTHON_FILE" "$@"
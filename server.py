@@ -1,5 +1,13 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import os
+import re
+import json
+import socket
+import threading
+from collections import deque
+import urllib.error
+import urllib.parse
+import urllib.request
 from datetime import datetime
 
 app = Flask(__name__)
@@ -7,50 +15,184 @@ app = Flask(__name__)
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-MAX_FILES = 1  # maksimal jumlah file di folder
+MAX_FILES = 8  # maksimal jumlah file di folder (beri waktu detector membaca antrian)
 
-def cleanup_old_files():
-    """Hapus file lama jika lebih dari MAX_FILES"""
-    files = [os.path.join(UPLOAD_FOLDER, f) for f in os.listdir(UPLOAD_FOLDER)]
-    files = [f for f in files if os.path.isfile(f)]
-    files.sort(key=os.path.getmtime, reverse=True)  # urut dari terbaru ke terlama
+# Batas upload: frame HD ESP32-CAM sekitar 100-300 KB
+MAX_UPLOAD_BYTES = 4 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
 
-    if len(files) > MAX_FILES:
-        for f in files[MAX_FILES:]:
+# Server produksi (waitress) jika terpasang; fallback ke Flask threaded
+SERVER_THREADS = 64
+SERVER_CONNECTION_LIMIT = 1000
+
+# Alamat antrian kalyol.py (lihat Config.QUEUE_HOST / QUEUE_PORT)
+DETECTOR_HOST = '127.0.0.1'
+DETECTOR_PORT = 5055
+
+# Preview on-demand dari kalyol.py (lihat Config.PREVIEW_HOST / PREVIEW_PORT)
+PREVIEW_URL = 'http://127.0.0.1:5060'
+
+class UploadTooLarge(Exception):
+    pass
+
+class RetentionIndex:
+    """Simpan MAX_FILES upload terbaru; index di memory, folder hanya di-scan sekali saat start"""
+    def __init__(self, folder, max_files):
+        self.max_files = max_files
+        self.lock = threading.Lock()
+        files = [os.path.join(folder, f) for f in os.listdir(folder)]
+        files = [f for f in files if os.path.isfile(f)]
+        files.sort(key=os.path.getmtime)  # urut dari terlama ke terbaru
+        self.files = deque(files)
+        self._evict()
+
+    def add(self, path):
+        with self.lock:
+            if path in self.files:  # nama sama ditimpa: pindahkan ke paling baru
+                self.files.remove(path)
+            self.files.append(path)
+            self._evict()
+
+    def _evict(self):
+        while len(self.files) > self.max_files:
+            f = self.files.popleft()
             try:
                 os.remove(f)
                 print(f"[*] Hapus file lama: {os.path.basename(f)}")
+            except FileNotFoundError:
+                pass
             except Exception as e:
                 print(f"[!] Gagal hapus {f}: {e}")
 
+retention = RetentionIndex(UPLOAD_FOLDER, MAX_FILES)
+
+def save_upload(stream, path):
+    """Baca body per chunk ke memory + file sementara, lalu rename atomik.
+
+    Batas ukuran juga berlaku untuk upload chunked tanpa Content-Length.
+    """
+    data = bytearray()
+    tmp = path + '.part'
+    try:
+        with open(tmp, 'wb') as f:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                data += chunk
+                if len(data) > MAX_UPLOAD_BYTES:
+                    raise UploadTooLarge()
+                f.write(chunk)
+        if not data:
+            os.remove(tmp)
+            return b''
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    retention.add(path)
+    return bytes(data)
+
+def upload_filename(prefix, name=None, stem="esp"):
+    if name:
+        return prefix + name
+    # Mikrodetik: upload bersamaan dari trap yang sama tidak saling menimpa
+    return prefix + datetime.now().strftime(f"{stem}_%Y%m%d_%H%M%S_%f.jpg")
+
+def get_device_id():
+    """Device ID trap dari header X-Device-ID, field form, atau query ?device="""
+    device = (request.headers.get('X-Device-ID')
+              or request.form.get('device')
+              or request.args.get('device'))
+    if not device:
+        return None
+    return re.sub(r'[^A-Za-z0-9_-]', '_', device)[:64]
+
+def notify_detector(path, data=None, device=None):
+    """Kirim frame baru ke antrian detector, tanpa menunggu hasil deteksi.
+
+    Jika data (bytes gambar) diberikan, isinya ikut dikirim sehingga detector
+    bisa decode langsung dari memory tanpa membaca ulang file.
+    """
+    header = {'path': os.path.abspath(path)}
+    if device:
+        header['device'] = device
+    if data:
+        header['size'] = len(data)
+    message = json.dumps(header).encode() + b'\n' + (data or b'')
+    try:
+        with socket.create_connection((DETECTOR_HOST, DETECTOR_PORT), timeout=0.5) as s:
+            s.sendall(message)
+    except OSError as e:
+        print(f"[!] Detector tidak aktif: {e}")
+
 @app.route('/')
 def index():
     return "Server aktif dan siap menerima gambar."
 
+@app.route('/preview/<kind>')
+def preview(kind):
+    """Frame beranotasi / grafik terbaru, dirender detector hanya saat diminta"""
+    if kind not in ('frame', 'graph'):
+        return jsonify({'error': 'Preview tidak dikenal'}), 404
+
+    url = f"{PREVIEW_URL}/{kind}.jpg"
+    if request.args.get('device'):
+        url += '?' + urllib.parse.urlencode({'device': request.args['device']})
+    try:
+        with urllib.request.urlopen(url, timeout=10) as r:
+            return Response(r.read(), mimetype='image/jpeg')
+    except urllib.error.HTTPError as e:
+        return jsonify({'error': 'Preview belum tersedia'}), e.code
+    except urllib.error.URLError:
+        return jsonify({'error': 'Detector tidak aktif'}), 503
+
+@app.errorhandler(413)
+def too_large(e):
+    return jsonify({'error': f'Upload melebihi {MAX_UPLOAD_BYTES} byte'}), 413
+
 @app.route('/upload', methods=['POST'])
 def upload_image():
-    # ---- Terima file dari form-data ----
-    if 'image' in request.files:
-        image = request.files['image']
-        filename = image.filename or datetime.now().strftime("esp_%Y%m%d_%H%M%S.jpg")
-        path = os.path.join(UPLOAD_FOLDER, filename)
-        image.save(path)
-        print(f"[+] Gambar disimpan: {path}")
-        cleanup_old_files()
-        return jsonify({'success': True, 'filename': filename})
-
-    # ---- Terima raw binary (image/jpeg langsung dari ESP32) ----
-    elif request.data:
-        filename = datetime.now().strftime("esp_raw_%Y%m%d_%H%M%S.jpg")
-        path = os.path.join(UPLOAD_FOLDER, filename)
-        with open(path, 'wb') as f:
-            f.write(request.data)
-        print(f"[+] Gambar disimpan: {path}")
-        cleanup_old_files()
-        return jsonify({'success': True, 'filename': filename})
-
-    else:
+    device = get_device_id()
+    prefix = f"{device}_" if device else ""
+
+    try:
+        # ---- Terima file dari form-data ----
+        if request.mimetype == 'multipart/form-data':
+            if 'image' not in request.files:
+                return jsonify({'error': 'Tidak ada data diterima'}), 400
+            image = request.files['image']
+            filename = upload_filename(prefix, os.path.basename(image.filename or ""))
+            path = os.path.join(UPLOAD_FOLDER, filename)
+            data = save_upload(image.stream, path)
+
+        # ---- Terima raw binary (image/jpeg langsung dari ESP32), dibaca per chunk ----
+        else:
+            filename = upload_filename(prefix, stem="esp_raw")
+            path = os.path.join(UPLOAD_FOLDER, filename)
+            data = save_upload(request.stream, path)
+    except UploadTooLarge:
+        return too_large(None)
+
+    if not data:
         return jsonify({'error': 'Tidak ada data diterima'}), 400
 
+    print(f"[+] Gambar disimpan: {path}")
+    notify_detector(path, data, device)
+    return jsonify({'success': True, 'filename': filename, 'device': device})
+
+def serve(host='0.0.0.0', port=5000):
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        print("[!] waitress tidak terpasang, memakai Flask threaded server")
+        app.run(host=host, port=port, threaded=True)
+        return
+    print(f"[*] waitress: {SERVER_THREADS} threads di port {port}")
+    waitress_serve(app, host=host, port=port, threads=SERVER_THREADS,
+                   connection_limit=SERVER_CONNECTION_LIMIT, max_request_body_size=MAX_UPLOAD_BYTES)
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+    serve()